@@ -46,11 +46,13 @@ query_provider_filters_opts = [
 query_checkpoint_filters_opts = [
     cfg.ListOpt(
         'query_checkpoint_filters',
-        default=['project_id', 'plan_id', 'start_date', 'end_date'],
+        default=['project_id', 'plan_id', 'start_date', 'end_date',
+                 'resource_id', 'resource_type', 'status'],
         help=(
             "Checkpoint filter options which non-admin user could use to "
             "query checkpoints. Default values are: ['project_id', "
-            "'plan_id', 'start_date', 'end_date']"
+            "'plan_id', 'start_date', 'end_date', 'resource_id', "
+            "'resource_type', 'status']"
         )
     ),
 ]
@@ -35,8 +35,11 @@ from karbor import context
 from karbor import db
 from karbor.db import migration as db_migration
 from karbor.db.sqlalchemy import api as db_api
+from karbor import exception
 from karbor.i18n import _
 from karbor import objects
+from karbor.services.protection import checkpoint
+from karbor.services.protection import provider
 from karbor import utils
 from karbor import version
 
@@ -149,7 +152,59 @@ class ServiceCommands(object):
                                   svc['updated_at']))
 
 
+class CheckpointCommands(object):
+    """Methods for managing the checkpoint records."""
+
+    @args('provider_id', nargs='?', default=None,
+          help='Reconcile only the checkpoints of this provider')
+    @args('--concurrency', type=int, default=16,
+          help='Number of checkpoints read from the bank in parallel '
+               '(default: %(default)s)')
+    def reconcile(self, provider_id=None, concurrency=16):
+        """Rebuild the checkpoint records and indices from the bank."""
+        if concurrency <= 0:
+            print(_("Must supply a positive, non-zero value for "
+                    "concurrency"))
+            sys.exit(1)
+        ctxt = context.get_admin_context()
+        registry = provider.ProviderRegistry()
+        if provider_id is None:
+            providers = list(registry.providers.values())
+        else:
+            try:
+                providers = [registry.show_provider(provider_id)]
+            except exception.ProviderNotFound:
+                print(_("Provider %s not found") % provider_id)
+                sys.exit(1)
+
+        for protection_provider in providers:
+            synced, removed = self._reconcile_provider(
+                ctxt, protection_provider, concurrency)
+            print(_("Provider %(provider)s: %(synced)d checkpoint records "
+                    "synced, %(removed)d removed") %
+                  {'provider': protection_provider.id, 'synced': synced,
+                   'removed': removed})
+
+    def _reconcile_provider(self, ctxt, protection_provider, concurrency):
+        collection = protection_provider.get_checkpoint_collection()
+        checkpoint_ids = collection.list_ids(protection_provider.id)
+        synced = len(collection.sync_records(ctxt, checkpoint_ids,
+                                             concurrency))
+
+        # Drop the records of the checkpoints which are not in the bank
+        indexed_ids = set(checkpoint_ids)
+        records = db.checkpoint_record_get_all_by_filters_sort(
+            ctxt, {'provider_id': protection_provider.id})
+        removed = 0
+        for record in records:
+            if record['checkpoint_id'] not in indexed_ids:
+                checkpoint.delete_checkpoint_record(ctxt, record['id'])
+                removed += 1
+        return synced, removed
+
+
 CATEGORIES = {
+    'checkpoint': CheckpointCommands,
     'config': ConfigCommands,
     'db': DbCommands,
     'service': ServiceCommands,
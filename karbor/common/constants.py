@@ -67,6 +67,10 @@ CHECKPOINT_STATUS_DELETING = 'deleting'
 CHECKPOINT_STATUS_DELETED = 'deleted'
 CHECKPOINT_STATUS_ERROR_DELETING = 'error-deleting'
 
+# The extra info key naming the creator of a checkpoint
+CHECKPOINT_CREATE_BY = 'create_by'
+OPERATION_ENGINE = 'operation-engine'
+
 # resource status
 RESOURCE_STATUS_ERROR = 'error'
 RESOURCE_STATUS_PROTECTING = 'protecting'
@@ -26,6 +26,7 @@ import karbor.services.operationengine.engine.triggers.timetrigger.time_trigger
 import karbor.services.operationengine.karbor_client
 import karbor.services.operationengine.manager
 import karbor.services.operationengine.operations.base as base
+import karbor.services.protection.checkpoint
 import karbor.services.protection.clients.cinder
 import karbor.services.protection.clients.glance
 import karbor.services.protection.clients.heat
@@ -34,7 +35,11 @@ import karbor.services.protection.clients.neutron
 import karbor.services.protection.clients.nova
 import karbor.services.protection.flows.restore
 import karbor.services.protection.flows.worker
+import karbor.services.protection.flows.workflow
 import karbor.services.protection.manager
+import karbor.services.protection.protectable_registry as protectable_registry  # noqa
+import karbor.services.protection.provider
+import karbor.services.protection.status_poller
 import karbor.services.protection.protection_plugins.image.image_protection_plugin as image_protection_plugin  # noqa
 import karbor.services.protection.protection_plugins.share.share_snapshot_plugin as share_snapshot_plugin  # noqa
 import karbor.services.protection.protection_plugins.volume.cinder_protection_plugin as cinder_protection_plugin  # noqa
@@ -89,9 +94,14 @@ _opts = [
         thread_pool_executor.executor_opts,
         time_trigger.time_trigger_opts,
         base.record_operation_log_executor_opts,
+        karbor.services.protection.checkpoint.checkpoint_opts,
         karbor.services.protection.flows.restore.sync_status_opts,
         karbor.services.protection.flows.worker.workflow_opts,
+        karbor.services.protection.flows.workflow.flow_persistence_opts,
         karbor.services.protection.manager.protection_manager_opts,
+        protectable_registry.protectable_registry_opts,
+        karbor.services.protection.provider.bank_cache_opts,
+        karbor.services.protection.status_poller.status_poller_opts,
         karbor.wsgi.eventlet_server.socket_opts,
         karbor.exception.exc_log_opts,
         karbor.service.service_opts)))]
@@ -584,6 +584,14 @@ def checkpoint_record_update(context, checkpoint_record_id, values):
     return IMPL.checkpoint_record_update(context, checkpoint_record_id, values)
 
 
+def checkpoint_record_create_or_update(context, values):
+    """Create the checkpoint record or update it if it already exists.
+
+    A destroyed record with the same id is brought back.
+    """
+    return IMPL.checkpoint_record_create_or_update(context, values)
+
+
 def checkpoint_record_destroy(context, checkpoint_record_id):
     """Destroy the checkpoint record or raise if it does not exist."""
     return IMPL.checkpoint_record_destroy(context, checkpoint_record_id)
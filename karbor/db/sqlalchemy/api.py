@@ -1352,6 +1352,24 @@ def checkpoint_record_update(context, checkpoint_record_id, values):
         return checkpoint_record_ref
 
 
+@require_context
+@_retry_on_deadlock
+def checkpoint_record_create_or_update(context, values):
+    session = get_session()
+    with session.begin():
+        checkpoint_record_ref = model_query(
+            context,
+            models.CheckpointRecord,
+            session=session,
+            read_deleted='yes').filter_by(id=values['id']).first()
+        if checkpoint_record_ref is None:
+            checkpoint_record_ref = models.CheckpointRecord()
+        checkpoint_record_ref.update(values)
+        checkpoint_record_ref.update({'deleted': False, 'deleted_at': None})
+        checkpoint_record_ref.save(session)
+        return checkpoint_record_ref
+
+
 @require_context
 @_retry_on_deadlock
 def checkpoint_record_destroy(context, checkpoint_record_id):
@@ -1380,6 +1398,15 @@ def _checkpoint_record_list_process_filters(query, filters):
         models.CheckpointRecord, query, filters,
         regex_match_filter_names)
 
+    # The date range is inclusive of both days
+    if filters.get('start_date'):
+        query = query.filter(
+            models.CheckpointRecord.created_at >= filters['start_date'])
+    if filters.get('end_date'):
+        query = query.filter(
+            models.CheckpointRecord.created_at <
+            filters['end_date'] + dt.timedelta(days=1))
+
     return query
 
 
@@ -0,0 +1,28 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+INDEXED_COLUMNS = ('provider_id', 'plan_id', 'checkpoint_status',
+                   'created_at')
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    checkpoint_records = Table('checkpoint_records', meta, autoload=True)
+    for column in INDEXED_COLUMNS:
+        index = Index('ix_checkpoint_records_%s' % column,
+                      checkpoint_records.c[column])
+        index.create(migrate_engine)
@@ -0,0 +1,26 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy.dialects import mysql
+from sqlalchemy import MetaData, Table
+
+
+def upgrade(migrate_engine):
+    # The extend info holds the resource graph of the checkpoint, which
+    # overflows the 64 KB of a MySQL TEXT column for large plans
+    if migrate_engine.name != 'mysql':
+        return
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    checkpoint_records = Table('checkpoint_records', meta, autoload=True)
+    checkpoint_records.c.extend_info.alter(type=mysql.MEDIUMTEXT())
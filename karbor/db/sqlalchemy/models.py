@@ -17,14 +17,19 @@ from oslo_config import cfg
 from oslo_db.sqlalchemy import models
 from oslo_utils import timeutils
 from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import DateTime, Boolean, ForeignKey
+from sqlalchemy import DateTime, Boolean, ForeignKey, Index
 from sqlalchemy import orm
 
 CONF = cfg.CONF
 BASE = declarative_base()
 
 
+def MediumText():
+    return Text().with_variant(mysql.MEDIUMTEXT(), 'mysql')
+
+
 class KarborBase(models.TimestampMixin,
                  models.ModelBase):
     """Base class for karbor Models."""
@@ -211,16 +216,20 @@ class CheckpointRecord(BASE, KarborBase):
     """Represents a checkpoint record."""
 
     __tablename__ = 'checkpoint_records'
+    __table_args__ = (Index('ix_checkpoint_records_created_at',
+                            'created_at'),
+                      KarborBase.__table_args__)
 
     id = Column(String(36), primary_key=True, nullable=False)
     project_id = Column(String(36), nullable=False)
     checkpoint_id = Column(String(36), nullable=False)
-    checkpoint_status = Column(String(36), nullable=False)
-    provider_id = Column(String(36), nullable=False)
-    plan_id = Column(String(36), nullable=False)
+    checkpoint_status = Column(String(36), index=True, nullable=False)
+    provider_id = Column(String(36), index=True, nullable=False)
+    plan_id = Column(String(36), index=True, nullable=False)
     operation_id = Column(String(36))
     create_by = Column(String(36))
-    extend_info = Column(Text)
+    # Holds the resource graph of the checkpoint, too large for a MySQL TEXT
+    extend_info = Column(MediumText())
 
 
 def register_models():
@@ -293,6 +293,11 @@ class CheckpointRecordNotFound(NotFound):
     message = _("CheckpointRecord %(id)s could not be found.")
 
 
+class CheckpointRecordUpdateFailed(KarborException):
+    message = _("Update of the record of checkpoint %(id)s failed: "
+                "%(reason)s")
+
+
 class CreateBackupFailed(KarborException):
     message = _("Create Backup failed: %(reason)s, id=%(resource_id)s,"
                 " type=%(resource_type)s")
@@ -393,6 +398,12 @@ class CheckpointNotBeDeleted(KarborException):
     message = _("The checkpoint %(checkpoint_id)s can not be deleted.")
 
 
+class OperationRejected(KarborException):
+    message = _("The %(operation)s operation is rejected, it is expected to "
+                "wait %(wait)s seconds to start, more than %(timeout)s.")
+    code = http_client.SERVICE_UNAVAILABLE
+
+
 class GetProtectionNetworkSubResourceFailed(KarborException):
     message = _("Get protection network sub-resources of type %(type)s failed:"
                 " %(reason)s")
@@ -89,6 +89,13 @@ class Manager(base.Base, PeriodicTasks):
         """
         pass
 
+    def reset(self):
+        """Hook called on SIGHUP to reload the configuration.
+
+        Child classes should override this method.
+        """
+        pass
+
     def init_host_with_rpc(self):
         """A hook for service to do jobs after RPC is ready.
 
@@ -233,6 +233,10 @@ class Service(service.Service):
         self.timers = []
         super(Service, self).stop()
 
+    def reset(self):
+        self.manager.reset()
+        super(Service, self).reset()
+
     def wait(self):
         for x in self.timers:
             try:
@@ -52,8 +52,13 @@ class ProtectOperation(base.Operation):
         client = self._create_karbor_client(
             param.get("user_id"), param.get("project_id"))
         try:
-            client.checkpoints.create(operation_definition.get("provider_id"),
-                                      operation_definition.get("plan_id"))
+            client.checkpoints.create(
+                operation_definition.get("provider_id"),
+                operation_definition.get("plan_id"),
+                checkpoint_extra_info={
+                    constants.CHECKPOINT_CREATE_BY:
+                        constants.OPERATION_ENGINE,
+                    'scheduled_operation_id': param.get("operation_id")})
         except Exception:
             state = constants.OPERATION_EXE_STATE_FAILED
         else:
@@ -11,12 +11,22 @@
 #    under the License.
 
 import abc
+import collections
+import contextlib
+import copy
+import hashlib
+import io
 import os
 import re
 import six
+import time
+
+from eventlet import greenpool
+from eventlet import greenthread
 
 from karbor import exception
 from karbor.i18n import _
+from karbor.services.protection import governor
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -36,6 +46,15 @@ class LeasePlugin(object):
 
 @six.add_metaclass(abc.ABCMeta)
 class BankPlugin(object):
+    """Storage backend of a bank
+
+    The methods of a plugin are called concurrently by several green
+    threads, e.g. by the batch operations and the image chunk uploads, so
+    they must not share a connection between concurrent requests.
+    """
+    # Number of requests the default batch operations run in parallel
+    batch_concurrency = 8
+
     def __init__(self, config=None):
         super(BankPlugin, self).__init__()
         self._config = config
@@ -61,6 +80,82 @@ class BankPlugin(object):
     def get_owner_id(self):
         return
 
+    def open_object_reader(self, key):
+        """Return a binary file-like object reading the object data
+
+        Plugins should override this to stream the object instead of
+        loading it to memory. The caller must close the returned reader.
+        """
+        data = self.get_object(key)
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        return io.BytesIO(data)
+
+    def write_object_stream(self, key, iterable):
+        """Write the data chunks of iterable as the object data
+
+        Plugins should override this to stream the chunks to the storage
+        instead of joining them in memory.
+        """
+        return self.update_object(key, b''.join(iterable))
+
+    def _run_batch(self, func, items):
+        pool = greenpool.GreenPool(self.batch_concurrency)
+        return list(pool.imap(func, items))
+
+    def get_objects(self, keys):
+        """Get several objects
+
+        Plugins should override this with a native batch operation if the
+        storage has one, the default runs get_object in parallel.
+
+        :return: A dict of the object values by key
+        """
+        keys = list(keys)
+        return dict(zip(keys, self._run_batch(self.get_object, keys)))
+
+    def update_objects(self, objects):
+        """Update several objects from a dict of values by key
+
+        Plugins should override this with a native batch operation if the
+        storage has one, the default runs update_object in parallel.
+        """
+        self._run_batch(lambda item: self.update_object(*item),
+                        list(objects.items()))
+
+    def delete_objects(self, keys):
+        """Delete several objects
+
+        Plugins should override this with a native batch operation if the
+        storage has one, the default runs delete_object in parallel.
+        """
+        self._run_batch(self.delete_object, list(keys))
+
+
+class IterableReader(io.RawIOBase):
+    """Binary file-like object reading from an iterable of data chunks"""
+    def __init__(self, iterable, close_func=None):
+        super(IterableReader, self).__init__()
+        self._iterator = iter(iterable)
+        self._close_func = close_func
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            self._buffer = next(self._iterator, b'')
+        count = min(len(b), len(self._buffer))
+        b[:count] = self._buffer[:count]
+        self._buffer = self._buffer[count:]
+        return count
+
+    def close(self):
+        if not self.closed and self._close_func is not None:
+            self._close_func()
+        super(IterableReader, self).close()
+
 
 def validate_key(key):
     pass
@@ -70,13 +165,80 @@ def validate_dir(key):
     pass
 
 
+class MetadataCache(object):
+    """Bounded LRU cache of bank objects, with expiring entries
+
+    Entries expire ttl seconds after they were read from the bank, which
+    bounds how stale they get when other services update the bank. Values
+    are copied in and out, so callers can't alter the cached values.
+    """
+    def __init__(self, max_size, ttl):
+        super(MetadataCache, self).__init__()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self._max_size > 0 and self._ttl > 0
+
+    def get(self, key):
+        """Return (True, value) on a hit, and (False, None) on a miss"""
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return False, None
+        # Re-insert the entry as the most recently used
+        self._entries[key] = entry
+        self.hits += 1
+        return True, copy.deepcopy(entry[1])
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.time() + self._ttl, copy.deepcopy(value))
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+        }
+
+
+# The key of the limiter of the writes to a bank, in the scope of the
+# provider of the bank
+BANK_PUT_LIMITER_KEY = 'bank.put'
+
+
 class Bank(object):
     _KEY_VALIDATION = re.compile('^[A-Za-z0-9/_.\-@]+(?<!/)$')
     _KEY_DOT_VALIDATION = re.compile('/\.{1,2}(/|$)')
 
-    def __init__(self, plugin):
+    def __init__(self, plugin, cache=None, limits_scope=None):
+        """Bank wrapping a bank plugin
+
+        :param cache: Optional MetadataCache of the deserialized JSON objects
+                      read from the bank. It is invalidated by the changes
+                      made through this bank only.
+        :param limits_scope: Optional scope, like the provider id, of the
+                             limiter of the writes to the bank
+        """
         super(Bank, self).__init__()
         self._plugin = plugin
+        self._cache = cache
+        self._limits_scope = limits_scope
 
     def _normalize_key(self, key):
         """Normalizes the key
@@ -114,13 +276,117 @@ class Bank(object):
                 err=_('Invalid parameter: must not contain "." or ".." parts')
             )
 
+    def _cache_get(self, key):
+        if self._cache is None:
+            return False, None
+        return self._cache.get(key)
+
+    def _cache_put(self, key, value):
+        # Only cache the deserialized JSON objects, not object data
+        if self._cache is not None and isinstance(value, (dict, list)):
+            self._cache.put(key, value)
+
+    def _cache_invalidate(self, key):
+        if self._cache is not None:
+            self._cache.invalidate(key)
+
+    def get_cache_stats(self):
+        if self._cache is None:
+            return None
+        return self._cache.get_stats()
+
+    @contextlib.contextmanager
+    def _limit_put(self):
+        limiter = None
+        if self._limits_scope is not None:
+            limiter = governor.get_governor().get_limiter(
+                self._limits_scope, BANK_PUT_LIMITER_KEY)
+        if limiter is None:
+            yield
+        else:
+            with limiter:
+                yield
+
     def update_object(self, key, value):
         self._validate_key(key)
-        return self._plugin.update_object(self._normalize_key(key), value)
+        key = self._normalize_key(key)
+        try:
+            with self._limit_put():
+                return self._plugin.update_object(key, value)
+        finally:
+            self._cache_invalidate(key)
+
+    def get_object(self, key, cached=True):
+        """Get an object, from the cache unless cached is False
+
+        An object read before updating it is read with cached False, as
+        another service may have updated it since it was cached.
+        """
+        self._validate_key(key)
+        key = self._normalize_key(key)
+        if cached:
+            hit, value = self._cache_get(key)
+            if hit:
+                return value
+        value = self._plugin.get_object(key)
+        self._cache_put(key, value)
+        return value
+
+    def open_object_reader(self, key):
+        self._validate_key(key)
+        return self._plugin.open_object_reader(self._normalize_key(key))
 
-    def get_object(self, key):
+    def write_object_stream(self, key, iterable):
         self._validate_key(key)
-        return self._plugin.get_object(self._normalize_key(key))
+        key = self._normalize_key(key)
+        try:
+            with self._limit_put():
+                return self._plugin.write_object_stream(key, iterable)
+        finally:
+            self._cache_invalidate(key)
+
+    def get_objects(self, keys, cached=True):
+        normalized_keys = {}
+        for key in keys:
+            self._validate_key(key)
+            normalized_keys[self._normalize_key(key)] = key
+        result = {}
+        missed_keys = []
+        for key in normalized_keys:
+            hit, value = self._cache_get(key) if cached else (False, None)
+            if hit:
+                result[normalized_keys[key]] = value
+            else:
+                missed_keys.append(key)
+        if missed_keys:
+            objects = self._plugin.get_objects(missed_keys)
+            for key, value in objects.items():
+                self._cache_put(key, value)
+                result[normalized_keys[key]] = value
+        return result
+
+    def update_objects(self, objects):
+        for key in objects:
+            self._validate_key(key)
+        objects = {self._normalize_key(key): value
+                   for key, value in objects.items()}
+        try:
+            with self._limit_put():
+                return self._plugin.update_objects(objects)
+        finally:
+            for key in objects:
+                self._cache_invalidate(key)
+
+    def delete_objects(self, keys):
+        keys = list(keys)
+        for key in keys:
+            self._validate_key(key)
+        keys = [self._normalize_key(key) for key in keys]
+        try:
+            return self._plugin.delete_objects(keys)
+        finally:
+            for key in keys:
+                self._cache_invalidate(key)
 
     def list_objects(self, prefix=None, limit=None, marker=None,
                      sort_dir=None):
@@ -138,11 +404,18 @@ class Bank(object):
 
     def delete_object(self, key):
         self._validate_key(key)
-        return self._plugin.delete_object(self._normalize_key(key))
+        key = self._normalize_key(key)
+        try:
+            return self._plugin.delete_object(key)
+        finally:
+            self._cache_invalidate(key)
 
     def get_sub_section(self, section, is_writable=True):
         return BankSection(self, section, is_writable)
 
+    def get_chunk_store(self):
+        return ChunkStore(self)
+
     @property
     def is_writeable(self):
         return True
@@ -224,11 +497,40 @@ class BankSection(object):
             value,
         )
 
-    def get_object(self, key):
+    def get_object(self, key, cached=True):
         return self._bank.get_object(
             self._prepend_prefix(key),
+            cached=cached,
         )
 
+    def open_object_reader(self, key):
+        return self._bank.open_object_reader(
+            self._prepend_prefix(key),
+        )
+
+    def write_object_stream(self, key, iterable):
+        self._validate_writable()
+        return self._bank.write_object_stream(
+            self._prepend_prefix(key),
+            iterable,
+        )
+
+    def get_objects(self, keys, cached=True):
+        full_keys = {self._prepend_prefix(key): key for key in keys}
+        objects = self._bank.get_objects(list(full_keys), cached=cached)
+        return {full_keys[key]: value for key, value in objects.items()}
+
+    def update_objects(self, objects):
+        self._validate_writable()
+        return self._bank.update_objects(
+            {self._prepend_prefix(key): value
+             for key, value in objects.items()})
+
+    def delete_objects(self, keys):
+        self._validate_writable()
+        return self._bank.delete_objects(
+            [self._prepend_prefix(key) for key in keys])
+
     def list_objects(self, prefix=None, limit=None, marker=None,
                      sort_dir=None):
         if not prefix:
@@ -258,6 +560,151 @@ class BankSection(object):
     def get_owner_id(self):
         return self._bank.get_owner_id()
 
+    def get_chunk_store(self):
+        self._validate_writable()
+        return self._bank.get_chunk_store()
+
     @property
     def bank(self):
         return self._bank
+
+
+class ChunkStore(object):
+    """Content addressed, deduplicating store of data chunks
+
+    Chunks are stored once per bank, under the SHA-256 hash of their content,
+    and shared between all the sections referencing them. Every referrer
+    (e.g. the image of a checkpoint) holds a reference object on the chunk,
+    so a chunk is only uploaded if no one stored it before, and is only
+    deleted once its last reference is released.
+
+    A release about to delete a chunk first writes a release object,
+    expiring after release_lease seconds, then counts the references again.
+    A put finding a release of its chunk waits for it to finish before
+    checking whether the chunk must be uploaded again.
+
+    Layout:
+        /chunks/<hash>/data
+        /chunks/<hash>/refs/<ref_id>
+        /chunks/<hash>/releases/<ref_id>
+    """
+    _SECTION = "/chunks"
+    release_lease = 60
+    release_poll_interval = 1
+    list_concurrency = 8
+
+    def __init__(self, bank):
+        super(ChunkStore, self).__init__()
+        self._bank = bank
+        self._section = bank.get_sub_section(self._SECTION)
+
+    @staticmethod
+    def hash_chunk(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def _list_chunk_objects(self, prefix):
+        # Use the bank directly, plugins differ on whether listed keys are
+        # full keys or names relative to the listed directory.
+        return list(self._bank.list_objects(
+            prefix="%s/%s" % (self._SECTION, prefix)))
+
+    def _list_chunk(self, chunk_hash):
+        """Whether a chunk has data, and the ids of its refs and releases"""
+        has_data = False
+        refs = []
+        releases = []
+        for key in self._list_chunk_objects("%s/" % chunk_hash):
+            parts = key.rsplit("/", 2)
+            if parts[-1] == "data":
+                has_data = True
+            elif parts[-2] == "refs":
+                refs.append(parts[-1])
+            elif parts[-2] == "releases":
+                releases.append(parts[-1])
+        return has_data, refs, releases
+
+    def _list_unreferenced(self, chunk_hashes):
+        """The chunks with no reference, listed in parallel"""
+        pool = greenpool.GreenPool(self.list_concurrency)
+        listed = pool.imap(self._list_chunk, chunk_hashes)
+        return [chunk_hash for chunk_hash, (_data, refs, _releases)
+                in zip(chunk_hashes, listed) if not refs]
+
+    def _has_pending_release(self, chunk_hash, releases):
+        """Whether a release of the chunk may still delete it
+
+        The releases left behind by a failed release expire and are
+        deleted here.
+        """
+        pending = False
+        for ref_id in releases:
+            key = "%s/releases/%s" % (chunk_hash, ref_id)
+            try:
+                release = self._section.get_object(key, cached=False)
+            except exception.BankGetObjectFailed:
+                continue
+            if release["expires_at"] > time.time():
+                pending = True
+            else:
+                self._section.delete_object(key)
+        return pending
+
+    def has_chunk(self, chunk_hash):
+        return self._list_chunk(chunk_hash)[0]
+
+    def count_references(self, chunk_hash):
+        return len(self._list_chunk(chunk_hash)[1])
+
+    def put_chunk(self, ref_id, data):
+        """Store data and add a reference from ref_id to it
+
+        :return: The hash of the chunk, used to get or release it
+        """
+        chunk_hash = self.hash_chunk(data)
+        # Add the reference before checking the chunk, so that a release
+        # counting the references after it doesn't delete the chunk
+        self._section.update_object("%s/refs/%s" % (chunk_hash, ref_id),
+                                    ref_id)
+        has_data, _refs, releases = self._list_chunk(chunk_hash)
+        # A release which counted the references before may be deleting
+        # the chunk, wait for it to check whether the chunk is still there
+        while releases and self._has_pending_release(chunk_hash, releases):
+            greenthread.sleep(self.release_poll_interval)
+            has_data, _refs, releases = self._list_chunk(chunk_hash)
+        if not has_data:
+            self._section.update_object("%s/data" % chunk_hash, data)
+        return chunk_hash
+
+    def get_chunk(self, chunk_hash):
+        return self._section.get_object("%s/data" % chunk_hash)
+
+    def release_chunk(self, ref_id, chunk_hash):
+        """Remove the reference of ref_id and delete unreferenced chunks"""
+        self.release_chunks(ref_id, [chunk_hash])
+
+    def release_chunks(self, ref_id, chunk_hashes):
+        """Remove the references of ref_id to several chunks at once
+
+        The references of the chunks are listed in parallel, and the
+        objects of the chunks written and deleted in batches.
+        """
+        chunk_hashes = list(chunk_hashes)
+        self._section.delete_objects(
+            ["%s/refs/%s" % (chunk_hash, ref_id)
+             for chunk_hash in chunk_hashes])
+        unreferenced = self._list_unreferenced(chunk_hashes)
+        if not unreferenced:
+            return
+        expires_at = time.time() + self.release_lease
+        releases = ["%s/releases/%s" % (chunk_hash, ref_id)
+                    for chunk_hash in unreferenced]
+        self._section.update_objects({key: {"expires_at": expires_at}
+                                      for key in releases})
+        try:
+            # The puts which added a reference since are counted now, the
+            # later ones wait for the releases to be deleted
+            unreferenced = self._list_unreferenced(unreferenced)
+            self._section.delete_objects(
+                ["%s/data" % chunk_hash for chunk_hash in unreferenced])
+        finally:
+            self._section.delete_objects(releases)
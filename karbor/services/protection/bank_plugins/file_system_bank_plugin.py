@@ -33,6 +33,12 @@ file_system_bank_plugin_opts = [
 
 LOG = logging.getLogger(__name__)
 
+# Objects which aren't JSON serialized metadata have a marker, holding the
+# kind of their data, at the same path in the markers directory
+OBJECT_MARKERS_SUFFIX = "_markers"
+OBJECT_KIND_TEXT = "text"
+OBJECT_KIND_BYTES = "bytes"
+
 
 class FileSystemBankPlugin(BankPlugin):
     """File system bank plugin"""
@@ -49,6 +55,9 @@ class FileSystemBankPlugin(BankPlugin):
             self.object_container_path = "/".join([self.file_system_bank_path,
                                                    self.bank_object_container])
             self._create_dir(self.object_container_path)
+            self.object_markers_path = (self.object_container_path +
+                                        OBJECT_MARKERS_SUFFIX)
+            self._create_dir(self.object_markers_path)
         except OSError as err:
             LOG.exception(_("Init file system bank failed. err: %s"), err)
 
@@ -89,27 +98,76 @@ class FileSystemBankPlugin(BankPlugin):
             LOG.exception(_("Write object failed. name: %s"), obj_file_name)
             raise
 
+    def _write_object_stream(self, path, iterable):
+        obj_file_name = None
+        try:
+            obj_path = self.object_container_path + path.rsplit('/', 1)[0]
+            obj_file_name = self.object_container_path + path
+            self._create_dir(obj_path)
+            with open(obj_file_name, mode="wb") as obj_file:
+                for data in iterable:
+                    obj_file.write(data)
+        except (OSError, IOError):
+            LOG.exception(_("Write object failed. name: %s"), obj_file_name)
+            raise
+
+    def _write_object_marker(self, path, kind):
+        marker_file_name = self.object_markers_path + path
+        try:
+            if kind is None:
+                if os.path.isfile(marker_file_name):
+                    self._delete_file(self.object_markers_path, path)
+                return
+            self._create_dir(self.object_markers_path + path.rsplit('/', 1)[0])
+            with open(marker_file_name, mode="w") as marker_file:
+                marker_file.write(kind)
+        except (OSError, IOError):
+            LOG.exception(_("Write object marker failed. name: %s"),
+                          marker_file_name)
+            raise
+
+    def _get_object_kind(self, path):
+        marker_file_name = self.object_markers_path + path
+        if not os.path.isfile(marker_file_name):
+            return None
+        with open(marker_file_name, mode="r") as marker_file:
+            return marker_file.read()
+
+    def _open_object(self, path):
+        obj_file_name = self.object_container_path + path
+        if not os.path.isfile(obj_file_name):
+            LOG.exception(_("Object is not a file. name: %s"), obj_file_name)
+            raise OSError("Object is not a file")
+        try:
+            return open(obj_file_name, mode='rb')
+        except (OSError, IOError):
+            LOG.exception(_("Open object failed. name: %s"), obj_file_name)
+            raise
+
     def _get_object(self, path):
         obj_file_name = self.object_container_path + path
         if not os.path.isfile(obj_file_name):
             LOG.exception(_("Object is not a file. name: %s"), obj_file_name)
             raise OSError("Object is not a file")
         try:
-            with open(obj_file_name, mode='r') as obj_file:
+            with open(obj_file_name, mode='rb') as obj_file:
                 data = obj_file.read()
                 return data
-        except OSError:
+        except (OSError, IOError):
             LOG.exception(_("Get object failed. name: %s"), obj_file_name)
             raise
 
+    def _delete_file(self, base_path, path):
+        obj_path = base_path + path.rsplit('/', 1)[0]
+        os.remove(base_path + path)
+        if not os.listdir(obj_path) and obj_path != base_path:
+            os.rmdir(obj_path)
+
     def _delete_object(self, path):
-        obj_path = self.object_container_path + path.rsplit('/', 1)[0]
         obj_file_name = self.object_container_path + path
         try:
-            os.remove(obj_file_name)
-            if not os.listdir(obj_path) and (
-                    obj_path != self.object_container_path):
-                os.rmdir(obj_path)
+            self._delete_file(self.object_container_path, path)
+            self._write_object_marker(path, None)
         except OSError:
             LOG.exception(_("Delete the object failed. name: %s"),
                           obj_file_name)
@@ -142,15 +200,42 @@ class FileSystemBankPlugin(BankPlugin):
         LOG.debug("FsBank: update_object. key: %s", key)
         self._validate_path(key)
         try:
-            if not isinstance(value, str):
+            if isinstance(value, six.text_type):
+                kind = OBJECT_KIND_TEXT
+            elif isinstance(value, six.binary_type):
+                kind = OBJECT_KIND_BYTES
+            else:
                 value = jsonutils.dumps(value)
+                kind = None
             self._write_object(path=key,
                                data=value)
-        except OSError as err:
+            self._write_object_marker(key, kind)
+        except (OSError, IOError) as err:
             LOG.error("Update object failed. err: %s", err)
             raise exception.BankUpdateObjectFailed(reason=err,
                                                    key=key)
 
+    def write_object_stream(self, key, iterable):
+        LOG.debug("FsBank: write_object_stream. key: %s", key)
+        self._validate_path(key)
+        try:
+            self._write_object_stream(path=key, iterable=iterable)
+            self._write_object_marker(key, OBJECT_KIND_BYTES)
+        except (OSError, IOError) as err:
+            LOG.error("Write object stream failed. err: %s", err)
+            raise exception.BankUpdateObjectFailed(reason=err,
+                                                   key=key)
+
+    def open_object_reader(self, key):
+        LOG.debug("FsBank: open_object_reader. key: %s", key)
+        self._validate_path(key)
+        try:
+            return self._open_object(path=key)
+        except (OSError, IOError) as err:
+            LOG.error("Open object failed. err: %s", err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+
     def delete_object(self, key):
         LOG.debug("FsBank: delete_object. key: %s", key)
         self._validate_path(key)
@@ -166,15 +251,21 @@ class FileSystemBankPlugin(BankPlugin):
         self._validate_path(key)
         try:
             data = self._get_object(path=key)
-        except OSError as err:
+            kind = self._get_object_kind(path=key)
+        except (OSError, IOError) as err:
             LOG.error("Get object failed. err: %s", err)
             raise exception.BankGetObjectFailed(reason=err,
                                                 key=key)
-        if isinstance(data, six.string_types):
-            try:
-                data = jsonutils.loads(data)
-            except ValueError:
-                pass
+        if kind == OBJECT_KIND_BYTES:
+            return data
+        data = data.decode('utf-8')
+        if kind == OBJECT_KIND_TEXT:
+            return data
+        # Objects written before the markers existed may hold plain text
+        try:
+            data = jsonutils.loads(data)
+        except ValueError:
+            pass
         return data
 
     def list_objects(self, prefix=None, limit=None, marker=None,
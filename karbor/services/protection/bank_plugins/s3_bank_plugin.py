@@ -10,14 +10,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import logging as log
 import math
 import time
 
 from botocore.exceptions import ClientError
+from eventlet import greenpool
 from karbor import exception
 from karbor.i18n import _
 from karbor.services.protection.bank_plugin import BankPlugin
+from karbor.services.protection.bank_plugin import IterableReader
 from karbor.services.protection.bank_plugin import LeasePlugin
 from karbor.services.protection import client_factory
 from oslo_config import cfg
@@ -25,6 +28,7 @@ from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_service import loopingcall
 from oslo_utils import uuidutils
+import six
 
 s3_bank_plugin_opts = [
     cfg.StrOpt('bank_s3_object_bucket',
@@ -33,8 +37,26 @@ s3_bank_plugin_opts = [
     cfg.StrOpt('bank_s3_lease_bucket',
                default='lease',
                help='The default s3 lease bucket to use.'),
+    cfg.IntOpt('bank_s3_multipart_part_size',
+               default=8 * 1024 * 1024,
+               min=5 * 1024 * 1024,
+               help='The size in bytes of the parts of multipart uploads, '
+                    'and of the ranges of ranged reads.'),
+    cfg.IntOpt('bank_s3_multipart_threshold',
+               default=16 * 1024 * 1024,
+               min=5 * 1024 * 1024,
+               help='Objects larger than this size in bytes are uploaded '
+                    'with a multipart upload.'),
+    cfg.IntOpt('bank_s3_max_concurrency',
+               default=4,
+               min=1,
+               help='The maximum number of parts uploaded, or ranges read, '
+                    'in parallel for a single object.'),
 ]
 
+# The maximum number of keys of an S3 DeleteObjects request
+S3_DELETE_OBJECTS_MAX_KEYS = 1000
+
 LOG = logging.getLogger(__name__)
 log.getLogger('botocore').setLevel(log.WARNING)
 
@@ -72,6 +94,9 @@ class S3BankPlugin(BankPlugin, LeasePlugin):
         self.owner_id = uuidutils.generate_uuid()
         self.lease_expire_time = 0
         self.bank_leases_bucket = plugin_cfg.bank_s3_lease_bucket
+        self.multipart_part_size = plugin_cfg.bank_s3_multipart_part_size
+        self.multipart_threshold = plugin_cfg.bank_s3_multipart_threshold
+        self.max_concurrency = plugin_cfg.bank_s3_max_concurrency
         self._connection = None
 
     def _setup_connection(self):
@@ -130,6 +155,26 @@ class S3BankPlugin(BankPlugin, LeasePlugin):
             LOG.error("update object failed, err: %s.", err)
             raise exception.BankUpdateObjectFailed(reason=err, key=key)
 
+    def write_object_stream(self, key, iterable):
+        try:
+            self._put_object_stream(bucket=self.bank_object_bucket,
+                                    obj=key,
+                                    iterable=iterable,
+                                    headers={
+                                        'x-object-meta-serialized': str(False)
+                                    })
+        except S3ConnectionFailed as err:
+            LOG.error("write object stream failed, err: %s.", err)
+            raise exception.BankUpdateObjectFailed(reason=err, key=key)
+
+    def open_object_reader(self, key):
+        try:
+            return self._get_object_stream(bucket=self.bank_object_bucket,
+                                           obj=key)
+        except S3ConnectionFailed as err:
+            LOG.error("open object reader failed, err: %s.", err)
+            raise exception.BankGetObjectFailed(reason=err, key=key)
+
     def delete_object(self, key):
         try:
             self._delete_object(bucket=self.bank_object_bucket,
@@ -138,6 +183,15 @@ class S3BankPlugin(BankPlugin, LeasePlugin):
             LOG.error("delete object failed, err: %s.", err)
             raise exception.BankDeleteObjectFailed(reason=err, key=key)
 
+    def delete_objects(self, keys):
+        try:
+            self._delete_objects(bucket=self.bank_object_bucket,
+                                 objs=list(keys))
+        except S3ConnectionFailed as err:
+            LOG.error("delete objects failed, err: %s.", err)
+            raise exception.BankDeleteObjectFailed(reason=err,
+                                                   key=err.kwargs.get('key'))
+
     def get_object(self, key):
         try:
             return self._get_object(bucket=self.bank_object_bucket,
@@ -191,6 +245,10 @@ class S3BankPlugin(BankPlugin, LeasePlugin):
             return False
 
     def _put_object(self, bucket, obj, contents, headers=None):
+        if len(contents) > self.multipart_threshold:
+            if isinstance(contents, six.text_type):
+                contents = contents.encode('utf-8')
+            return self._put_object_stream(bucket, obj, [contents], headers)
         try:
             self.connection.put_object(
                 Bucket=bucket,
@@ -203,15 +261,164 @@ class S3BankPlugin(BankPlugin, LeasePlugin):
 
     def _get_object(self, bucket, obj):
         try:
-            response = self.connection.get_object(Bucket=bucket, Key=obj)
-            body = response['Body'].read()
-            if response['Metadata']["x-object-meta-serialized"]\
-                    .lower() == "true":
+            metadata, stream = self._open_object(bucket, obj)
+            try:
+                body = stream.read()
+            finally:
+                stream.close()
+            if metadata["x-object-meta-serialized"].lower() == "true":
                 body = jsonutils.loads(body)
             return body
         except ClientError as err:
             raise S3ConnectionFailed(reason=err)
 
+    @staticmethod
+    def _is_invalid_range_error(err):
+        response = getattr(err, 'response', None)
+        if not isinstance(response, dict):
+            return False
+        return response.get('Error', {}).get('Code') == 'InvalidRange'
+
+    def _open_object(self, bucket, obj):
+        """Open an object for reading
+
+        The first part is read with a ranged GET. If the object is larger
+        than one part, the remaining ranges are read in parallel and the
+        returned body reassembles them, otherwise it is the streaming body of
+        the response.
+
+        :return: (metadata, body) where body is a binary file-like object
+        """
+        part_size = self.multipart_part_size
+        try:
+            response = self.connection.get_object(
+                Bucket=bucket,
+                Key=obj,
+                Range='bytes=0-%d' % (part_size - 1)
+            )
+        except ClientError as err:
+            # Empty objects can't satisfy any range
+            if not self._is_invalid_range_error(err):
+                raise
+            response = self.connection.get_object(Bucket=bucket, Key=obj)
+            return response['Metadata'], response['Body']
+
+        content_range = response.get('ContentRange')
+        if not content_range:
+            return response['Metadata'], response['Body']
+        size = int(content_range.rsplit('/', 1)[1])
+        if size <= part_size:
+            return response['Metadata'], response['Body']
+        ranges = self._iter_object_ranges(bucket, obj, response['Body'],
+                                          size)
+        return response['Metadata'], IterableReader(ranges, ranges.close)
+
+    def _get_object_range(self, bucket, obj, start, end):
+        response = self.connection.get_object(
+            Bucket=bucket,
+            Key=obj,
+            Range='bytes=%d-%d' % (start, end)
+        )
+        return response['Body'].read()
+
+    def _iter_object_ranges(self, bucket, obj, first_body, size):
+        part_size = self.multipart_part_size
+        pool = greenpool.GreenPool(self.max_concurrency)
+        starts = iter(six.moves.range(part_size, size, part_size))
+        pending = collections.deque()
+
+        def fill():
+            while len(pending) < self.max_concurrency:
+                start = next(starts, None)
+                if start is None:
+                    return
+                end = min(start + part_size, size) - 1
+                pending.append(pool.spawn(self._get_object_range,
+                                          bucket, obj, start, end))
+
+        try:
+            fill()
+            yield first_body.read()
+            while pending:
+                data = pending.popleft().wait()
+                fill()
+                yield data
+        except ClientError as err:
+            LOG.error("read object range failed, err: %s.", err)
+            raise exception.BankGetObjectFailed(reason=err, key=obj)
+        finally:
+            while pending:
+                pending.popleft().kill()
+
+    def _iter_parts(self, iterable):
+        part = bytearray()
+        for data in iterable:
+            part.extend(data)
+            while len(part) >= self.multipart_part_size:
+                yield bytes(part[:self.multipart_part_size])
+                del part[:self.multipart_part_size]
+        # A multipart upload has at least one part, which may be empty
+        yield bytes(part)
+
+    def _put_object_stream(self, bucket, obj, iterable, headers=None):
+        upload_id = None
+        try:
+            response = self.connection.create_multipart_upload(
+                Bucket=bucket,
+                Key=obj,
+                Metadata=headers
+            )
+            upload_id = response['UploadId']
+            # GreenPool.spawn blocks while max_concurrency parts are being
+            # uploaded, which bounds the memory held by the upload.
+            pool = greenpool.GreenPool(self.max_concurrency)
+            uploads = []
+            try:
+                for part_number, data in enumerate(
+                        self._iter_parts(iterable), 1):
+                    uploads.append((part_number, pool.spawn(
+                        self._upload_part, bucket, obj, upload_id,
+                        part_number, data)))
+            finally:
+                pool.waitall()
+            parts = [{'ETag': upload.wait(), 'PartNumber': part_number}
+                     for part_number, upload in uploads]
+            self.connection.complete_multipart_upload(
+                Bucket=bucket,
+                Key=obj,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except ClientError as err:
+            if upload_id is not None:
+                self._abort_multipart_upload(bucket, obj, upload_id)
+            raise S3ConnectionFailed(reason=err)
+
+    def _upload_part(self, bucket, obj, upload_id, part_number, data):
+        response = self.connection.upload_part(
+            Bucket=bucket,
+            Key=obj,
+            PartNumber=part_number,
+            UploadId=upload_id,
+            Body=data
+        )
+        return response['ETag']
+
+    def _abort_multipart_upload(self, bucket, obj, upload_id):
+        try:
+            self.connection.abort_multipart_upload(Bucket=bucket,
+                                                   Key=obj,
+                                                   UploadId=upload_id)
+        except ClientError as err:
+            LOG.warning("abort multipart upload failed, err: %s.", err)
+
+    def _get_object_stream(self, bucket, obj):
+        try:
+            _metadata, body = self._open_object(bucket, obj)
+            return body
+        except ClientError as err:
+            raise S3ConnectionFailed(reason=err)
+
     def _delete_object(self, bucket, obj):
         try:
             self.connection.delete_object(Bucket=bucket,
@@ -219,6 +426,25 @@ class S3BankPlugin(BankPlugin, LeasePlugin):
         except ClientError as err:
             raise S3ConnectionFailed(reason=err)
 
+    def _delete_objects(self, bucket, objs):
+        for i in range(0, len(objs), S3_DELETE_OBJECTS_MAX_KEYS):
+            batch = objs[i:i + S3_DELETE_OBJECTS_MAX_KEYS]
+            try:
+                response = self.connection.delete_objects(
+                    Bucket=bucket,
+                    Delete={
+                        'Objects': [{'Key': obj} for obj in batch],
+                        'Quiet': True
+                    }
+                )
+            except ClientError as err:
+                raise S3ConnectionFailed(reason=err, key=batch[0])
+            # Only the keys which failed are reported in quiet mode
+            errors = response.get('Errors')
+            if errors:
+                raise S3ConnectionFailed(reason=errors[0].get('Message'),
+                                         key=errors[0].get('Key'))
+
     def _get_bucket(self, bucket, prefix=None, limit=None,
                     marker=None):
         try:
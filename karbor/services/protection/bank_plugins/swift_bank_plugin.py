@@ -10,13 +10,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+from functools import partial
+import itertools
 import logging as log
 import math
+import os
 import time
 
+from eventlet import greenpool
+from eventlet import queue
 from karbor import exception
 from karbor.i18n import _
 from karbor.services.protection.bank_plugin import BankPlugin
+from karbor.services.protection.bank_plugin import IterableReader
 from karbor.services.protection.bank_plugin import LeasePlugin
 from karbor.services.protection import client_factory
 from oslo_config import cfg
@@ -24,6 +31,8 @@ from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_service import loopingcall
 from oslo_utils import uuidutils
+import six
+from six.moves.urllib import parse
 from swiftclient import ClientException
 
 
@@ -31,11 +40,39 @@ swift_bank_plugin_opts = [
     cfg.StrOpt('bank_swift_object_container',
                default='karbor',
                help='The default swift container to use.'),
+    cfg.IntOpt('bank_swift_read_chunk_size',
+               default=65536,
+               help='The size in bytes of the chunks read from swift when '
+                    'streaming an object.'),
+    cfg.StrOpt('bank_swift_segments_container',
+               default='karbor_segments',
+               help='The swift container holding the segments of large '
+                    'objects.'),
+    cfg.IntOpt('bank_swift_segment_size',
+               default=64 * 1024 * 1024,
+               min=1024 * 1024,
+               help='Objects larger than this size in bytes are stored as '
+                    'static large objects, in segments of this size.'),
+    cfg.IntOpt('bank_swift_max_concurrency',
+               default=4,
+               min=1,
+               help='The maximum number of segments uploaded in parallel '
+                    'for a single object, and of objects read or written '
+                    'in parallel by batch operations.'),
+    cfg.IntOpt('bank_swift_bulk_delete_size',
+               default=1000,
+               min=1,
+               help='The maximum number of objects deleted by a single '
+                    'bulk delete request.'),
 ]
 
 LOG = logging.getLogger(__name__)
 log.getLogger('swiftclient').setLevel(log.WARNING)
 
+# The markers of the large objects, in the segments container, are named
+# MANIFEST_MARKER_PREFIX/<container>/<object>
+MANIFEST_MARKER_PREFIX = "manifests"
+
 lease_opt = [cfg.IntOpt('lease_expire_window',
                         default=600,
                         help='expired_window for bank lease, in seconds'),
@@ -62,6 +99,13 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
                                    "swift_bank_plugin")
         plugin_cfg = self._config.swift_bank_plugin
         self.bank_object_container = plugin_cfg.bank_swift_object_container
+        self.read_chunk_size = plugin_cfg.bank_swift_read_chunk_size
+        self.bank_segments_container = \
+            plugin_cfg.bank_swift_segments_container
+        self.segment_size = plugin_cfg.bank_swift_segment_size
+        self.max_concurrency = plugin_cfg.bank_swift_max_concurrency
+        self.batch_concurrency = self.max_concurrency
+        self.bulk_delete_size = plugin_cfg.bank_swift_bulk_delete_size
         self.lease_expire_window = plugin_cfg.lease_expire_window
         self.lease_renew_window = plugin_cfg.lease_renew_window
         self.context = context
@@ -75,6 +119,7 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
         self.lease_expire_time = 0
         self.bank_leases_container = "leases"
         self._connection = None
+        self._connection_pool = queue.LightQueue()
 
     def _setup_connection(self):
         return client_factory.ClientFactory.create_client('swift',
@@ -89,6 +134,7 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
             try:
                 _connection.put_container(self.bank_object_container)
                 _connection.put_container(self.bank_leases_container)
+                _connection.put_container(self.bank_segments_container)
             except SwiftConnectionFailed as err:
                 LOG.error("bank plugin create container failed.")
                 raise exception.CreateContainerFailed(reason=err)
@@ -112,6 +158,9 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
         return self.owner_id
 
     def update_object(self, key, value):
+        self._update_object(key, value)
+
+    def _update_object(self, key, value, connection=None):
         serialized = False
         try:
             if not isinstance(value, str):
@@ -122,11 +171,43 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
                              contents=value,
                              headers={
                                  'x-object-meta-serialized': str(serialized)
-                             })
+                             },
+                             connection=connection)
         except SwiftConnectionFailed as err:
             LOG.error("update object failed, err: %s.", err)
             raise exception.BankUpdateObjectFailed(reason=err, key=key)
 
+    def write_object_stream(self, key, iterable):
+        try:
+            self._put_object_stream(container=self.bank_object_container,
+                                    obj=key,
+                                    iterable=iterable,
+                                    headers={
+                                        'x-object-meta-serialized': str(False)
+                                    })
+        except SwiftConnectionFailed as err:
+            LOG.error("write object stream failed, err: %s.", err)
+            raise exception.BankUpdateObjectFailed(reason=err, key=key)
+
+    def open_object_reader(self, key):
+        # The connection streams the object until the reader is closed
+        connection = self._acquire_connection()
+        try:
+            body = self._get_object_stream(
+                container=self.bank_object_container,
+                obj=key,
+                connection=connection)
+        except SwiftConnectionFailed as err:
+            self._connection_pool.put(connection)
+            LOG.error("open object reader failed, err: %s.", err)
+            raise exception.BankGetObjectFailed(reason=err, key=key)
+
+        def close():
+            if hasattr(body, 'close'):
+                body.close()
+            self._connection_pool.put(connection)
+        return IterableReader(body, close)
+
     def delete_object(self, key):
         try:
             self._delete_object(container=self.bank_object_container,
@@ -135,10 +216,36 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
             LOG.error("delete object failed, err: %s.", err)
             raise exception.BankDeleteObjectFailed(reason=err, key=key)
 
+    def delete_objects(self, keys):
+        try:
+            self._delete_objects(container=self.bank_object_container,
+                                 objs=list(keys))
+        except SwiftConnectionFailed as err:
+            LOG.error("delete objects failed, err: %s.", err)
+            raise exception.BankDeleteObjectFailed(reason=err,
+                                                   key=err.kwargs.get('key'))
+
+    def get_objects(self, keys):
+        def get(key):
+            with self._pooled_connection() as connection:
+                return self._get_bank_object(key, connection=connection)
+        keys = list(keys)
+        return dict(zip(keys, self._run_batch(get, keys)))
+
+    def update_objects(self, objects):
+        def update(item):
+            with self._pooled_connection() as connection:
+                self._update_object(*item, connection=connection)
+        self._run_batch(update, list(objects.items()))
+
     def get_object(self, key):
+        return self._get_bank_object(key)
+
+    def _get_bank_object(self, key, connection=None):
         try:
             return self._get_object(container=self.bank_object_container,
-                                    obj=key)
+                                    obj=key,
+                                    connection=connection)
         except SwiftConnectionFailed as err:
             LOG.error("get object failed, err: %s.", err)
             raise exception.BankGetObjectFailed(reason=err, key=key)
@@ -196,43 +303,262 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
         else:
             return False
 
-    def _put_object(self, container, obj, contents, headers=None):
+    def _put_object(self, container, obj, contents, headers=None,
+                    connection=None):
+        if len(contents) > self.segment_size:
+            if not isinstance(contents, six.binary_type):
+                contents = contents.encode('utf-8')
+            return self._put_object_stream(container, obj, [contents],
+                                           headers)
         try:
-            self.connection.put_object(container=container,
-                                       obj=obj,
-                                       contents=contents,
-                                       headers=headers)
+            with self._pooled_connection(connection) as connection:
+                connection.put_object(container=container,
+                                      obj=obj,
+                                      contents=contents,
+                                      headers=headers)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
-    def _get_object(self, container, obj):
+    def _iter_segments(self, iterable):
+        segment = bytearray()
+        for data in iterable:
+            segment.extend(data)
+            while len(segment) >= self.segment_size:
+                yield bytes(segment[:self.segment_size])
+                del segment[:self.segment_size]
+        if segment:
+            yield bytes(segment)
+
+    def _put_object_stream(self, container, obj, iterable, headers=None):
+        segments = self._iter_segments(iterable)
+        first_segment = next(segments, b'')
+        second_segment = next(segments, None)
+        if second_segment is None:
+            # Small enough to be stored as a plain object
+            return self._put_object(container, obj, first_segment, headers)
+        self._put_large_object(
+            container, obj,
+            itertools.chain([first_segment, second_segment], segments),
+            headers)
+
+    def _put_large_object(self, container, obj, segments, headers=None):
+        """Store an object as a Swift static large object
+
+        The segments are uploaded concurrently into the segments container,
+        then a manifest referencing them is stored as the object itself.
+        Swift streams the concatenated segments back when the object is read.
+        The segments of the large object overwritten, if any, are deleted
+        once the new manifest is stored. A marker object is written along
+        in the segments container, so that deleting objects in bulk only
+        looks up the segments of large objects.
+        """
+        prefix = "%s/%s/slo/%s" % (container, obj,
+                                   uuidutils.generate_uuid())
+        # GreenPool.spawn blocks while max_concurrency segments are being
+        # uploaded, which bounds the memory held by the upload.
+        pool = greenpool.GreenPool(self.max_concurrency)
+        uploads = []
+        try:
+            for index, data in enumerate(segments):
+                segment = "%s/%08d" % (prefix, index)
+                uploads.append((segment, len(data), pool.spawn(
+                    self._put_segment, segment, data)))
+        finally:
+            pool.waitall()
+        try:
+            manifest = [{'path': '/%s/%s' % (self.bank_segments_container,
+                                             segment),
+                         'etag': upload.wait(),
+                         'size_bytes': size}
+                        for segment, size, upload in uploads]
+            previous_segments = self._get_segments(container, obj)
+            with self._pooled_connection() as connection:
+                connection.put_object(
+                    container=self.bank_segments_container,
+                    obj=self._get_manifest_marker(container, obj),
+                    contents=b'')
+                connection.put_object(container=container,
+                                      obj=obj,
+                                      contents=jsonutils.dumps(manifest),
+                                      headers=headers,
+                                      query_string='multipart-manifest=put')
+        except (ClientException, SwiftConnectionFailed) as err:
+            self._delete_segments([segment for segment, _size, _upload
+                                   in uploads])
+            raise SwiftConnectionFailed(reason=err)
+        self._delete_segments(previous_segments)
+
+    @staticmethod
+    def _get_manifest_marker(container, obj):
+        return "%s/%s/%s" % (MANIFEST_MARKER_PREFIX, container, obj)
+
+    def _get_segments(self, container, obj):
+        """Return the segments of the large object stored at obj, if any"""
         try:
-            (_resp, body) = self.connection.get_object(container=container,
-                                                       obj=obj)
+            with self._pooled_connection() as connection:
+                (resp, body) = connection.get_object(
+                    container=container,
+                    obj=obj,
+                    query_string='multipart-manifest=get')
+        except ClientException as err:
+            if err.http_status == 404:
+                return []
+            raise SwiftConnectionFailed(reason=err)
+        if resp.get('x-static-large-object', '').lower() != 'true':
+            return []
+        prefix = '/%s/' % self.bank_segments_container
+        return [segment['name'][len(prefix):]
+                for segment in jsonutils.loads(body)
+                if segment['name'].startswith(prefix)]
+
+    def _delete_segments(self, segments):
+        with self._pooled_connection() as connection:
+            for segment in segments:
+                try:
+                    connection.delete_object(
+                        container=self.bank_segments_container,
+                        obj=segment)
+                except ClientException as err:
+                    LOG.warning("delete segment %(segment)s failed, "
+                                "err: %(err)s.",
+                                {'segment': segment, 'err': err})
+
+    @contextlib.contextmanager
+    def _pooled_connection(self, connection=None):
+        """Borrow a connection of the pool for the requests of the block
+
+        swiftclient connections can't be shared by concurrent requests, so
+        every request runs on a connection borrowed from the pool, unless
+        the caller already holds one.
+        """
+        if connection is not None:
+            yield connection
+            return
+        connection = self._acquire_connection()
+        try:
+            yield connection
+        finally:
+            self._connection_pool.put(connection)
+
+    def _acquire_connection(self):
+        # Make sure the containers exist before using other connections
+        self.connection
+        try:
+            return self._connection_pool.get_nowait()
+        except queue.Empty:
+            return self._setup_connection()
+
+    def _put_segment(self, segment, data):
+        with self._pooled_connection() as connection:
+            try:
+                return connection.put_object(
+                    container=self.bank_segments_container,
+                    obj=segment,
+                    contents=data)
+            except ClientException as err:
+                raise SwiftConnectionFailed(reason=err)
+
+    def _get_object(self, container, obj, connection=None):
+        try:
+            with self._pooled_connection(connection) as connection:
+                (_resp, body) = connection.get_object(
+                    container=container,
+                    obj=obj)
             if _resp.get("x-object-meta-serialized").lower() == "true":
                 body = jsonutils.loads(body)
             return body
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
+    def _get_object_stream(self, container, obj, connection):
+        try:
+            (_resp, body) = connection.get_object(
+                container=container,
+                obj=obj,
+                resp_chunk_size=self.read_chunk_size)
+            return body
+        except ClientException as err:
+            raise SwiftConnectionFailed(reason=err)
+
     def _post_object(self, container, obj, headers):
         try:
-            self.connection.post_object(container=container,
-                                        obj=obj,
-                                        headers=headers)
+            with self._pooled_connection() as connection:
+                connection.post_object(container=container,
+                                       obj=obj,
+                                       headers=headers)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
     def _delete_object(self, container, obj):
+        response = {}
         try:
-            self.connection.delete_object(container=container,
-                                          obj=obj)
+            with self._pooled_connection() as connection:
+                # Deletes the segments along with the manifest of large
+                # objects, plain objects are deleted as usual
+                connection.delete_object(
+                    container=container,
+                    obj=obj,
+                    query_string='multipart-manifest=delete',
+                    response_dict=response)
         except ClientException as err:
+            # The object is already gone
+            if err.http_status == 404:
+                return
             raise SwiftConnectionFailed(reason=err)
+        # Swift answers the deletion of a large object with the bulk delete
+        # report of its segments, and that of a plain object with no content
+        if response.get('status') == 200:
+            self._delete_segments([self._get_manifest_marker(container, obj)])
+
+    def _delete_objects(self, container, objs):
+        """Delete objects with the bulk delete middleware
+
+        The bulk delete middleware doesn't delete the segments of static
+        large objects. Those are found with a single listing of the markers
+        of the large objects under the common prefix of the objects, then
+        deleted one by one along with their segments.
+        """
+        if not objs:
+            return
+        markers = set(self._get_manifest_marker(container, obj)
+                      for obj in objs)
+        prefix = os.path.commonprefix(list(markers))
+        large_objs = set(
+            marker.get("name").split("/", 2)[2]
+            for marker in self._get_container(
+                container=self.bank_segments_container, prefix=prefix)
+            if marker.get("name") in markers)
+        objs = [obj for obj in objs if obj not in large_objs]
+        for i in range(0, len(objs), self.bulk_delete_size):
+            self._bulk_delete(container, objs[i:i + self.bulk_delete_size])
+        self._run_batch(partial(self._delete_object, container),
+                        list(large_objs))
+
+    def _bulk_delete(self, container, objs):
+        data = "\n".join(parse.quote("/%s/%s" % (container, obj))
+                         for obj in objs)
+        try:
+            with self._pooled_connection() as connection:
+                (_resp, body) = connection.post_account(
+                    headers={'Accept': 'application/json',
+                             'Content-Type': 'text/plain'},
+                    query_string='bulk-delete',
+                    data=data)
+        except ClientException as err:
+            raise SwiftConnectionFailed(reason=err, key=objs[0])
+        result = jsonutils.loads(body)
+        # Objects which are already gone are reported as not found
+        errors = result.get('Errors')
+        if errors:
+            path, status = errors[0]
+            raise SwiftConnectionFailed(
+                reason=result.get('Response Status', status),
+                key=parse.unquote(path).split('/', 2)[-1])
 
     def _put_container(self, container):
         try:
-            self.connection.put_container(container=container)
+            with self._pooled_connection() as connection:
+                connection.put_container(container=container)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
@@ -240,14 +566,15 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
                        end_marker=None):
         full_listing = True if limit is None else False
         try:
-            (_resp, body) = self.connection.get_container(
-                container=container,
-                prefix=prefix,
-                limit=limit,
-                marker=marker,
-                end_marker=end_marker,
-                full_listing=full_listing
-            )
+            with self._pooled_connection() as connection:
+                (_resp, body) = connection.get_container(
+                    container=container,
+                    prefix=prefix,
+                    limit=limit,
+                    marker=marker,
+                    end_marker=end_marker,
+                    full_listing=full_listing
+                )
             return body
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
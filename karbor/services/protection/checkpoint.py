@@ -10,22 +10,284 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import calendar
 from datetime import datetime
+from datetime import timedelta
+import re
+import time
+
+from eventlet import greenpool
 from karbor.common import constants
+from karbor import context
+from karbor import db
 from karbor import exception
 from karbor.i18n import _
 from karbor.services.protection import graph
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
+import six
+
+checkpoint_opts = [
+    cfg.BoolOpt('compact_resource_graph',
+                default=False,
+                help='Store the resource graph of new checkpoints in the '
+                     'compact encoding, which is smaller and faster to load '
+                     'for plans with many resources. Only enable it once '
+                     'all the protection services understand it.'),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(checkpoint_opts)
 
 LOG = logging.getLogger(__name__)
 
 _INDEX_FILE_NAME = "index.json"
 _UUID_STR_LEN = 36
+# The checkpoint summaries of a provider are stored in one segment object
+# per bucket of this many seconds of checkpoint creation time
+_SUMMARY_BUCKET_SECONDS = 24 * 60 * 60
+# The newest first indices use timestamps subtracted from this one, so that
+# their ascending listing order is the newest first order
+_MAX_TIMESTAMP = 9999999999
+# Marks that the newest first indices were built for older checkpoints
+_DESC_INDICES_READY_KEY = "/desc-indices-ready"
+# The characters of the resource types and ids escaped in the index keys,
+# like the colons of OS::Nova::Server which bank keys don't allow
+_UNSAFE_KEY_CHARS = re.compile(r'[^A-Za-z0-9_.\-]')
+
+
+def _invert_timestamp(timestamp):
+    return "%010d" % (_MAX_TIMESTAMP - int(timestamp))
+
+
+def _get_index_keys(provider_id, plan_id, created_at, timestamp,
+                    checkpoint_id):
+    """All the index keys of a checkpoint"""
+    inverted_timestamp = _invert_timestamp(timestamp)
+    return [
+        "/by-provider/%s/%s@%s" % (provider_id, timestamp, checkpoint_id),
+        "/by-date/%s/%s@%s" % (created_at, timestamp, checkpoint_id),
+        "/by-plan/%s/%s/%s@%s" % (plan_id, created_at, timestamp,
+                                  checkpoint_id),
+        "/by-provider-desc/%s/%s@%s" % (provider_id, inverted_timestamp,
+                                        checkpoint_id),
+        "/by-date-desc/%s@%s" % (inverted_timestamp, checkpoint_id),
+        "/by-plan-desc/%s/%s@%s" % (plan_id, inverted_timestamp,
+                                    checkpoint_id),
+    ]
+
+
+def _escape_key_part(value):
+    """Escape value as a bank key part, each unsafe byte as @<hex>"""
+    return _UNSAFE_KEY_CHARS.sub(
+        lambda match: "".join("@%02x" % byte for byte in
+                              bytearray(match.group().encode("utf-8"))),
+        value)
+
+
+def _get_resource_index_prefix(resource_type, resource_id):
+    return "/by-resource/%s/%s/" % (_escape_key_part(resource_type),
+                                    _escape_key_part(resource_id))
+
+
+def _get_resource_index_keys(resources, timestamp, checkpoint_id):
+    """The index keys of the (type, id) resources of a checkpoint"""
+    return ["%s%s@%s" % (_get_resource_index_prefix(resource_type,
+                                                    resource_id),
+                         timestamp, checkpoint_id)
+            for resource_type, resource_id in resources]
+
+
+def _get_graph_resources(serialized_resource_graph):
+    """The (type, id) of the resources of a serialized resource graph"""
+    if serialized_resource_graph is None:
+        return set()
+    return {(resource.type, resource.id) for resource in
+            graph.deserialize_resource_graph_resources(
+                serialized_resource_graph)}
+
+
+def _get_summary_segment_prefix(provider_id, timestamp):
+    return "/summary-segments/%s/%d/" % (provider_id,
+                                         timestamp // _SUMMARY_BUCKET_SECONDS)
+
+
+def _get_summary_segment_key(segment_prefix):
+    """The key of the summary segment of this host in a bucket"""
+    return segment_prefix + _escape_key_part(CONF.host)
+
+
+def _get_summary_segments(indices_section, segment_prefix):
+    """The summary segments of all the hosts in a bucket, by key
+
+    They are read uncached, as the other hosts update them.
+    """
+    segment_keys = indices_section.list_objects(prefix=segment_prefix)
+    try:
+        return indices_section.get_objects(segment_keys, cached=False)
+    except exception.BankGetObjectFailed:
+        # A segment was deleted since listed, get them one by one
+        segments = {}
+        for segment_key in segment_keys:
+            try:
+                segments[segment_key] = indices_section.get_object(
+                    segment_key, cached=False)
+            except exception.BankGetObjectFailed:
+                pass
+        return segments
+
+
+def _compact_summary_segment(indices_section, segment_prefix, segment_key,
+                             segment):
+    """Drop the entries of a segment the other segments make useless
+
+    A removed summary only needs to be kept while the segments of the other
+    hosts still have a summary of the checkpoint, and a summary which is
+    older than a removal in another segment is dropped.
+    """
+    summaries = {}
+    removals = {}
+    for key, other_segment in _get_summary_segments(
+            indices_section, segment_prefix).items():
+        if key == segment_key:
+            continue
+        for checkpoint_id, entry in other_segment.items():
+            entries = summaries if entry["summary"] is not None else removals
+            entries[checkpoint_id] = max(entries.get(checkpoint_id, 0),
+                                         entry["updated_at"])
+    for checkpoint_id, entry in list(segment.items()):
+        if entry["summary"] is None:
+            if checkpoint_id not in summaries:
+                del segment[checkpoint_id]
+        elif entry["updated_at"] < removals.get(checkpoint_id, 0):
+            del segment[checkpoint_id]
+
+
+def _update_summary_segment(indices_section, segment_prefix, summaries):
+    """Add or remove (when None) checkpoint summaries in a segment
+
+    Every host writes the summaries of a bucket to a segment of its own, so
+    that a segment is only read and written by the host holding its lock.
+    A removed summary is kept as None, so that it overrides the summaries
+    of the checkpoint in the segments of the other hosts, until those are
+    dropped when the segments are rewritten.
+
+    :param summaries: dict of checkpoint id to summary or None
+    """
+    segment_key = _get_summary_segment_key(segment_prefix)
+    with lockutils.lock("checkpoint-summary-%s" % segment_key):
+        try:
+            segment = indices_section.get_object(segment_key, cached=False)
+        except exception.BankGetObjectFailed:
+            segment = None
+        exists = segment is not None
+        segment = segment or {}
+        updated_at = time.time()
+        for checkpoint_id, summary in summaries.items():
+            segment[checkpoint_id] = {"updated_at": updated_at,
+                                      "summary": summary}
+        _compact_summary_segment(indices_section, segment_prefix,
+                                 segment_key, segment)
+        if segment:
+            indices_section.update_object(segment_key, segment)
+        elif exists:
+            indices_section.delete_object(segment_key)
+
+
+def _merge_summary_segments(segments):
+    """The latest summary of each checkpoint in the segments of a bucket"""
+    entries = {}
+    for segment in segments:
+        for checkpoint_id, entry in segment.items():
+            latest = entries.get(checkpoint_id)
+            if latest is None or entry["updated_at"] > latest["updated_at"]:
+                entries[checkpoint_id] = entry
+    return {checkpoint_id: entry["summary"]
+            for checkpoint_id, entry in entries.items()}
+
+
+def load_extra_info(extra_info):
+    """Return the extra info of a checkpoint as a dict
+
+    The API passes the extra info serialized as JSON.
+    """
+    if isinstance(extra_info, six.string_types):
+        try:
+            extra_info = jsonutils.loads(extra_info)
+        except ValueError:
+            return {}
+    if not isinstance(extra_info, dict):
+        return {}
+    return extra_info
+
+
+def _get_checkpoint_record_values(summary):
+    timestamp = summary.get("timestamp")
+    if timestamp is not None:
+        created_at = datetime.utcfromtimestamp(timestamp)
+    else:
+        created_at = datetime.strptime(summary["created_at"], "%Y-%m-%d")
+    protection_plan = summary["protection_plan"]
+    extend_info = {
+        "protection_plan": protection_plan,
+        "extra_info": summary["extra_info"],
+        "timestamp": timestamp
+    }
+    if "resource_graph" in summary:
+        extend_info["resource_graph"] = summary["resource_graph"]
+    create_by = load_extra_info(summary["extra_info"]).get(
+        constants.CHECKPOINT_CREATE_BY)
+    if not isinstance(create_by, six.string_types):
+        create_by = None
+    return {
+        "id": summary["id"],
+        "checkpoint_id": summary["id"],
+        "project_id": summary["project_id"],
+        "checkpoint_status": summary["status"],
+        "provider_id": protection_plan["provider_id"],
+        "plan_id": protection_plan["id"],
+        "created_at": created_at,
+        "create_by": create_by[:36] if create_by else None,
+        "extend_info": jsonutils.dumps(extend_info)
+    }
+
+
+def update_checkpoint_record(ctxt, summary):
+    """Create or update the database record of a checkpoint summary"""
+    return db.checkpoint_record_create_or_update(
+        ctxt, _get_checkpoint_record_values(summary))
+
+
+def delete_checkpoint_record(ctxt, checkpoint_id):
+    try:
+        db.checkpoint_record_destroy(ctxt, checkpoint_id)
+    except exception.CheckpointRecordNotFound:
+        pass
+
+
+def checkpoint_record_to_summary(record):
+    """The checkpoint summary, as listed from the bank, of a record
+
+    The summary has no resource_graph when the record was written before
+    the records held it.
+    """
+    extend_info = jsonutils.loads(record["extend_info"])
+    summary = {
+        "id": record["checkpoint_id"],
+        "status": record["checkpoint_status"],
+        "protection_plan": extend_info["protection_plan"],
+        "extra_info": extend_info["extra_info"],
+        "project_id": record["project_id"],
+        "created_at": record["created_at"].strftime("%Y-%m-%d"),
+        "timestamp": extend_info["timestamp"]
+    }
+    if "resource_graph" in extend_info:
+        summary["resource_graph"] = extend_info["resource_graph"]
+    return summary
 
 
 class Checkpoint(object):
@@ -41,6 +303,19 @@ class Checkpoint(object):
         self._bank_lease = bank_lease
         self.reload_meta_data()
 
+    def to_summary_dict(self):
+        """The compact representation of the checkpoint used for listing"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "protection_plan": self.protection_plan,
+            "extra_info": self._md_cache.get("extra_info", None),
+            "project_id": self.project_id,
+            "resource_graph": self._md_cache.get("resource_graph", None),
+            "created_at": self._md_cache.get("created_at", None),
+            "timestamp": self._md_cache.get("timestamp", None)
+        }
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -82,15 +357,25 @@ class Checkpoint(object):
         # TODO(yinwei): check for valid values and transitions
         return self._md_cache["owner_id"]
 
+    @property
+    def host(self):
+        """The host of the protection service running its operation"""
+        return self._md_cache.get("host")
+
     @property
     def resource_graph(self):
         serialized_resource_graph = self._md_cache.get("resource_graph", None)
-        if serialized_resource_graph is not None:
+        if serialized_resource_graph is None:
+            return None
+        # The graph is deserialized once per serialized graph, which is
+        # replaced by reloads and by the setter
+        cached_serialized_graph, resource_graph = self._resource_graph_cache
+        if cached_serialized_graph is not serialized_resource_graph:
             resource_graph = graph.deserialize_resource_graph(
                 serialized_resource_graph)
-            return resource_graph
-        else:
-            return None
+            self._resource_graph_cache = (serialized_resource_graph,
+                                          resource_graph)
+        return resource_graph
 
     @property
     def protection_plan(self):
@@ -100,11 +385,17 @@ class Checkpoint(object):
     def status(self, value):
         self._md_cache["status"] = value
 
+    @host.setter
+    def host(self, value):
+        self._md_cache["host"] = value
+
     @resource_graph.setter
     def resource_graph(self, resource_graph):
         serialized_resource_graph = graph.serialize_resource_graph(
-            resource_graph)
+            resource_graph, compact=CONF.compact_resource_graph)
         self._md_cache["resource_graph"] = serialized_resource_graph
+        self._resource_graph_cache = (serialized_resource_graph,
+                                      resource_graph)
 
     def _is_supported_version(self, version):
         return version in self.SUPPORTED_VERSIONS
@@ -126,6 +417,9 @@ class Checkpoint(object):
             raise exception.CheckpointNotFound(checkpoint_id=self.id)
         self._assert_supported_version(new_md)
         self._md_cache = new_md
+        self._resource_graph_cache = (None, None)
+        # The serialized graph whose resources are in the resource index
+        self._indexed_resource_graph = new_md.get("resource_graph")
 
     @classmethod
     def _generate_id(self):
@@ -170,36 +464,93 @@ class Checkpoint(object):
                 },
                 "extra_info": extra_info,
                 "created_at": created_at,
-                "timestamp": timestamp
+                "timestamp": timestamp,
+                "host": CONF.host
             }
         )
 
-        indices_section.update_object(
-            key="/by-provider/%s/%s@%s" % (provider_id, timestamp,
-                                           checkpoint_id),
-            value=checkpoint_id
-        )
-
-        indices_section.update_object(
-            key="/by-date/%s/%s@%s" % (created_at, timestamp, checkpoint_id),
-            value=checkpoint_id
-        )
-
-        indices_section.update_object(
-            key="/by-plan/%s/%s/%s@%s" % (
-                plan.get("id"), created_at, timestamp, checkpoint_id),
-            value=checkpoint_id)
-
-        return Checkpoint(checkpoint_section,
-                          indices_section,
-                          bank_lease,
-                          checkpoint_id)
+        indices_section.update_objects({
+            key: checkpoint_id
+            for key in _get_index_keys(provider_id, plan.get("id"),
+                                       created_at, timestamp, checkpoint_id)
+        })
+
+        checkpoint = Checkpoint(checkpoint_section,
+                                indices_section,
+                                bank_lease,
+                                checkpoint_id)
+        checkpoint._update_summary()
+        checkpoint._update_record()
+        return checkpoint
+
+    def _update_summary(self, remove=False):
+        provider_id = self._md_cache["protection_plan"]["provider_id"]
+        segment_prefix = _get_summary_segment_prefix(
+            provider_id, self._md_cache["timestamp"])
+        summary = None if remove else self.to_summary_dict()
+        try:
+            _update_summary_segment(self._indices_section, segment_prefix,
+                                    {self.id: summary})
+        except Exception as err:
+            # Listing falls back to the checkpoint index
+            LOG.warning("Failed updating the summary of checkpoint "
+                        "%(id)s: %(err)s", {'id': self.id, 'err': err})
+
+    def _update_record(self, remove=False):
+        """Update the record of the checkpoint the listing is served from
+
+        A checkpoint whose record can't be written would be listed with a
+        stale status, so the failure is raised. The records are rebuilt by
+        karbor-manage checkpoint reconcile.
+        """
+        ctxt = context.get_admin_context()
+        try:
+            if remove:
+                delete_checkpoint_record(ctxt, self.id)
+            else:
+                update_checkpoint_record(ctxt, self.to_summary_dict())
+        except Exception as err:
+            LOG.error("Failed updating the record of checkpoint "
+                      "%(id)s: %(err)s", {'id': self.id, 'err': err})
+            raise exception.CheckpointRecordUpdateFailed(id=self.id,
+                                                         reason=err)
+
+    def _update_resource_indices(self):
+        serialized_resource_graph = self._md_cache.get("resource_graph")
+        if serialized_resource_graph is self._indexed_resource_graph:
+            return
+        resources = _get_graph_resources(serialized_resource_graph)
+        indexed_resources = _get_graph_resources(
+            self._indexed_resource_graph)
+        timestamp = self._md_cache["timestamp"]
+        added = resources - indexed_resources
+        if added:
+            self._indices_section.update_objects({
+                key: self.id
+                for key in _get_resource_index_keys(added, timestamp, self.id)
+            })
+        removed = indexed_resources - resources
+        if removed:
+            self._indices_section.delete_objects(
+                _get_resource_index_keys(removed, timestamp, self.id))
+        self._indexed_resource_graph = serialized_resource_graph
+
+    def rebuild_resource_indices(self):
+        """Write the resource index keys of all the checkpoint resources
+
+        For the checkpoints created before the resource index existed.
+        """
+        self._indexed_resource_graph = None
+        self._update_resource_indices()
 
     def commit(self):
         self._checkpoint_section.update_object(
             key=_INDEX_FILE_NAME,
             value=self._md_cache,
         )
+        self._update_resource_indices()
+        self._update_summary()
+        self._update_record()
 
     def purge(self):
         """Purge the index file of the checkpoint.
@@ -209,17 +560,9 @@ class Checkpoint(object):
         """
         all_objects = self._checkpoint_section.list_objects()
         if len(all_objects) == 1 and all_objects[0] == _INDEX_FILE_NAME:
-            created_at = self._md_cache["created_at"]
-            timestamp = self._md_cache["timestamp"]
-            plan_id = self._md_cache["protection_plan"]["id"]
-            provider_id = self._md_cache["protection_plan"]["provider_id"]
-            self._indices_section.delete_object(
-                "/by-provider/%s/%s@%s" % (provider_id, timestamp, self.id))
-            self._indices_section.delete_object(
-                "/by-date/%s/%s@%s" % (created_at, timestamp, self.id))
-            self._indices_section.delete_object(
-                "/by-plan/%s/%s/%s@%s" % (
-                    plan_id, created_at, timestamp, self.id))
+            self._delete_indices()
+            self._update_summary(remove=True)
+            self._update_record(remove=True)
 
             self._checkpoint_section.delete_object(_INDEX_FILE_NAME)
         else:
@@ -227,19 +570,24 @@ class Checkpoint(object):
 
     def delete(self):
         self.status = constants.CHECKPOINT_STATUS_DELETED
-        self.commit()
-        # delete indices
-        created_at = self._md_cache["created_at"]
-        timestamp = self._md_cache["timestamp"]
-        plan_id = self._md_cache["protection_plan"]["id"]
-        provider_id = self._md_cache["protection_plan"]["provider_id"]
-        self._indices_section.delete_object(
-            "/by-provider/%s/%s@%s" % (provider_id, timestamp, self.id))
-        self._indices_section.delete_object(
-            "/by-date/%s/%s@%s" % (created_at, timestamp, self.id))
-        self._indices_section.delete_object(
-            "/by-plan/%s/%s/%s@%s" % (
-                plan_id, created_at, timestamp, self.id))
+        self._checkpoint_section.update_object(
+            key=_INDEX_FILE_NAME,
+            value=self._md_cache,
+        )
+        self._update_summary(remove=True)
+        self._update_record(remove=True)
+        self._delete_indices()
+
+    def _delete_indices(self):
+        self._indices_section.delete_objects(_get_index_keys(
+            self._md_cache["protection_plan"]["provider_id"],
+            self._md_cache["protection_plan"]["id"],
+            self._md_cache["created_at"],
+            self._md_cache["timestamp"],
+            self.id) + _get_resource_index_keys(
+            _get_graph_resources(self._indexed_resource_graph),
+            self._md_cache["timestamp"], self.id))
+        self._indexed_resource_graph = None
 
     def get_resource_bank_section(self, resource_id):
         prefix = "/resource-data/%s/" % resource_id
@@ -254,21 +602,43 @@ class CheckpointCollection(object):
         self._bank_lease = bank_lease
         self._checkpoints_section = bank.get_sub_section("/checkpoints")
         self._indices_section = bank.get_sub_section("/indices")
+        self._desc_indices_ready = False
 
     def list_ids(self, provider_id, limit=None, marker=None, plan_id=None,
                  start_date=None, end_date=None, sort_dir=None):
+        return [checkpoint_id
+                for _timestamp, checkpoint_id in self._list_entries(
+                    provider_id, limit, marker, plan_id, start_date,
+                    end_date, sort_dir)]
+
+    def _list_entries(self, provider_id, limit, marker, plan_id,
+                      start_date, end_date, sort_dir):
+        """List the (timestamp, checkpoint id) of the indexed checkpoints"""
         marker_checkpoint = None
         if marker is not None:
             checkpoint_section = self._checkpoints_section.get_sub_section(
                 marker)
             marker_checkpoint = checkpoint_section.get_object(_INDEX_FILE_NAME)
-            timestamp = marker_checkpoint["timestamp"]
-            marker = "%s@%s" % (timestamp, marker)
 
         if start_date is not None:
             if end_date is None:
                 end_date = timeutils.utcnow()
 
+        if sort_dir == "desc":
+            keys = self._list_desc_keys(provider_id, limit, marker_checkpoint,
+                                        plan_id, start_date, end_date)
+            entries = []
+            for key in keys:
+                inverted_timestamp, checkpoint_id = key.rsplit(
+                    "/", 1)[-1].split("@", 1)
+                entries.append((_MAX_TIMESTAMP - int(inverted_timestamp),
+                                checkpoint_id))
+            return entries
+
+        if marker is not None:
+            timestamp = marker_checkpoint["timestamp"]
+            marker = "%s@%s" % (timestamp, marker)
+
         if plan_id is None and start_date is None:
             prefix = "/by-provider/%s/" % provider_id
             if marker is not None:
@@ -284,29 +654,203 @@ class CheckpointCollection(object):
                 date = marker_checkpoint["created_at"]
                 marker = "/by-date/%s/%s" % (date, marker)
 
-        return self._list_ids(prefix, limit, marker, start_date, end_date,
-                              sort_dir)
+        entries = []
+        for key in self._list_keys(prefix, limit, marker, start_date,
+                                   end_date):
+            timestamp, checkpoint_id = key.rsplit("/", 1)[-1].split("@", 1)
+            entries.append((int(timestamp), checkpoint_id))
+        return entries
 
-    def _list_ids(self, prefix, limit, marker, start_date, end_date, sort_dir):
+    def _list_keys(self, prefix, limit, marker, start_date, end_date):
+        """List the index keys, which end with <timestamp>@<checkpoint id>"""
         if start_date is None:
-            return [key[key.find("@") + 1:]
-                    for key in self._indices_section.list_objects(
-                    prefix=prefix,
-                    limit=limit,
-                    marker=marker,
-                    sort_dir=sort_dir
-                    )]
+            return list(self._indices_section.list_objects(
+                prefix=prefix,
+                limit=limit,
+                marker=marker
+            ))
+
+        # The keys under prefix are <date>/<timestamp>@<checkpoint id>, so
+        # only the days of the requested range are listed, one at a time.
+        days = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d")
+                for i in range((end_date.date() - start_date.date()).days + 1)]
+        marker_day = None
+        if marker is not None:
+            marker_day = marker[len(prefix):].split("/", 1)[0]
+        keys = []
+        for day in days:
+            day_marker = None
+            if marker_day is not None:
+                if day < marker_day:
+                    continue
+                if day == marker_day:
+                    day_marker = marker
+            day_limit = None if limit is None else limit - len(keys)
+            keys.extend(self._indices_section.list_objects(
+                prefix="%s%s/" % (prefix, day),
+                limit=day_limit,
+                marker=day_marker
+            ))
+            if limit is not None and len(keys) >= limit:
+                return keys[:limit]
+        return keys
+
+    def _list_desc_keys(self, provider_id, limit, marker_checkpoint, plan_id,
+                        start_date, end_date):
+        """List the newest first index keys
+
+        Their keys end with <inverted timestamp>@<checkpoint id>, so the
+        newest first listing is an ascending listing honouring limit, and
+        a date range is a contiguous run of keys starting from a marker.
+        """
+        self._ensure_desc_indices()
+        if plan_id is None and start_date is None:
+            prefix = "/by-provider-desc/%s/" % provider_id
+        elif plan_id is not None:
+            prefix = "/by-plan-desc/%s/" % plan_id
         else:
-            ids = []
-            for key in self._indices_section.list_objects(prefix=prefix,
-                                                          marker=marker,
-                                                          sort_dir=sort_dir):
-                date = datetime.strptime(key.split("/")[-2], "%Y-%m-%d")
-                if start_date <= date <= end_date:
-                    ids.append(key[key.find("@") + 1:])
-                if limit is not None and len(ids) == limit:
-                    return ids
-            return ids
+            prefix = "/by-date-desc/"
+
+        marker = None
+        if marker_checkpoint is not None:
+            marker = "%s%s@%s" % (
+                prefix, _invert_timestamp(marker_checkpoint["timestamp"]),
+                marker_checkpoint["id"])
+        start_bound = None
+        if start_date is not None:
+            end_timestamp = calendar.timegm(
+                (end_date.date() + timedelta(days=1)).timetuple())
+            # '~' sorts after the checkpoint ids
+            window_marker = "%s%s@~" % (prefix,
+                                        _invert_timestamp(end_timestamp))
+            marker = window_marker if marker is None else max(marker,
+                                                              window_marker)
+            start_bound = _invert_timestamp(
+                calendar.timegm(start_date.date().timetuple()))
+
+        keys = []
+        for key in self._indices_section.list_objects(prefix=prefix,
+                                                      limit=limit,
+                                                      marker=marker):
+            if (start_bound is not None and
+                    key.rsplit("/", 1)[-1].split("@", 1)[0] > start_bound):
+                break
+            keys.append(key)
+        return keys
+
+    def _ensure_desc_indices(self):
+        """Build the newest first indices of the older checkpoints once"""
+        if self._desc_indices_ready:
+            return
+        try:
+            self._indices_section.get_object(_DESC_INDICES_READY_KEY)
+        except exception.BankGetObjectFailed:
+            LOG.info("Building the newest first checkpoint indices")
+            desc_indices = {}
+            for key in self._indices_section.list_objects(
+                    prefix="/by-provider/"):
+                parts = key.split("/")
+                timestamp, checkpoint_id = parts[-1].split("@", 1)
+                desc_indices["/by-provider-desc/%s/%s@%s" % (
+                    parts[-2], _invert_timestamp(timestamp),
+                    checkpoint_id)] = checkpoint_id
+                desc_indices["/by-date-desc/%s@%s" % (
+                    _invert_timestamp(timestamp),
+                    checkpoint_id)] = checkpoint_id
+            for key in self._indices_section.list_objects(
+                    prefix="/by-plan/"):
+                parts = key.split("/")
+                timestamp, checkpoint_id = parts[-1].split("@", 1)
+                desc_indices["/by-plan-desc/%s/%s@%s" % (
+                    parts[-3], _invert_timestamp(timestamp),
+                    checkpoint_id)] = checkpoint_id
+            if desc_indices:
+                self._indices_section.update_objects(desc_indices)
+            self._indices_section.update_object(_DESC_INDICES_READY_KEY,
+                                                {"version": 1})
+        self._desc_indices_ready = True
+
+    def sync_records(self, ctxt, checkpoint_ids, concurrency):
+        """Write the records of checkpoints from the bank
+
+        The resource indices of the checkpoints are rebuilt along, for the
+        checkpoints created before they existed. The checkpoints are read
+        concurrency at a time. Returns the ids of the checkpoints whose
+        records were written.
+        """
+        def sync_record(checkpoint_id):
+            try:
+                checkpoint = self.get(checkpoint_id)
+                checkpoint.rebuild_resource_indices()
+                update_checkpoint_record(ctxt, checkpoint.to_summary_dict())
+            except Exception as err:
+                LOG.warning("Failed syncing the record of checkpoint "
+                            "%(id)s: %(err)s", {'id': checkpoint_id,
+                                                'err': err})
+                return None
+            return checkpoint_id
+
+        pool = greenpool.GreenPool(concurrency)
+        return [checkpoint_id
+                for checkpoint_id in pool.imap(sync_record, checkpoint_ids)
+                if checkpoint_id is not None]
+
+    def list_ids_by_resource(self, resource_type, resource_id):
+        """List the ids of the checkpoints containing a resource
+
+        The ids are listed oldest first, with a single prefix scan of the
+        resource index.
+        """
+        prefix = _get_resource_index_prefix(resource_type, resource_id)
+        return [key.rsplit("/", 1)[-1].split("@", 1)[1]
+                for key in self._indices_section.list_objects(prefix=prefix)]
+
+    def list_summaries(self, provider_id, limit=None, marker=None,
+                       plan_id=None, start_date=None, end_date=None,
+                       sort_dir=None):
+        """List the checkpoint summaries, filtered like list_ids
+
+        The summaries are read from the summary segments of the provider,
+        a handful of objects for a page of checkpoints. The checkpoints
+        missing from the segments, like those created before the segments
+        existed, are read from their index and added to the segments.
+        """
+        entries = [(checkpoint_id,
+                    _get_summary_segment_prefix(provider_id, timestamp))
+                   for timestamp, checkpoint_id in self._list_entries(
+                       provider_id, limit, marker, plan_id, start_date,
+                       end_date, sort_dir)]
+
+        buckets = {}
+        for segment_prefix in set(prefix for _id, prefix in entries):
+            buckets[segment_prefix] = _merge_summary_segments(
+                _get_summary_segments(self._indices_section,
+                                      segment_prefix).values())
+
+        summaries = []
+        missing = {}
+        for checkpoint_id, segment_prefix in entries:
+            summary = buckets[segment_prefix].get(checkpoint_id)
+            if summary is None:
+                try:
+                    summary = self.get(checkpoint_id).to_summary_dict()
+                except exception.CheckpointNotFound:
+                    LOG.warning("Checkpoint %s is indexed but not found",
+                                checkpoint_id)
+                    continue
+                missing.setdefault(segment_prefix, {})[checkpoint_id] = (
+                    summary)
+            summaries.append(summary)
+
+        for segment_prefix, segment_summaries in missing.items():
+            try:
+                _update_summary_segment(self._indices_section,
+                                        segment_prefix, segment_summaries)
+            except Exception as err:
+                LOG.warning("Failed updating checkpoint summary segment "
+                            "%(key)s: %(err)s",
+                            {'key': segment_prefix, 'err': err})
+        return summaries
 
     def get(self, checkpoint_id):
         # TODO(saggi): handle multiple instances of the same checkpoint
@@ -14,6 +14,7 @@ from karbor.common import constants
 from karbor.services.protection.flows import utils
 from karbor.services.protection import resource_flow
 from oslo_log import log as logging
+from oslo_utils import excutils
 from oslo_utils import timeutils
 
 from taskflow import task
@@ -51,12 +52,11 @@ class CompleteDeleteTask(task.Task):
         utils.update_operation_log(context, operation_log, update_fields)
 
 
-def get_flow(context, workflow_engine, checkpoint, provider):
-    LOG.info("Start get checkpoint flow, checkpoint_id: %s", checkpoint.id)
+def _build_flow(context, workflow_engine, checkpoint, provider,
+                operation_log, **kwargs):
     flow_name = "Delete_Checkpoint_" + checkpoint.id
     delete_flow = workflow_engine.build_flow(flow_name, 'linear')
     resource_graph = checkpoint.resource_graph
-    operation_log = utils.create_operation_log(context, checkpoint)
     plugins = provider.load_plugins()
     resources_task_flow = resource_flow.build_resource_flow(
         operation_type=constants.OPERATION_DELETE,
@@ -64,7 +64,8 @@ def get_flow(context, workflow_engine, checkpoint, provider):
         workflow_engine=workflow_engine,
         resource_graph=resource_graph,
         plugins=plugins,
-        parameters=None
+        parameters=None,
+        limits_scope=provider.id,
     )
     workflow_engine.add_tasks(
         delete_flow,
@@ -77,6 +78,28 @@ def get_flow(context, workflow_engine, checkpoint, provider):
         store={
             'context': context,
             'checkpoint': checkpoint,
-            'operation_log': operation_log}
+            'operation_log': operation_log},
+        **kwargs
     )
     return flow_engine
+
+
+def get_flow(context, workflow_engine, checkpoint, provider):
+    LOG.info("Start get checkpoint flow, checkpoint_id: %s", checkpoint.id)
+    operation_log = utils.create_operation_log(context, checkpoint)
+    meta = utils.get_flow_meta(context, constants.OPERATION_DELETE,
+                               provider, checkpoint, operation_log,
+                               utils.create_flow_trust(context))
+    try:
+        return _build_flow(context, workflow_engine, checkpoint, provider,
+                           operation_log, persist_as='delete_' + checkpoint.id,
+                           meta=meta)
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            utils.delete_flow_trust(meta)
+
+
+def get_resumed_flow(context, workflow_engine, provider, checkpoint,
+                     operation_log, flow_detail):
+    return _build_flow(context, workflow_engine, checkpoint, provider,
+                       operation_log, flow_detail=flow_detail)
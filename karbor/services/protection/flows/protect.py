@@ -15,6 +15,7 @@ from karbor.resource import Resource
 from karbor.services.protection.flows import utils
 from karbor.services.protection import resource_flow
 from oslo_log import log as logging
+from oslo_utils import excutils
 from oslo_utils import timeutils
 
 from taskflow import task
@@ -53,14 +54,8 @@ class CompleteProtectTask(task.Task):
         utils.update_operation_log(context, operation_log, update_fields)
 
 
-def get_flow(context, protectable_registry, workflow_engine, plan, provider,
-             checkpoint):
-    resources = set(Resource(**item) for item in plan.get("resources"))
-    resource_graph = protectable_registry.build_graph(context,
-                                                      resources)
-    checkpoint.resource_graph = resource_graph
-    checkpoint.commit()
-    operation_log = utils.create_operation_log(context, checkpoint)
+def _build_flow(context, workflow_engine, plan, provider, checkpoint,
+                resource_graph, operation_log, **kwargs):
     flow_name = "Protect_" + plan.get('id')
     protection_flow = workflow_engine.build_flow(flow_name, 'linear')
     plugins = provider.load_plugins()
@@ -72,6 +67,7 @@ def get_flow(context, protectable_registry, workflow_engine, plan, provider,
         resource_graph=resource_graph,
         plugins=plugins,
         parameters=parameters,
+        limits_scope=provider.id,
     )
     workflow_engine.add_tasks(
         protection_flow,
@@ -83,5 +79,68 @@ def get_flow(context, protectable_registry, workflow_engine, plan, provider,
         'context': context,
         'checkpoint': checkpoint,
         'operation_log': operation_log
-    })
+    }, **kwargs)
     return flow_engine
+
+
+def _get_flow_meta(context, plan, provider, checkpoint, operation_log=None,
+                   trust_id=None):
+    # The flow is resumed from what the meta holds and the checkpoint
+    meta = utils.get_flow_meta(context, constants.OPERATION_PROTECT,
+                               provider, checkpoint, operation_log, trust_id)
+    meta['plan'] = {'id': plan.get('id'),
+                    'provider_id': plan.get('provider_id'),
+                    'resources': plan.get('resources'),
+                    'parameters': plan.get('parameters')}
+    return meta
+
+
+def persist_flow(context, workflow_engine, plan, provider, checkpoint):
+    trust_id = utils.create_flow_trust(context)
+    try:
+        return workflow_engine.persist_flow(
+            'protect_' + checkpoint.id,
+            _get_flow_meta(context, plan, provider, checkpoint,
+                           trust_id=trust_id))
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            utils.delete_flow_trust({'trust_id': trust_id})
+
+
+def get_flow(context, protectable_registry, workflow_engine, plan, provider,
+             checkpoint, flow_detail=None):
+    """Build the protection flow
+
+    flow_detail is the detail the protection was persisted with while it
+    was queued, if any, and the flow is persisted in it.
+    """
+    resources = set(Resource(**item) for item in plan.get("resources"))
+    resource_graph = protectable_registry.build_graph(context,
+                                                      resources)
+    checkpoint.resource_graph = resource_graph
+    checkpoint.commit()
+    operation_log = utils.create_operation_log(context, checkpoint)
+    if flow_detail is not None:
+        meta = _get_flow_meta(context, plan, provider, checkpoint,
+                              operation_log, flow_detail.meta.get('trust_id'))
+        workflow_engine.update_flow_meta(flow_detail, meta)
+        return _build_flow(context, workflow_engine, plan, provider,
+                           checkpoint, resource_graph, operation_log,
+                           flow_detail=flow_detail)
+
+    meta = _get_flow_meta(context, plan, provider, checkpoint, operation_log,
+                          utils.create_flow_trust(context))
+    try:
+        return _build_flow(context, workflow_engine, plan, provider,
+                           checkpoint, resource_graph, operation_log,
+                           persist_as='protect_' + checkpoint.id, meta=meta)
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            utils.delete_flow_trust(meta)
+
+
+def get_resumed_flow(context, workflow_engine, provider, checkpoint,
+                     operation_log, flow_detail):
+    return _build_flow(context, workflow_engine, flow_detail.meta['plan'],
+                       provider, checkpoint, checkpoint.resource_graph,
+                       operation_log, flow_detail=flow_detail)
@@ -185,7 +185,8 @@ def get_flow(context, workflow_engine, checkpoint, provider, restore,
         workflow_engine=workflow_engine,
         resource_graph=resource_graph,
         plugins=plugins,
-        parameters=parameters
+        parameters=parameters,
+        limits_scope=provider.id,
     )
 
     workflow_engine.add_tasks(
@@ -11,25 +11,50 @@
 # under the License.
 
 from karbor.common import constants
+from karbor import context as karbor_context
 from karbor import exception
 from karbor.i18n import _
 from karbor import objects
 from karbor.objects import base as objects_base
+from karbor.services.protection.checkpoint import load_extra_info
+from karbor.services.protection.client_factory import ClientFactory
+from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import timeutils
 
+CONF = cfg.CONF
+CONF.import_opt('flow_persistence',
+                'karbor.services.protection.flows.workflow')
+
 LOG = logging.getLogger(__name__)
 
+# The fields of the request context a flow is persisted with, its token
+# is not, a resumed flow authenticates with a trust instead
+_FLOW_CONTEXT_FIELDS = (
+    'user_id',
+    'project_id',
+    'project_name',
+    'domain',
+    'user_domain',
+    'project_domain',
+    'read_deleted',
+    'roles',
+    'is_admin',
+    'remote_address',
+    'timestamp',
+    'quota_class',
+    'service_catalog',
+    'request_id',
+)
+
 
 def create_operation_log(context, checkpoint):
     checkpoint_dict = checkpoint.to_dict()
-    extra_info = checkpoint_dict.get('extra_info', None)
-    create_by = (extra_info.get('create_by', None)
-                 if extra_info else None)
+    extra_info = load_extra_info(checkpoint_dict.get('extra_info', None))
     scheduled_operation_id = None
-    if create_by:
-        scheduled_operation_id = create_by.get(
-            'scheduled_operation_id', None)
+    if (extra_info.get(constants.CHECKPOINT_CREATE_BY) ==
+            constants.OPERATION_ENGINE):
+        scheduled_operation_id = extra_info.get('scheduled_operation_id')
 
     protection_plan = checkpoint_dict['protection_plan']
     plan_id = None
@@ -58,6 +83,81 @@ def create_operation_log(context, checkpoint):
         raise
 
 
+def get_flow_meta(context, operation_type, provider, checkpoint,
+                  operation_log=None, trust_id=None):
+    """Return the meta a flow is persisted with, to resume it from
+
+    The operation log is None for a flow persisted before it is built.
+    trust_id is the trust the flow is resumed with, see create_flow_trust.
+    """
+    if context is not None:
+        values = context.to_dict()
+        flow_context = {field: values[field]
+                        for field in _FLOW_CONTEXT_FIELDS if field in values}
+    else:
+        flow_context = None
+    meta = {
+        'operation_type': operation_type,
+        'provider_id': provider.id,
+        'checkpoint_id': checkpoint.id,
+        'context': flow_context,
+        'trust_id': trust_id,
+    }
+    if operation_log is not None:
+        meta['operation_log_id'] = operation_log.id
+    return meta
+
+
+def create_flow_trust(context):
+    """Create the trust a persisted flow is resumed with
+
+    Returns None when flows are not persisted, or the trust cannot be
+    created, in which case a resumed flow runs with no token.
+    """
+    if (not CONF.flow_persistence or context is None or
+            not context.auth_token_info):
+        return None
+    try:
+        return ClientFactory.get_keystone_plugin().create_trust_to_karbor(
+            context)
+    except Exception:
+        LOG.warning("Failed to create a trust for the flows of project %s, "
+                    "they cannot be resumed", context.project_id,
+                    exc_info=True)
+        return None
+
+
+def delete_flow_trust(meta):
+    """Delete the trust of a flow no longer persisted"""
+    trust_id = meta.get('trust_id')
+    if not trust_id:
+        return
+    try:
+        ClientFactory.get_keystone_plugin().delete_trust_to_karbor(trust_id)
+    except Exception:
+        LOG.exception("Failed to delete the trust %s", trust_id)
+
+
+def get_flow_context(meta):
+    """Return the request context to resume a persisted flow with
+
+    The context is authenticated with the trust of the flow, if any.
+    """
+    values = meta.get('context')
+    if not values:
+        return karbor_context.get_admin_context()
+    values = dict(values)
+    trust_id = meta.get('trust_id')
+    if trust_id:
+        session = ClientFactory.get_keystone_plugin().create_trust_session(
+            trust_id)
+        auth_ref = session.auth.get_access(session)
+        values['auth_token'] = auth_ref.auth_token
+        # The body of the token, as the auth middleware gives it
+        values['auth_token_info'] = auth_ref._data
+    return karbor_context.RequestContext.from_dict(values)
+
+
 def update_operation_log(context, operation_log, fields):
     if not isinstance(operation_log, objects_base.KarborObject):
         msg = _("The parameter must be a object of "
@@ -17,9 +17,11 @@ from oslo_utils import importutils
 
 from karbor.common import constants
 from karbor import exception
+from karbor import objects
 from karbor.services.protection.flows import delete as flow_delete
 from karbor.services.protection.flows import protect as flow_protect
 from karbor.services.protection.flows import restore as flow_restore
+from karbor.services.protection.flows import utils
 
 workflow_opts = [
     cfg.StrOpt(
@@ -42,6 +44,7 @@ class Worker(object):
         except Exception:
             LOG.error("load work flow engine failed")
             raise
+        self.workflow_engine.add_discard_listener(utils.delete_flow_trust)
 
     def _load_engine(self, engine_path):
         if not engine_path:
@@ -61,6 +64,7 @@ class Worker(object):
                 plan,
                 provider,
                 checkpoint,
+                flow_detail=kwargs.get('flow_detail'),
             )
         elif operation_type == constants.OPERATION_RESTORE:
             restore = kwargs.get('restore')
@@ -87,6 +91,45 @@ class Worker(object):
 
         return flow
 
+    def get_unfinished_flows(self):
+        return self.workflow_engine.get_unfinished_flows()
+
+    def discard_flow(self, flow_detail):
+        self.workflow_engine.discard_flow(flow_detail)
+
+    def discard_engine(self, flow_engine):
+        self.workflow_engine.discard_engine(flow_engine)
+
+    def persist_protect_flow(self, context, plan, provider, checkpoint):
+        """Persist a protection queued before its flow is built
+
+        The returned flow detail, None when flows are not persisted, is
+        given to get_flow once the protection starts.
+        """
+        return flow_protect.persist_flow(context, self.workflow_engine,
+                                         plan, provider, checkpoint)
+
+    def get_flow_context(self, flow_detail):
+        """Return the request context to resume a flow detail with"""
+        return utils.get_flow_context(flow_detail.meta)
+
+    def get_resumed_flow(self, context, provider, checkpoint, flow_detail):
+        """Return the flow of an unfinished flow detail to resume"""
+        operation_type = flow_detail.meta['operation_type']
+        if operation_type == constants.OPERATION_PROTECT:
+            flow_module = flow_protect
+        elif operation_type == constants.OPERATION_DELETE:
+            flow_module = flow_delete
+        else:
+            raise exception.InvalidParameterValue(
+                err='unknown operation type %s' % operation_type
+            )
+        operation_log = objects.OperationLog.get_by_id(
+            context, flow_detail.meta['operation_log_id'])
+        return flow_module.get_resumed_flow(context, self.workflow_engine,
+                                            provider, checkpoint,
+                                            operation_log, flow_detail)
+
     def run_flow(self, flow_engine):
         self.workflow_engine.run_engine(flow_engine)
 
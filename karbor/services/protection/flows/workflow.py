@@ -11,21 +11,45 @@
 #    under the License.
 
 import abc
+import contextlib
 import futurist
 import six
 
 from karbor import exception
 from karbor.i18n import _
+from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import uuidutils
 
 from taskflow import engines
 from taskflow.patterns import graph_flow
 from taskflow.patterns import linear_flow
+from taskflow.persistence import backends as persistence_backends
+from taskflow.persistence import models as persistence_models
+from taskflow import states
 from taskflow import task
 
+flow_persistence_opts = [
+    cfg.BoolOpt('flow_persistence',
+                default=False,
+                help='Persist the progress of the protect and delete flows, '
+                     'so that the flows interrupted by a restart of the '
+                     'protection service resume where they stopped rather '
+                     'than start over'),
+    cfg.StrOpt('flow_persistence_connection',
+               secret=True,
+               help='The SQLAlchemy connection string of the database the '
+                    'flows are persisted to. The karbor database, from '
+                    '[database] connection, is used by default'),
+]
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+CONF.register_opts(flow_persistence_opts)
+
+FINISHED_FLOW_STATES = (states.SUCCESS, states.FAILURE, states.REVERTED)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class WorkFlowEngine(object):
@@ -85,6 +109,42 @@ class WorkFlowEngine(object):
     def search_task(self, flow, task_id):
         return
 
+    def get_unfinished_flows(self):
+        """Return the details of the persisted flows which did not finish
+
+        Every detail has the meta the flow was persisted with.
+        """
+        return []
+
+    def discard_flow(self, flow_detail):
+        """Stop persisting a flow, so that it is not resumed"""
+        return
+
+    def discard_engine(self, flow_engine):
+        """Stop persisting the flow of an engine, so that it is not resumed"""
+        return
+
+    def persist_flow(self, name, meta):
+        """Persist a flow before it is built
+
+        Returns the detail of the flow, to give to get_engine once the flow
+        is built, or None when flows are not persisted. Until then, it is
+        listed by get_unfinished_flows with no progress.
+        """
+        return None
+
+    def update_flow_meta(self, flow_detail, meta):
+        """Replace the meta of a persisted flow"""
+        return
+
+    def add_discard_listener(self, listener):
+        """Call listener with the meta of every flow no longer persisted
+
+        A persisted flow is no longer persisted once it finished or is
+        discarded.
+        """
+        return
+
 
 class TaskFlowEngine(WorkFlowEngine):
     def build_flow(self, flow_name, flow_type='graph'):
@@ -95,7 +155,54 @@ class TaskFlowEngine(WorkFlowEngine):
         else:
             raise ValueError(_("unsupported flow type: %s") % flow_type)
 
+    def __init__(self):
+        super(TaskFlowEngine, self).__init__()
+        self._backend = None
+        self._discard_listeners = []
+
+    def _get_backend(self):
+        if not CONF.flow_persistence:
+            return None
+        if self._backend is None:
+            connection = (CONF.flow_persistence_connection or
+                          CONF.database.connection)
+            backend = persistence_backends.fetch({'connection': connection})
+            with contextlib.closing(backend.get_connection()) as conn:
+                conn.upgrade()
+            self._backend = backend
+        return self._backend
+
+    def _persist_flow(self, backend, name, meta):
+        # Every flow has a logbook of its own, of the same uuid, so that it
+        # can be destroyed once the flow finished
+        flow_uuid = uuidutils.generate_uuid()
+        book = persistence_models.LogBook(name, uuid=flow_uuid)
+        book.meta = {'host': CONF.host}
+        flow_detail = persistence_models.FlowDetail(name, uuid=flow_uuid)
+        flow_detail.meta = meta or {}
+        book.add(flow_detail)
+        with contextlib.closing(backend.get_connection()) as conn:
+            conn.save_logbook(book)
+        return flow_detail
+
+    def _destroy_flow(self, conn, flow_uuid, meta):
+        conn.destroy_logbook(flow_uuid)
+        for listener in self._discard_listeners:
+            try:
+                listener(meta or {})
+            except Exception:
+                LOG.exception("Failed to release the flow %s", flow_uuid)
+
+    def add_discard_listener(self, listener):
+        self._discard_listeners.append(listener)
+
     def get_engine(self, flow, **kwargs):
+        """Load the engine of a flow
+
+        A flow is persisted when flow persistence is enabled and either
+        persist_as, the name of the flow, and meta are given, or the
+        flow_detail of the unfinished flow to resume is.
+        """
         if flow is None:
             LOG.error("The flow is None, build it first")
             raise exception.InvalidTaskFlowObject(
@@ -103,16 +210,78 @@ class TaskFlowEngine(WorkFlowEngine):
         executor = kwargs.get('executor', None)
         engine = kwargs.get('engine', None)
         store = kwargs.get('store', None)
+        persist_as = kwargs.get('persist_as', None)
+        flow_detail = kwargs.get('flow_detail', None)
         if not executor:
             executor = futurist.GreenThreadPoolExecutor()
         if not engine:
             engine = 'parallel'
+        backend = None
+        if persist_as is not None or flow_detail is not None:
+            backend = self._get_backend()
+        if backend is None:
+            return engines.load(flow,
+                                executor=executor,
+                                engine=engine,
+                                store=store)
+
+        if flow_detail is None:
+            flow_detail = self._persist_flow(backend, persist_as,
+                                             kwargs.get('meta', None))
         flow_engine = engines.load(flow,
+                                   flow_detail=flow_detail,
+                                   backend=backend,
                                    executor=executor,
-                                   engine=engine,
-                                   store=store)
+                                   engine=engine)
+        # The store holds live objects, such as the context and the
+        # checkpoint, which are injected again when the flow resumes
+        if store:
+            flow_engine.storage.inject(store, transient=True)
         return flow_engine
 
+    def get_unfinished_flows(self):
+        backend = self._get_backend()
+        if backend is None:
+            return []
+        flow_details = []
+        with contextlib.closing(backend.get_connection()) as conn:
+            for book in conn.get_logbooks():
+                if (book.meta or {}).get('host') != CONF.host:
+                    continue
+                for flow_detail in book:
+                    if flow_detail.state in FINISHED_FLOW_STATES:
+                        self._destroy_flow(conn, book.uuid,
+                                           flow_detail.meta)
+                    else:
+                        flow_details.append(flow_detail)
+        return flow_details
+
+    def discard_flow(self, flow_detail):
+        backend = self._get_backend()
+        if backend is not None:
+            with contextlib.closing(backend.get_connection()) as conn:
+                self._destroy_flow(conn, flow_detail.uuid, flow_detail.meta)
+
+    def discard_engine(self, flow_engine):
+        if (self._backend is not None and
+                flow_engine.storage.backend is self._backend):
+            with contextlib.closing(self._backend.get_connection()) as conn:
+                self._destroy_flow(conn, flow_engine.storage.flow_uuid,
+                                   flow_engine.storage.flow_meta)
+
+    def persist_flow(self, name, meta):
+        backend = self._get_backend()
+        if backend is None:
+            return None
+        return self._persist_flow(backend, name, meta)
+
+    def update_flow_meta(self, flow_detail, meta):
+        backend = self._get_backend()
+        flow_detail.meta = meta
+        if backend is not None:
+            with contextlib.closing(backend.get_connection()) as conn:
+                conn.update_flow_details(flow_detail)
+
     def karbor_flow_watch(self, state, details):
         LOG.trace("The Flow [%s] OldState[%s] changed to State[%s]: ",
                   details.get('task_name'), details.get('old_state'), state)
@@ -129,7 +298,18 @@ class TaskFlowEngine(WorkFlowEngine):
 
         flow_engine.notifier.register('*', self.karbor_flow_watch)
         flow_engine.atom_notifier.register('*', self.karbor_atom_watch)
-        flow_engine.run()
+        try:
+            flow_engine.run()
+        finally:
+            # A flow interrupted before it finished is left to resume
+            if (self._backend is not None and
+                    flow_engine.storage.backend is self._backend and
+                    flow_engine.storage.get_flow_state() in
+                    FINISHED_FLOW_STATES):
+                with contextlib.closing(
+                        flow_engine.storage.backend.get_connection()) as conn:
+                    self._destroy_flow(conn, flow_engine.storage.flow_uuid,
+                                       flow_engine.storage.flow_meta)
 
     def output(self, flow_engine, target=None):
         if flow_engine is None:
@@ -0,0 +1,137 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+from eventlet import semaphore
+from oslo_log import log as logging
+
+from karbor import exception
+from karbor.i18n import _
+
+LOG = logging.getLogger(__name__)
+
+
+class Limiter(object):
+    """Limit the concurrency and the start rate of an operation
+
+    Used as a context manager around each run of the operation.
+    """
+
+    def __init__(self, name, concurrency=None, rate=None):
+        super(Limiter, self).__init__()
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = (semaphore.Semaphore(concurrency)
+                           if concurrency else None)
+        self._next_start = 0
+
+    def __enter__(self):
+        self.waiting += 1
+        if self.waiting > 1 or self._semaphore and self._semaphore.locked():
+            LOG.debug('Waiting for %(name)s, %(waiting)d waiting, %(active)d '
+                      'active', {'name': self.name, 'waiting': self.waiting,
+                                 'active': self.active})
+        try:
+            if self._semaphore:
+                self._semaphore.acquire()
+            try:
+                if self.rate:
+                    now = time.time()
+                    delay = self._next_start - now
+                    self._next_start = (max(now, self._next_start) +
+                                        1.0 / self.rate)
+                    if delay > 0:
+                        eventlet.sleep(delay)
+            except BaseException:
+                if self._semaphore:
+                    self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.active -= 1
+        if self._semaphore:
+            self._semaphore.release()
+
+
+class Governor(object):
+    """Process wide registry of the limiters of the protection operations
+
+    The limiters are named by a scope, such as the provider id, and a key
+    naming the service and the operation, such as cinder.backup.
+    """
+
+    def __init__(self):
+        super(Governor, self).__init__()
+        self._limiters = {}
+
+    def configure(self, scope, concurrency_limits=None, rate_limits=None):
+        """Configure the limiters of a scope
+
+        concurrency_limits and rate_limits map the keys of the operations to
+        their maximum number of concurrent runs, and to their maximum number
+        of starts per second.
+        """
+        concurrency_limits = concurrency_limits or {}
+        rate_limits = rate_limits or {}
+        limiters = {}
+        try:
+            for key in set(concurrency_limits).union(rate_limits):
+                concurrency = int(concurrency_limits.get(key) or 0)
+                rate = float(rate_limits.get(key) or 0)
+                if concurrency < 0 or rate < 0:
+                    raise ValueError()
+                limiters[key] = Limiter('%s/%s' % (scope, key),
+                                        concurrency=concurrency or None,
+                                        rate=rate or None)
+        except ValueError:
+            raise exception.InvalidInput(
+                reason=_("Invalid operation limits for %(scope)s: "
+                         "%(concurrency)s %(rate)s") %
+                {'scope': scope, 'concurrency': concurrency_limits,
+                 'rate': rate_limits})
+
+        for name in [name for name in self._limiters if name[0] == scope]:
+            del self._limiters[name]
+        for key, limiter in limiters.items():
+            self._limiters[(scope, key)] = limiter
+
+    def get_limiter(self, scope, key):
+        """Return the limiter of an operation, or None if it is unlimited"""
+        return self._limiters.get((scope, key))
+
+    def get_stats(self):
+        """Return the limits and the current usage of every limiter"""
+        return {
+            limiter.name: {
+                'concurrency': limiter.concurrency,
+                'rate': limiter.rate,
+                'active': limiter.active,
+                'waiting': limiter.waiting,
+            }
+            for limiter in self._limiters.values()
+        }
+
+
+_governor = Governor()
+
+
+def get_governor():
+    return _governor
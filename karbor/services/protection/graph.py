@@ -10,10 +10,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import abc
+import array
+import base64
+import collections
 from collections import namedtuple
 
+from eventlet import greenpool
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_serialization import msgpackutils
 
 import six
 
@@ -22,13 +27,6 @@ from karbor.i18n import _
 from karbor.resource import Resource
 
 
-_GraphBuilderContext = namedtuple("_GraphBuilderContext", (
-    "source_set",
-    "encountered_set",
-    "finished_nodes",
-    "get_child_nodes",
-))
-
 GraphNode = namedtuple("GraphNode", (
     "value",
     "child_nodes",
@@ -36,6 +34,15 @@ GraphNode = namedtuple("GraphNode", (
 
 PackedGraph = namedtuple('PackedGraph', ['nodes', 'adjacency'])
 
+# The children of nodes[i] are the nodes indexed by
+# children[offsets[i]:offsets[i + 1]]
+CompactGraph = namedtuple('CompactGraph', ['nodes', 'offsets', 'children'])
+
+# Compact serialized resource graphs start with this prefix, followed by the
+# base64 of the msgpack payload
+_COMPACT_GRAPH_PREFIX = "msgpack:"
+_COMPACT_GRAPH_VERSION = 2
+
 LOG = logging.getLogger(__name__)
 
 
@@ -45,52 +52,84 @@ class FoundLoopError(RuntimeError):
             _("A loop was found in the graph"))
 
 
-def _build_graph_rec(context, node):
-    LOG.trace("Entered node: %s", node)
-    source_set = context.source_set
-    encountered_set = context.encountered_set
-    finished_nodes = context.finished_nodes
-    LOG.trace("Gray set is %s", encountered_set)
-    if node in encountered_set:
-        raise FoundLoopError()
+def _discover_children(start_nodes, get_child_nodes, max_concurrency):
+    """Return a dict of every node reachable from start_nodes to its children
 
-    LOG.trace("Black set is %s", finished_nodes.keys())
-    if node in finished_nodes:
-        return finished_nodes[node]
+    The graph is discovered a level at a time, fetching the children of all
+    the nodes of a level concurrently.
+    """
+    children_map = {}
+    pool = greenpool.GreenPool(max_concurrency)
+    frontier = list(collections.OrderedDict.fromkeys(start_nodes))
+    while frontier:
+        LOG.trace("Fetching the child nodes of %s", frontier)
+        for node, child_nodes in zip(frontier,
+                                     pool.imap(get_child_nodes, frontier)):
+            children_map[node] = tuple(child_nodes)
+
+        next_frontier = collections.OrderedDict()
+        for node in frontier:
+            for child_node in children_map[node]:
+                if child_node not in children_map:
+                    next_frontier[child_node] = None
+        frontier = list(next_frontier)
+    return children_map
+
+
+def _assemble_graph(start_nodes, children_map):
+    """Return a dict of every node to its GraphNode
+
+    Walks the nodes depth first, without recursion, building each GraphNode
+    once all its children are built. A child node which is still being
+    walked closes a loop.
+    """
+    finished_nodes = {}
+    encountered_set = set()
+    for start_node in start_nodes:
+        if start_node in finished_nodes:
+            continue
+        encountered_set.add(start_node)
+        stack = [(start_node, iter(children_map[start_node]))]
+        while stack:
+            node, child_nodes = stack[-1]
+            for child_node in child_nodes:
+                if child_node in encountered_set:
+                    raise FoundLoopError()
+                if child_node not in finished_nodes:
+                    encountered_set.add(child_node)
+                    stack.append((child_node,
+                                  iter(children_map[child_node])))
+                    break
+            else:
+                stack.pop()
+                encountered_set.discard(node)
+                finished_nodes[node] = GraphNode(
+                    value=node,
+                    child_nodes=tuple(finished_nodes[child_node]
+                                      for child_node in children_map[node]))
+    return finished_nodes
+
+
+def build_graph(start_nodes, get_child_nodes_func, max_concurrency=1):
+    """Build the graph of the nodes reachable from start_nodes
+
+    Returns the GraphNodes of the start nodes which are not the children of
+    any other node. get_child_nodes_func is called once for every node, up
+    to max_concurrency calls at a time, so that building the graph takes
+    time proportional to its depth rather than to its number of nodes.
+    """
+    start_nodes = list(start_nodes)
+    children_map = _discover_children(start_nodes, get_child_nodes_func,
+                                      max_concurrency)
+    finished_nodes = _assemble_graph(start_nodes, children_map)
 
-    LOG.trace("Change to gray: %s", node)
-    encountered_set.add(node)
-    child_nodes = context.get_child_nodes(node)
-    LOG.trace("Child nodes are %s", child_nodes)
     # If we found a parent than this is not a source
-    source_set.difference_update(child_nodes)
-    child_list = []
-    for child_node in child_nodes:
-        child_list.append(_build_graph_rec(context, child_node))
-
-    LOG.trace("Change to black: %s", node)
-    encountered_set.discard(node)
-    graph_node = GraphNode(value=node, child_nodes=tuple(child_list))
-    finished_nodes[node] = graph_node
-
-    return graph_node
-
-
-def build_graph(start_nodes, get_child_nodes_func):
-    context = _GraphBuilderContext(
-        source_set=set(start_nodes),
-        encountered_set=set(),
-        finished_nodes={},
-        get_child_nodes=get_child_nodes_func,
-    )
+    source_set = set(start_nodes)
+    for child_nodes in children_map.values():
+        source_set.difference_update(child_nodes)
 
-    result = []
-    for node in start_nodes:
-        result.append(_build_graph_rec(context, node))
-
-    assert(len(context.encountered_set) == 0)
-
-    return [item for item in result if item.value in context.source_set]
+    return [finished_nodes[node] for node in start_nodes
+            if node in source_set]
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -110,9 +149,17 @@ class GraphWalkerListener(object):
 
 
 class GraphWalker(object):
-    def __init__(self):
+    """Walk a graph depth first, notifying the registered listeners
+
+    Every node is entered each time it is reached through one of its parents.
+    When walk_visited_children is False, the children of a node which was
+    already visited are not walked again, so that walking a graph takes time
+    proportional to its number of edges.
+    """
+    def __init__(self, walk_visited_children=True):
         super(GraphWalker, self).__init__()
         self._listeners = []
+        self._walk_visited_children = walk_visited_children
 
     def register_listener(self, graph_walker_listener):
         self._listeners.append(graph_walker_listener)
@@ -121,75 +168,118 @@ class GraphWalker(object):
         self._listeners.remove(graph_walker_listener)
 
     def walk_graph(self, source_nodes):
-        self._walk_graph(source_nodes, set())
-
-    def _walk_graph(self, source_nodes, visited_nodes):
-        for node in source_nodes:
-            for listener in self._listeners:
-                listener.on_node_enter(node, node in visited_nodes)
-                visited_nodes.add(node)
-
-            self._walk_graph(node.child_nodes, visited_nodes)
-
-            for listener in self._listeners:
-                listener.on_node_exit(node)
-
-
-class PackGraphWalker(GraphWalkerListener):
-    """Pack a list of GraphNode
-
-    Allocate a serialized id (sid) for every node and build an adjacency list,
-    suitable for graph unpacking.
+        # Nodes are tracked by identity, hashing a GraphNode hashes all of
+        # its descendants
+        visited_nodes = set()
+        path = []
+        stack = [iter(source_nodes)]
+        while stack:
+            for node in stack[-1]:
+                already_visited = id(node) in visited_nodes
+                for listener in self._listeners:
+                    listener.on_node_enter(node, already_visited)
+                visited_nodes.add(id(node))
+
+                path.append(node)
+                if already_visited and not self._walk_visited_children:
+                    stack.append(iter(()))
+                else:
+                    stack.append(iter(node.child_nodes))
+                break
+            else:
+                stack.pop()
+                if stack:
+                    node = path.pop()
+                    for listener in self._listeners:
+                        listener.on_node_exit(node)
+
+
+def _pack_compact_graph(start_nodes):
+    """Return a CompactGraph from a list of GraphNodes
+
+    The nodes are numbered in depth first post order, so that the children of
+    a node always have a lower index than the node itself.
     """
-    def __init__(self, adjacency_list, nodes_dict):
-        super(PackGraphWalker, self).__init__()
-        self._sid_counter = 0
-        self._node_to_sid = {}
-        self._adjacency_list = adjacency_list
-        self._sid_to_node = nodes_dict
-
-    def on_node_enter(self, node, already_visited):
-        pass
-
-    def on_node_exit(self, node):
-        def key_serialize(key):
-            return hex(key)
-
-        if node not in self._node_to_sid:
-            node_sid = self._sid_counter
-            self._sid_counter += 1
-            self._node_to_sid[node] = node_sid
-            self._sid_to_node[key_serialize(node_sid)] = node.value
-
-            if len(node.child_nodes) > 0:
-                children_sids = map(lambda node:
-                                    key_serialize(self._node_to_sid[node]),
-                                    node.child_nodes)
-                self._adjacency_list.append(
-                    (key_serialize(node_sid), tuple(children_sids))
-                )
-
-
-def pack_graph(start_nodes):
+    nodes = []
+    offsets = array.array('l', [0])
+    children = array.array('l')
+    node_to_index = {}
+    for start_node in start_nodes:
+        if id(start_node) in node_to_index:
+            continue
+        stack = [(start_node, iter(start_node.child_nodes))]
+        while stack:
+            node, child_nodes = stack[-1]
+            for child_node in child_nodes:
+                if id(child_node) not in node_to_index:
+                    stack.append((child_node, iter(child_node.child_nodes)))
+                    break
+            else:
+                stack.pop()
+                node_to_index[id(node)] = len(nodes)
+                nodes.append(node.value)
+                children.extend(node_to_index[id(child_node)]
+                                for child_node in node.child_nodes)
+                offsets.append(len(children))
+    return CompactGraph(nodes, offsets, children)
+
+
+def _compact_to_packed_graph(compact_graph):
+    nodes, offsets, children = compact_graph
+    sids = [hex(index) for index in range(len(nodes))]
+    adjacency = tuple(
+        (sids[index], tuple(sids[child_index] for child_index
+                            in children[offsets[index]:offsets[index + 1]]))
+        for index in range(len(nodes))
+        if offsets[index] != offsets[index + 1])
+    return PackedGraph(dict(zip(sids, nodes)), adjacency)
+
+
+def pack_graph(start_nodes, compact=False):
     """Return a PackedGraph from a list of GraphNodes
 
     Packs a graph into a flat PackedGraph (nodes dictionary, adjacency list).
+    When compact is True a CompactGraph is returned instead: a list of nodes
+    and the offsets into a single array of child node indices.
     """
-    walker = GraphWalker()
-    nodes_dict = {}
-    adjacency_list = []
-    packer = PackGraphWalker(adjacency_list, nodes_dict)
-    walker.register_listener(packer)
-    walker.walk_graph(start_nodes)
-    return PackedGraph(nodes_dict, tuple(adjacency_list))
+    compact_graph = _pack_compact_graph(start_nodes)
+    if compact:
+        return compact_graph
+    return _compact_to_packed_graph(compact_graph)
+
+
+def _unpack_compact_graph(compact_graph):
+    nodes, offsets, children = compact_graph
+    if len(offsets) != len(nodes) + 1:
+        raise exception.InvalidInput(
+            reason=_("CompactGraph must have an offset for every node"))
+
+    graph_nodes = []
+    has_parent = bytearray(len(nodes))
+    for index, value in enumerate(nodes):
+        child_indices = children[offsets[index]:offsets[index + 1]]
+        for child_index in child_indices:
+            if not 0 <= child_index < index:
+                raise exception.InvalidInput(
+                    reason=_("CompactGraph nodes must be topologically "
+                             "ordered"))
+            has_parent[child_index] = 1
+        graph_nodes.append(GraphNode(
+            value, tuple(graph_nodes[child_index]
+                         for child_index in child_indices)))
+    return [graph_node for graph_node, node_has_parent
+            in zip(graph_nodes, has_parent) if not node_has_parent]
 
 
 def unpack_graph(packed_graph):
-    """Return a list of GraphNodes from a PackedGraph
+    """Return a list of GraphNodes from a PackedGraph or a CompactGraph
 
     Unpacks a PackedGraph, which must have the property: each parent node in
     the adjacency list appears after its children.
     """
+    if isinstance(packed_graph, CompactGraph):
+        return _unpack_compact_graph(packed_graph)
+
     (nodes, adjacency_list) = packed_graph
     nodes_dict = dict(nodes)
     graph_nodes_dict = {}
@@ -217,21 +307,85 @@ def unpack_graph(packed_graph):
     return result_nodes
 
 
-def serialize_resource_graph(resource_graph):
-    packed_resource_graph = pack_graph(resource_graph)
-    return jsonutils.dumps(
-        packed_resource_graph,
-        default=lambda r: (r.type, r.id, r.name, r.extra_info))
+def _encode_compact_graph(compact_graph):
+    """Encode a CompactGraph of resources
+
+    The resource types are interned into a list, which the nodes refer to by
+    index.
+    """
+    nodes, offsets, children = compact_graph
+    types = []
+    type_indices = {}
+    compact_nodes = []
+    for resource in nodes:
+        type_index = type_indices.get(resource.type)
+        if type_index is None:
+            type_index = type_indices[resource.type] = len(types)
+            types.append(resource.type)
+        compact_nodes.append((type_index, resource.id, resource.name,
+                              resource.extra_info))
+    return (_COMPACT_GRAPH_VERSION, types, compact_nodes, offsets.tolist(),
+            children.tolist())
+
+
+def _load_graph(serialized_resource_graph):
+    """Return the packed graph of resources of a serialized resource graph
+
+    Returns a CompactGraph for the compact encoding, and a PackedGraph for
+    the JSON one.
+    """
+    if not serialized_resource_graph.startswith(_COMPACT_GRAPH_PREFIX):
+        deserialized_graph = jsonutils.loads(serialized_resource_graph)
+        nodes = {sid: Resource(type=node[0], id=node[1], name=node[2],
+                               extra_info=node[3])
+                 for sid, node in deserialized_graph[0].items()}
+        return PackedGraph(nodes=nodes, adjacency=deserialized_graph[1])
+
+    payload = base64.b64decode(
+        serialized_resource_graph[len(_COMPACT_GRAPH_PREFIX):])
+    encoded_graph = msgpackutils.loads(payload)
+    version, types, compact_nodes = encoded_graph[:3]
+    if version != _COMPACT_GRAPH_VERSION:
+        raise exception.InvalidInput(
+            reason=_("Unsupported compact resource graph version: %s") %
+            version)
+    nodes = [Resource(type=types[node[0]], id=node[1], name=node[2],
+                      extra_info=node[3])
+             for node in compact_nodes]
+    return CompactGraph(nodes=nodes, offsets=encoded_graph[3],
+                        children=encoded_graph[4])
+
+
+def serialize_resource_graph(resource_graph, compact=False):
+    """Serialize a resource graph into a string
+
+    The default encoding is the JSON of the packed graph. The compact
+    encoding is a versioned msgpack payload with interned resource types
+    and integer sids, which is smaller and faster to load for large graphs.
+    Both are understood by deserialize_resource_graph.
+    """
+    if not compact:
+        return jsonutils.dumps(
+            pack_graph(resource_graph),
+            default=lambda r: (r.type, r.id, r.name, r.extra_info))
+
+    payload = msgpackutils.dumps(
+        _encode_compact_graph(pack_graph(resource_graph, compact=True)))
+    return _COMPACT_GRAPH_PREFIX + base64.b64encode(payload).decode('ascii')
 
 
 def deserialize_resource_graph(serialized_resource_graph):
-    deserialized_graph = jsonutils.loads(serialized_resource_graph)
-    packed_resource_graph = PackedGraph(nodes=deserialized_graph[0],
-                                        adjacency=deserialized_graph[1])
-    for sid, node in packed_resource_graph.nodes.items():
-        packed_resource_graph.nodes[sid] = Resource(type=node[0],
-                                                    id=node[1],
-                                                    name=node[2],
-                                                    extra_info=node[3])
+    packed_resource_graph = _load_graph(serialized_resource_graph)
     resource_graph = unpack_graph(packed_resource_graph)
     return resource_graph
+
+
+def deserialize_resource_graph_resources(serialized_resource_graph):
+    """Return the resources of a serialized resource graph
+
+    Unlike deserialize_resource_graph the graph is not unpacked.
+    """
+    nodes = _load_graph(serialized_resource_graph).nodes
+    if isinstance(nodes, dict):
+        return list(nodes.values())
+    return list(nodes)
@@ -15,22 +15,33 @@ Protection Service
 """
 
 from datetime import datetime
+from functools import partial
+
 from eventlet import greenpool
-from eventlet import greenthread
 import six
 
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_service import periodic_task
 
+from oslo_utils import strutils
 from oslo_utils import uuidutils
 
 from karbor.common import constants
+from karbor import context as karbor_context
+from karbor import db
 from karbor import exception
 from karbor.i18n import _
 from karbor import manager
 from karbor.resource import Resource
+from karbor.services.protection.checkpoint import \
+    checkpoint_record_to_summary
+from karbor.services.protection.checkpoint import load_extra_info
+from karbor.services.protection.checkpoint import update_checkpoint_record
 from karbor.services.protection.flows import worker as flow_manager
+from karbor.services.protection import governor
+from karbor.services.protection import operation_queue
 from karbor.services.protection.protectable_registry import ProtectableRegistry
 from karbor import utils
 
@@ -44,7 +55,15 @@ protection_manager_opts = [
                default=0,
                help='number of maximum concurrent operation (protect, restore,'
                     ' delete) flows. 0 means no hard limit'
-               )
+               ),
+    cfg.IntOpt('operation_queue_timeout',
+               default=0,
+               min=0,
+               help='Maximum number of seconds an operation flow waits for '
+                    'one of the max_concurrent_operations to start. An '
+                    'operation expected to wait longer is rejected at once, '
+                    'and an operation still waiting after it fails. 0 means '
+                    'no limit'),
 ]
 
 CONF = cfg.CONF
@@ -52,6 +71,18 @@ CONF.register_opts(protection_manager_opts)
 
 PROVIDER_NAMESPACE = 'karbor.provider'
 
+# The checkpoint sort keys and the checkpoint record columns they sort by
+CHECKPOINT_SORT_KEYS = {
+    "id": "id",
+    "status": "checkpoint_status",
+    "plan_id": "plan_id",
+    "project_id": "project_id",
+    "created_at": "created_at",
+}
+
+# The number of checkpoints read at once to refresh their records
+CHECKPOINT_REFRESH_CONCURRENCY = 8
+
 
 class ProtectionManager(manager.Manager):
     """karbor Protection Manager."""
@@ -69,25 +100,178 @@ class ProtectionManager(manager.Manager):
         self.protectable_registry = ProtectableRegistry()
         self.protectable_registry.load_plugins()
         self.worker = flow_manager.Worker()
-        self._greenpool = None
-        self._greenpool_size = CONF.max_concurrent_operations
-        if self._greenpool_size != 0:
-            self._greenpool = greenpool.GreenPool(self._greenpool_size)
-
-    def _spawn(self, func, *args, **kwargs):
-        if self._greenpool is not None:
-            return self._greenpool.spawn_n(func, *args, **kwargs)
-        else:
-            return greenthread.spawn_n(func, *args, **kwargs)
+        # Restores start first, then manual protections, then scheduled
+        # protections and deletions
+        self._operation_queue = operation_queue.OperationQueue(
+            CONF.max_concurrent_operations, CONF.operation_queue_timeout)
+
+    def _spawn(self, priority, context, func, *args, **kwargs):
+        return self._operation_queue.submit(
+            priority, getattr(context, 'project_id', None), func, *args,
+            **kwargs)
+
+    @staticmethod
+    def _get_protect_priority(checkpoint_properties):
+        extra_info = load_extra_info(
+            (checkpoint_properties or {}).get('extra_info'))
+        if (extra_info.get(constants.CHECKPOINT_CREATE_BY) ==
+                constants.OPERATION_ENGINE):
+            return operation_queue.PRIORITY_SCHEDULED_PROTECT
+        return operation_queue.PRIORITY_PROTECT
+
+    @staticmethod
+    def _fail_checkpoint(checkpoint, status):
+        checkpoint.status = status
+        checkpoint.commit()
+
+    def _expire_flow(self, checkpoint, status, flow_detail=None, flow=None):
+        """Fail the checkpoint of a flow dropped from the queue
+
+        The flow is no longer persisted, so that it is not resumed.
+        """
+        if flow_detail is not None:
+            self.worker.discard_flow(flow_detail)
+        if flow is not None:
+            self.worker.discard_engine(flow)
+        self._fail_checkpoint(checkpoint, status)
+
+    @staticmethod
+    def _fail_restore(restore):
+        restore['status'] = constants.RESTORE_STATUS_FAILURE
+        restore.save()
+
+    @periodic_task.periodic_task
+    def _report_operation_stats(self, context):
+        """Log the operation queue and the per provider operation limits
+
+        Both are logged at info level while operations wait.
+        """
+        stats = self._operation_queue.get_stats()
+        log = LOG.info if stats['queued'] else LOG.debug
+        log("%(running)d operations running, %(queued)d queued, estimated "
+            "waits of new operations in seconds: %(waits)s",
+            {'running': stats['running'], 'queued': len(stats['queued']),
+             'waits': stats['estimated_waits']})
+        for queued in stats['queued']:
+            log("Queued %(priority)s operation of project %(project_id)s "
+                "at position %(position)d, waiting for %(wait)d seconds",
+                queued)
+        for name, limiter in sorted(
+                governor.get_governor().get_stats().items()):
+            log = LOG.info if limiter['waiting'] else LOG.debug
+            log("Operation limit %(name)s: %(active)d running, %(waiting)d "
+                "waiting, concurrency %(concurrency)s, rate %(rate)s",
+                dict(limiter, name=name))
 
     def init_host(self, **kwargs):
         """Handle initialization if this is a standalone service"""
-        # TODO(wangliuan)
         LOG.info("Starting protection service")
+        resumed = self._resume_flows()
+        self._fail_orphaned_checkpoints(resumed)
+
+    def reset(self):
+        LOG.info("Reloading the protection plugins")
+        self.provider_registry.reload_plugins()
+
+    def _resume_flows(self):
+        """Resume the unfinished flows of this host
+
+        Returns the ids of the checkpoints of the resumed flows.
+        """
+        resumed = set()
+        for flow_detail in self.worker.get_unfinished_flows():
+            meta = flow_detail.meta
+            operation_type = meta.get('operation_type')
+            if operation_type == constants.OPERATION_DELETE:
+                priority = operation_queue.PRIORITY_DELETE
+                failed_status = constants.CHECKPOINT_STATUS_ERROR_DELETING
+            else:
+                priority = operation_queue.PRIORITY_PROTECT
+                failed_status = constants.CHECKPOINT_STATUS_ERROR
+            LOG.info("Resuming the %(operation)s flow of checkpoint "
+                     "%(checkpoint)s",
+                     {'operation': operation_type,
+                      'checkpoint': meta.get('checkpoint_id')})
+            checkpoint = None
+            try:
+                context = self.worker.get_flow_context(flow_detail)
+                provider = self.provider_registry.show_provider(
+                    meta['provider_id'])
+                checkpoint = provider.get_checkpoint(meta['checkpoint_id'])
+                if (operation_type == constants.OPERATION_PROTECT and
+                        'operation_log_id' not in meta):
+                    # Queued before its flow was built, the protection
+                    # starts over
+                    func, args = self._protect, (context, meta['plan'],
+                                                 provider, checkpoint,
+                                                 flow_detail)
+                else:
+                    flow = self.worker.get_resumed_flow(
+                        context, provider, checkpoint, flow_detail)
+                    func, args = self.worker.run_flow, (flow,)
+            except Exception:
+                LOG.exception("Failed to resume the %(operation)s flow of "
+                              "checkpoint %(checkpoint)s",
+                              {'operation': operation_type,
+                               'checkpoint': meta.get('checkpoint_id')})
+                self.worker.discard_flow(flow_detail)
+                if checkpoint is not None:
+                    try:
+                        self._fail_checkpoint(checkpoint, failed_status)
+                    except Exception:
+                        LOG.exception("Failed to set the status of "
+                                      "checkpoint %s", checkpoint.id)
+                continue
+            resumed.add(checkpoint.id)
+            self._spawn(priority, context, func, *args,
+                        on_expired=partial(self._expire_flow, checkpoint,
+                                           failed_status,
+                                           flow_detail=flow_detail))
+        return resumed
+
+    def _fail_orphaned_checkpoints(self, resumed):
+        """Fail the checkpoints left protecting or deleting by this host
+
+        Their operations were interrupted and not resumed, e.g. as flow
+        persistence is disabled, so they would never finish.
+        """
+        statuses = {
+            constants.CHECKPOINT_STATUS_PROTECTING:
+                constants.CHECKPOINT_STATUS_ERROR,
+            constants.CHECKPOINT_STATUS_DELETING:
+                constants.CHECKPOINT_STATUS_ERROR_DELETING,
+        }
+        ctxt = karbor_context.get_admin_context()
+        try:
+            records = db.checkpoint_record_get_all_by_filters_sort(
+                ctxt, {'checkpoint_status': list(statuses)})
+        except Exception:
+            LOG.exception("Failed to list the unfinished checkpoints")
+            return
+        for record in records:
+            if record['checkpoint_id'] in resumed:
+                continue
+            try:
+                provider = self.provider_registry.show_provider(
+                    record['provider_id'])
+                checkpoint = provider.get_checkpoint(record['checkpoint_id'])
+                if (checkpoint.host != CONF.host or
+                        checkpoint.status not in statuses):
+                    continue
+                LOG.warning("The %(status)s operation of checkpoint "
+                            "%(checkpoint)s was interrupted, marking it "
+                            "failed", {'status': checkpoint.status,
+                                       'checkpoint': checkpoint.id})
+                self._fail_checkpoint(checkpoint,
+                                      statuses[checkpoint.status])
+            except Exception:
+                LOG.exception("Failed to check the unfinished checkpoint %s",
+                              record['checkpoint_id'])
 
     @messaging.expected_exceptions(exception.InvalidPlan,
                                    exception.ProviderNotFound,
-                                   exception.FlowError)
+                                   exception.FlowError,
+                                   exception.OperationRejected)
     def protect(self, context, plan, checkpoint_properties=None):
         """create protection for the given plan
 
@@ -104,6 +288,8 @@ class ProtectionManager(manager.Manager):
         provider_id = plan.get('provider_id', None)
         plan_id = plan.get('id', None)
         provider = self.provider_registry.show_provider(provider_id)
+        priority = self._get_protect_priority(checkpoint_properties)
+        self._operation_queue.check_admission(priority)
         checkpoint_collection = provider.get_checkpoint_collection()
         try:
             checkpoint = checkpoint_collection.create(plan,
@@ -113,6 +299,25 @@ class ProtectionManager(manager.Manager):
             exc = exception.FlowError(flow="protect",
                                       error="Error creating checkpoint")
             six.raise_from(exc, e)
+        # The resource graph is built and the flow run once the protection
+        # starts, so that the checkpoint id is returned at once. Until then
+        # the protection is persisted, to be resumed after a restart.
+        try:
+            flow_detail = self.worker.persist_protect_flow(
+                context, plan, provider, checkpoint)
+        except Exception:
+            LOG.exception("Failed to persist the protection of checkpoint "
+                          "%s", checkpoint.id)
+            flow_detail = None
+        self._spawn(priority, context, self._protect, context, plan,
+                    provider, checkpoint, flow_detail,
+                    on_expired=partial(self._expire_flow, checkpoint,
+                                       constants.CHECKPOINT_STATUS_ERROR,
+                                       flow_detail=flow_detail))
+        return checkpoint.id
+
+    def _protect(self, context, plan, provider, checkpoint,
+                 flow_detail=None):
         try:
             flow = self.worker.get_flow(
                 context=context,
@@ -120,21 +325,28 @@ class ProtectionManager(manager.Manager):
                 operation_type=constants.OPERATION_PROTECT,
                 plan=plan,
                 provider=provider,
-                checkpoint=checkpoint)
-        except Exception as e:
+                checkpoint=checkpoint,
+                flow_detail=flow_detail)
+        except Exception:
             LOG.exception("Failed to create protection flow, plan: %s",
-                          plan_id)
-            raise exception.FlowError(
-                flow="protect",
-                error=e.msg if hasattr(e, 'msg') else 'Internal error')
-        self._spawn(self.worker.run_flow, flow)
-        return checkpoint.id
+                          plan.get('id'))
+            try:
+                if flow_detail is not None:
+                    self.worker.discard_flow(flow_detail)
+                self._fail_checkpoint(checkpoint,
+                                      constants.CHECKPOINT_STATUS_ERROR)
+            except Exception:
+                LOG.exception("Failed to set the status of checkpoint %s",
+                              checkpoint.id)
+            return
+        self.worker.run_flow(flow)
 
     @messaging.expected_exceptions(exception.ProviderNotFound,
                                    exception.CheckpointNotFound,
                                    exception.CheckpointNotAvailable,
                                    exception.FlowError,
-                                   exception.InvalidInput)
+                                   exception.InvalidInput,
+                                   exception.OperationRejected)
     def restore(self, context, restore, restore_auth):
         LOG.info("Starting restore service:restore action")
 
@@ -153,6 +365,8 @@ class ProtectionManager(manager.Manager):
             raise exception.CheckpointNotAvailable(
                 checkpoint_id=checkpoint_id)
 
+        self._operation_queue.check_admission(
+            operation_queue.PRIORITY_RESTORE)
         try:
             flow = self.worker.get_flow(
                 context=context,
@@ -167,7 +381,9 @@ class ProtectionManager(manager.Manager):
             raise exception.FlowError(
                 flow="restore",
                 error=_("Failed to create flow"))
-        self._spawn(self.worker.run_flow, flow)
+        self._spawn(operation_queue.PRIORITY_RESTORE, context,
+                    self.worker.run_flow, flow,
+                    on_expired=partial(self._fail_restore, restore))
 
     def validate_restore_parameters(self, restore, provider):
         parameters = restore["parameters"]
@@ -197,6 +413,7 @@ class ProtectionManager(manager.Manager):
                         "is invalid.")
                 raise exception.InvalidInput(reason=msg)
 
+    @messaging.expected_exceptions(exception.OperationRejected)
     def delete(self, context, provider_id, checkpoint_id):
         LOG.info("Starting protection service:delete action")
         LOG.debug('provider_id :%s checkpoint_id:%s', provider_id,
@@ -217,7 +434,9 @@ class ProtectionManager(manager.Manager):
         ]:
             raise exception.CheckpointNotBeDeleted(
                 checkpoint_id=checkpoint_id)
+        self._operation_queue.check_admission(operation_queue.PRIORITY_DELETE)
         checkpoint.status = constants.CHECKPOINT_STATUS_DELETING
+        checkpoint.host = CONF.host
         checkpoint.commit()
 
         try:
@@ -232,7 +451,12 @@ class ProtectionManager(manager.Manager):
             raise exception.KarborException(_(
                 "Failed to create delete checkpoint flow."
             ))
-        self._spawn(self.worker.run_flow, flow)
+        self._spawn(operation_queue.PRIORITY_DELETE, context,
+                    self.worker.run_flow, flow,
+                    on_expired=partial(
+                        self._expire_flow, checkpoint,
+                        constants.CHECKPOINT_STATUS_ERROR_DELETING,
+                        flow=flow))
 
     def start(self, plan):
         # TODO(wangliuan)
@@ -244,10 +468,13 @@ class ProtectionManager(manager.Manager):
 
     @messaging.expected_exceptions(exception.ProviderNotFound,
                                    exception.CheckpointNotFound,
-                                   exception.BankListObjectsFailed)
+                                   exception.CheckpointRecordNotFound,
+                                   exception.BankListObjectsFailed,
+                                   exception.InvalidInput)
     def list_checkpoints(self, context, provider_id, marker=None, limit=None,
                          sort_keys=None, sort_dirs=None, filters=None):
         LOG.info("Starting list checkpoints. provider_id:%s", provider_id)
+        filters = filters or {}
         plan_id = filters.get("plan_id", None)
         start_date = None
         end_date = None
@@ -259,14 +486,122 @@ class ProtectionManager(manager.Manager):
                 filters.get("end_date"), "%Y-%m-%d")
         sort_dir = None if sort_dirs is None else sort_dirs[0]
         provider = self.provider_registry.show_provider(provider_id)
-        checkpoint_ids = provider.list_checkpoints(
+        checkpoint_ids = None
+        if filters.get("resource_id"):
+            checkpoint_ids = self._list_checkpoint_ids_by_resource(
+                provider, filters.get("resource_type"),
+                filters["resource_id"])
+
+        if not strutils.bool_from_string(filters.get("resync", False)):
+            return self._list_checkpoint_records(
+                context, provider_id, marker, limit, sort_keys, sort_dirs,
+                filters, start_date, end_date, checkpoint_ids)
+
+        summaries = provider.list_checkpoint_summaries(
             provider_id, limit=limit, marker=marker, plan_id=plan_id,
             start_date=start_date, end_date=end_date, sort_dir=sort_dir)
-        checkpoints = []
-        for checkpoint_id in checkpoint_ids:
-            checkpoint = provider.get_checkpoint(checkpoint_id)
-            checkpoints.append(checkpoint.to_dict())
-        return checkpoints
+        for summary in summaries:
+            try:
+                update_checkpoint_record(context, summary)
+            except Exception as err:
+                LOG.warning("Failed resyncing the record of checkpoint "
+                            "%(id)s: %(err)s",
+                            {'id': summary['id'], 'err': err})
+
+        # The page is listed from the bank before the resource and status
+        # filters, which are applied to the summaries
+        if checkpoint_ids is not None:
+            checkpoint_ids = set(checkpoint_ids)
+            summaries = [summary for summary in summaries
+                         if summary["id"] in checkpoint_ids]
+        statuses = self._get_status_filter(filters)
+        if statuses is not None:
+            summaries = [summary for summary in summaries
+                         if summary["status"] in statuses]
+        return summaries
+
+    @staticmethod
+    def _get_status_filter(filters):
+        status = filters.get("status")
+        if not status:
+            return None
+        if isinstance(status, (list, tuple, set, frozenset)):
+            return list(status)
+        return [status]
+
+    def _list_checkpoint_ids_by_resource(self, provider, resource_type,
+                                         resource_id):
+        if resource_type:
+            resource_types = [resource_type]
+        else:
+            resource_types = self.protectable_registry.list_resource_types()
+        checkpoint_collection = provider.get_checkpoint_collection()
+        checkpoint_ids = []
+        for resource_type in resource_types:
+            checkpoint_ids.extend(checkpoint_collection.list_ids_by_resource(
+                resource_type, resource_id))
+        return checkpoint_ids
+
+    def _list_checkpoint_records(self, context, provider_id, marker, limit,
+                                 sort_keys, sort_dirs, filters, start_date,
+                                 end_date, checkpoint_ids=None):
+        record_filters = {"provider_id": provider_id,
+                          "start_date": start_date,
+                          "end_date": end_date}
+        for key in ("plan_id", "project_id"):
+            if filters.get(key):
+                record_filters[key] = filters[key]
+        if checkpoint_ids is not None:
+            record_filters["id"] = checkpoint_ids
+        statuses = self._get_status_filter(filters)
+        if statuses is not None:
+            record_filters["checkpoint_status"] = statuses
+
+        record_sort_keys = []
+        for sort_key in sort_keys or ["created_at"]:
+            if sort_key not in CHECKPOINT_SORT_KEYS:
+                msg = _("Invalid checkpoint sort key: %s") % sort_key
+                raise exception.InvalidInput(reason=msg)
+            record_sort_keys.append(CHECKPOINT_SORT_KEYS[sort_key])
+        # Checkpoints are listed oldest first unless asked otherwise
+        sort_dirs = sort_dirs or ["asc"]
+
+        records = db.checkpoint_record_get_all_by_filters_sort(
+            context, record_filters, limit=limit, marker=marker,
+            sort_keys=record_sort_keys, sort_dirs=sort_dirs)
+        summaries = [checkpoint_record_to_summary(record)
+                     for record in records]
+        outdated = [summary for summary in summaries
+                    if "resource_graph" not in summary]
+        if outdated:
+            self._refresh_checkpoint_records(context, provider_id, outdated)
+        return summaries
+
+    def _refresh_checkpoint_records(self, context, provider_id, summaries):
+        """Complete the summaries of records written by older releases
+
+        Their resource graph is read from the checkpoints, in parallel,
+        and written to their records.
+        """
+        provider = self.provider_registry.show_provider(provider_id)
+
+        def _refresh(summary):
+            try:
+                checkpoint_summary = provider.get_checkpoint(
+                    summary["id"]).to_summary_dict()
+                summary["resource_graph"] = checkpoint_summary[
+                    "resource_graph"]
+                update_checkpoint_record(context, checkpoint_summary)
+            except Exception as err:
+                summary["resource_graph"] = None
+                LOG.warning("Failed refreshing the record of checkpoint "
+                            "%(id)s: %(err)s",
+                            {'id': summary["id"], 'err': err})
+
+        pool = greenpool.GreenPool(CHECKPOINT_REFRESH_CONCURRENCY)
+        for summary in summaries:
+            pool.spawn_n(_refresh, summary)
+        pool.waitall()
 
     @messaging.expected_exceptions(exception.ProviderNotFound,
                                    exception.CheckpointNotFound)
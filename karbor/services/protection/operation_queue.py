@@ -0,0 +1,214 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import itertools
+import math
+import time
+
+import eventlet
+from eventlet import greenthread
+from oslo_log import log as logging
+
+from karbor import exception
+from karbor.services.protection import status_poller
+
+LOG = logging.getLogger(__name__)
+
+# The operations of a lower priority value are started first
+PRIORITIES = (
+    PRIORITY_RESTORE,
+    PRIORITY_PROTECT,
+    PRIORITY_SCHEDULED_PROTECT,
+    PRIORITY_DELETE,
+) = range(4)
+
+PRIORITY_NAMES = {
+    PRIORITY_RESTORE: 'restore',
+    PRIORITY_PROTECT: 'protect',
+    PRIORITY_SCHEDULED_PROTECT: 'scheduled protect',
+    PRIORITY_DELETE: 'delete',
+}
+
+_DURATION_KEY = 'protection_manager.operation'
+
+
+class _QueuedOperation(object):
+    def __init__(self, sequence, priority, project_id, func, args,
+                 on_expired):
+        super(_QueuedOperation, self).__init__()
+        self.sequence = sequence
+        self.priority = priority
+        self.project_id = project_id
+        self.func = func
+        self.args = args
+        self.on_expired = on_expired
+        self.queued_at = time.time()
+
+
+class OperationQueue(object):
+    """Admission queue in front of the operation flows
+
+    At most concurrency operations run at once, 0 meaning no limit. The
+    others wait in the queue, by priority, then with a fair share between
+    the projects, then in their order of arrival. When timeout is set,
+    an operation expected to wait longer than timeout is rejected at once,
+    and an operation still waiting after timeout is dropped.
+    """
+
+    def __init__(self, concurrency=0, timeout=0):
+        super(OperationQueue, self).__init__()
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._queued = []
+        self._running = 0
+        self._running_by_project = collections.Counter()
+        self._sequence = itertools.count()
+
+    def _get_ahead(self, priority):
+        return sum(1 for operation in self._queued
+                   if operation.priority <= priority)
+
+    def estimate_wait(self, priority):
+        """Estimate the wait of a new operation of this priority
+
+        Returns None when no operation has completed yet to base the
+        estimate on.
+        """
+        if not self.concurrency:
+            return 0
+        slots = self._get_ahead(priority) + 1 - (self.concurrency -
+                                                 self._running)
+        if slots <= 0:
+            return 0
+        duration = status_poller.get_completion_times().expected_duration(
+            _DURATION_KEY)
+        if duration is None:
+            return None
+        return math.ceil(float(slots) / self.concurrency) * duration
+
+    def check_admission(self, priority):
+        """Raise OperationRejected if the operation would wait too long"""
+        if not self.timeout:
+            return
+        wait = self.estimate_wait(priority)
+        if wait is not None and wait > self.timeout:
+            raise exception.OperationRejected(
+                operation=PRIORITY_NAMES[priority], wait=int(wait),
+                timeout=self.timeout)
+
+    def submit(self, priority, project_id, func, *args, **kwargs):
+        """Queue func to be run with args
+
+        The operation is always queued, callers check its admission with
+        check_admission before changing any state. on_expired, if given, is
+        called when the operation is dropped from the queue after waiting
+        too long.
+        """
+        operation = _QueuedOperation(next(self._sequence), priority,
+                                     project_id, func, args,
+                                     kwargs.get('on_expired'))
+        self._queued.append(operation)
+        if self.concurrency and self._running >= self.concurrency:
+            LOG.info("Queued %(operation)s operation at position "
+                     "%(position)d, %(running)d operations running",
+                     {'operation': PRIORITY_NAMES[priority],
+                      'position': self._get_ahead(priority),
+                      'running': self._running})
+        if self.timeout:
+            eventlet.spawn_after(self.timeout, self._dispatch)
+        self._dispatch()
+        return operation
+
+    def _expire(self):
+        now = time.time()
+        expired = [operation for operation in self._queued
+                   if now - operation.queued_at >= self.timeout]
+        for operation in expired:
+            self._queued.remove(operation)
+            LOG.warning("Dropped %(operation)s operation after waiting "
+                        "%(wait)d seconds to start",
+                        {'operation': PRIORITY_NAMES[operation.priority],
+                         'wait': now - operation.queued_at})
+            if operation.on_expired is not None:
+                try:
+                    operation.on_expired()
+                except Exception:
+                    LOG.exception("Failed handling the drop of an "
+                                  "operation")
+
+    def _dispatch(self):
+        if self.timeout:
+            self._expire()
+        while self._queued and (not self.concurrency or
+                                self._running < self.concurrency):
+            operation = min(self._queued, key=lambda operation: (
+                operation.priority,
+                self._running_by_project[operation.project_id],
+                operation.sequence))
+            self._queued.remove(operation)
+            self._running += 1
+            self._running_by_project[operation.project_id] += 1
+            greenthread.spawn_n(self._run, operation)
+
+    def _run(self, operation):
+        started_at = time.time()
+        LOG.debug("Starting %(operation)s operation after waiting "
+                  "%(wait).1f seconds",
+                  {'operation': PRIORITY_NAMES[operation.priority],
+                   'wait': started_at - operation.queued_at})
+        try:
+            operation.func(*operation.args)
+        finally:
+            status_poller.get_completion_times().record(
+                _DURATION_KEY, time.time() - started_at)
+            self._running -= 1
+            self._running_by_project[operation.project_id] -= 1
+            if not self._running_by_project[operation.project_id]:
+                del self._running_by_project[operation.project_id]
+            self._dispatch()
+
+    def get_position(self, operation):
+        """Return the number of operations queued ahead of this one
+
+        These are the queued operations of a higher priority, and those of
+        the same priority queued before. Returns None when the operation is
+        no longer queued.
+        """
+        if operation not in self._queued:
+            return None
+        return sum(1 for other in self._queued
+                   if (other.priority, other.sequence) <
+                   (operation.priority, operation.sequence))
+
+    def get_stats(self):
+        """Return the running operations and the waits of the queued ones
+
+        estimated_waits are the waits estimated for a new operation of each
+        priority, None when there is nothing to estimate them from yet.
+        """
+        now = time.time()
+        return {
+            'concurrency': self.concurrency,
+            'running': self._running,
+            'estimated_waits': {PRIORITY_NAMES[priority]:
+                                self.estimate_wait(priority)
+                                for priority in PRIORITIES},
+            'queued': [{
+                'priority': PRIORITY_NAMES[operation.priority],
+                'project_id': operation.project_id,
+                'position': self.get_position(operation),
+                'wait': now - operation.queued_at,
+            } for operation in sorted(
+                self._queued, key=lambda operation: (operation.priority,
+                                                     operation.sequence))],
+        }
@@ -70,3 +70,19 @@ class ProtectablePlugin(object):
         :return: the list of dependent resource instances.
         """
         pass
+
+    def get_dependent_resources_index(self, context):
+        """Index the dependent resource instances by their parent resources.
+
+        Optional. Plugins which find the dependent resources of a parent
+        resource by listing all their resource instances can list them once
+        here, and the registry answers the dependent resources of every
+        parent resource of a graph build from this index.
+
+        :return: a dict of parent resource types to dicts of parent resource
+                 ids to the lists of their dependent resource instances.
+                 Parent resources missing from the dict of their type have no
+                 dependent resource instances. Parent resource types missing
+                 from the returned dict are not indexed.
+        """
+        return {}
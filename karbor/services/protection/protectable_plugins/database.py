@@ -88,3 +88,21 @@ class DatabaseInstanceProtectablePlugin(protectable_plugin.ProtectablePlugin):
                     for instance in instances
                     if instance.project_id == parent_resource.id
                     and instance.status not in INVALID_INSTANCE_STATUS]
+
+    def get_dependent_resources_index(self, context):
+        try:
+            instances = self._client(context).instances.list()
+        except Exception as e:
+            LOG.exception("List all database instances from trove failed.")
+            raise exception.ListProtectableResourceFailed(
+                type=self._SUPPORT_RESOURCE_TYPE,
+                reason=six.text_type(e))
+
+        by_project = {}
+        for instance in instances:
+            if instance.status not in INVALID_INSTANCE_STATUS:
+                by_project.setdefault(instance.project_id, []).append(
+                    resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
+                                      id=instance.id,
+                                      name=instance.name))
+        return {constants.PROJECT_RESOURCE_TYPE: by_project}
@@ -129,3 +129,23 @@ class ImageProtectablePlugin(protectable_plugin.ProtectablePlugin):
                                                             parent_resource)
 
         return []
+
+    def get_dependent_resources_index(self, context):
+        # The image of each server is found with a server get, so only the
+        # images of projects are indexed
+        try:
+            images = self._glance_client(context).images.list()
+        except Exception as e:
+            LOG.exception("List all images from glance failed.")
+            raise exception.ListProtectableResourceFailed(
+                type=self._SUPPORT_RESOURCE_TYPE,
+                reason=six.text_type(e))
+
+        by_project = {}
+        for image in images:
+            if image.status not in INVALID_IMAGE_STATUS:
+                by_project.setdefault(image.owner, []).append(
+                    resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
+                                      id=image.id,
+                                      name=image.name))
+        return {constants.PROJECT_RESOURCE_TYPE: by_project}
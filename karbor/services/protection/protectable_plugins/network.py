@@ -154,3 +154,26 @@ class NetworkProtectablePlugin(protectable_plugin.ProtectablePlugin):
                                                             parent_resource)
 
         return []
+
+    def get_dependent_resources_index(self, context):
+        # The interfaces of the servers are their ports, so the servers with
+        # a port on one of the networks depend on the network topology
+        try:
+            net_client = self._neutron_client(context)
+            network_infos = net_client.list_networks().get('networks')
+            ports = net_client.list_ports().get('ports')
+        except Exception as e:
+            LOG.exception("List all networks and ports from neutron failed.")
+            raise exception.ListProtectableResourceFailed(
+                type=self._SUPPORT_RESOURCE_TYPE,
+                reason=six.text_type(e))
+
+        neutron_networks = {network["id"] for network in network_infos}
+        network_topology = [resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
+                                              id=self._get_network_id(),
+                                              name="Network Topology")]
+        by_server = {port["device_id"]: network_topology
+                     for port in ports
+                     if port.get("device_id") and
+                     port["network_id"] in neutron_networks}
+        return {constants.SERVER_RESOURCE_TYPE: by_server}
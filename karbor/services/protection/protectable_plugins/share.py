@@ -90,3 +90,21 @@ class ShareProtectablePlugin(protectable_plugin.ProtectablePlugin):
                     for share in shares
                     if share.project_id == parent_resource.id
                     and share.status not in INVALID_SHARE_STATUS]
+
+    def get_dependent_resources_index(self, context):
+        try:
+            shares = self._client(context).shares.list()
+        except Exception as e:
+            LOG.exception("List all shares from manila failed.")
+            raise exception.ListProtectableResourceFailed(
+                type=self._SUPPORT_RESOURCE_TYPE,
+                reason=six.text_type(e))
+
+        by_project = {}
+        for share in shares:
+            if share.status not in INVALID_SHARE_STATUS:
+                by_project.setdefault(share.project_id, []).append(
+                    resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
+                                      id=share.id,
+                                      name=share.name))
+        return {constants.PROJECT_RESOURCE_TYPE: by_project}
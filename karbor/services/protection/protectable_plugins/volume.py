@@ -101,3 +101,25 @@ class VolumeProtectablePlugin(protectable_plugin.ProtectablePlugin):
                 type=self._SUPPORT_RESOURCE_TYPE, id=vol.id, name=vol.name,
                 extra_info={'availability_zone': vol.availability_zone})
                 for vol in volumes if _is_attached_to(vol)]
+
+    def get_dependent_resources_index(self, context):
+        try:
+            volumes = self._client(context).volumes.list(detailed=True)
+        except Exception as e:
+            LOG.exception("List all detailed volumes from cinder failed.")
+            raise exception.ListProtectableResourceFailed(
+                type=self._SUPPORT_RESOURCE_TYPE,
+                reason=six.text_type(e))
+
+        by_server = {}
+        by_project = {}
+        for vol in volumes:
+            vol_resource = resource.Resource(
+                type=self._SUPPORT_RESOURCE_TYPE, id=vol.id, name=vol.name,
+                extra_info={'availability_zone': vol.availability_zone})
+            for server_id in {s.get('server_id') for s in vol.attachments}:
+                by_server.setdefault(server_id, []).append(vol_resource)
+            tenant_id = getattr(vol, 'os-vol-tenant-attr:tenant_id', None)
+            by_project.setdefault(tenant_id, []).append(vol_resource)
+        return {constants.SERVER_RESOURCE_TYPE: by_server,
+                constants.PROJECT_RESOURCE_TYPE: by_project}
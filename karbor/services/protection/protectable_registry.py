@@ -10,15 +10,31 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+from eventlet import semaphore
+
 from karbor import exception
 from karbor.exception import ListProtectableResourceFailed
 from karbor.i18n import _
 from karbor.services.protection.graph import build_graph
 import six
 
+from oslo_config import cfg
 from oslo_log import log as logging
 from stevedore import extension
 
+protectable_registry_opts = [
+    cfg.IntOpt('graph_build_concurrency',
+               default=16,
+               min=1,
+               help='Number of resources whose dependent resources are '
+                    'fetched concurrently when building the resource graph '
+                    'of a plan'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(protectable_registry_opts)
+
 LOG = logging.getLogger(__name__)
 
 
@@ -31,6 +47,47 @@ def _raise_extension_exception(extmanager, ep, err):
                                       error=six.text_type(err))
 
 
+class DependentResourcesCache(object):
+    """Answers the dependent resources of parent resources from indices
+
+    The dependent resources index of each protectable is listed once, the
+    first time the dependent resources of its type are looked up, and
+    answers the lookups of all the parent resources it indexes.
+    """
+
+    def __init__(self):
+        super(DependentResourcesCache, self).__init__()
+        self._indices = {}
+        self._locks = collections.defaultdict(semaphore.Semaphore)
+
+    def _get_index(self, context, protectable):
+        resource_type = protectable.get_resource_type()
+        with self._locks[resource_type]:
+            if resource_type not in self._indices:
+                try:
+                    self._indices[resource_type] = \
+                        protectable.get_dependent_resources_index(context)
+                except ListProtectableResourceFailed as e:
+                    LOG.warning("Index dependent resources of type %(type)s "
+                                "failed, so look them up one by one. "
+                                "Error: %(err)s",
+                                {'type': resource_type, 'err': e})
+                    self._indices[resource_type] = {}
+            return self._indices[resource_type]
+
+    def get_dependent_resources(self, context, protectable, parent_resource):
+        """Return the indexed dependent resources of parent_resource
+
+        Returns None when the protectable doesn't index the dependent
+        resources of parent resources of its type.
+        """
+        parent_index = self._get_index(context, protectable).get(
+            parent_resource.type)
+        if parent_index is None:
+            return None
+        return list(parent_index.get(parent_resource.id, ()))
+
+
 class ProtectableRegistry(object):
 
     def __init__(self):
@@ -93,10 +150,13 @@ class ProtectableRegistry(object):
         return protectable.show_resource(context, resource_id,
                                          parameters=parameters)
 
-    def fetch_dependent_resources(self, context, resource):
+    def fetch_dependent_resources(self, context, resource, cache=None):
         """List dependent resources under given parent resource.
 
         :param resource: The parent resource to list dependent resources.
+        :param cache: An optional DependentResourcesCache, answering the
+                      dependent resources of the protectables which index
+                      them.
         :return: The list of dependent resources.
         """
         result = []
@@ -106,8 +166,15 @@ class ProtectableRegistry(object):
                     context,
                     plugin.get_resource_type())
                 try:
-                    protectable_resources = \
-                        protectable.get_dependent_resources(context, resource)
+                    protectable_resources = None
+                    if cache is not None:
+                        protectable_resources = \
+                            cache.get_dependent_resources(
+                                context, protectable, resource)
+                    if protectable_resources is None:
+                        protectable_resources = \
+                            protectable.get_dependent_resources(context,
+                                                                resource)
                 except ListProtectableResourceFailed as e:
                     LOG.error("List resources failed, so skip it. "
                               "Error: {0}".format(e))
@@ -117,10 +184,15 @@ class ProtectableRegistry(object):
         return result
 
     def build_graph(self, context, resources):
+        # The dependent resources listed by the protectables are shared by
+        # all the resources of the graph
+        cache = DependentResourcesCache()
+
         def fetch_dependent_resources_context(resource):
-            return self.fetch_dependent_resources(context, resource)
+            return self.fetch_dependent_resources(context, resource, cache)
 
         return build_graph(
             start_nodes=resources,
             get_child_nodes_func=fetch_dependent_resources_context,
+            max_concurrency=CONF.graph_build_concurrency,
         )
@@ -12,6 +12,17 @@
 
 
 class Operation(object):
+    # The key of the limits of the hooks of this operation, naming the service
+    # and the operation, such as 'cinder.backup'. Defaults to the resource
+    # type and the operation type, such as 'os.cinder.volume.protect'.
+    concurrency_key = None
+    # The names of the attributes the hooks of this operation pass to each
+    # other, such as the id of a snapshot taken by on_prepare_finish for
+    # on_main. With flow persistence, they are saved to the resource bank
+    # section of the checkpoint after each hook, so that the hooks of a
+    # resumed protect or delete flow find them.
+    persisted_attributes = ()
+
     def on_prepare_begin(self, checkpoint, resource, context, parameters,
                          **kwargs):
         """on_prepare_begin hook runs before any child resource's hooks run
@@ -69,6 +80,14 @@ class Operation(object):
 
 
 class ProtectionPlugin(object):
+    """Base class of the protection plugins
+
+    A provider instantiates each of its plugins once, and the instance is
+    shared by all the flows, which run concurrently. The plugins should thus
+    only hold their configuration: the state of an operation on a resource
+    belongs in the Operation returned for it, which is never shared.
+    """
+
     def __init__(self, config=None):
         super(ProtectionPlugin, self).__init__()
         self._config = config
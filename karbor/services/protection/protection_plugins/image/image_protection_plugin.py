@@ -10,10 +10,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 from functools import partial
-import os
 
-from io import BytesIO
+from eventlet import greenpool
+from eventlet import queue
 from karbor.common import constants
 from karbor import exception
 from karbor.services.protection.client_factory import ClientFactory
@@ -23,6 +24,7 @@ from karbor.services.protection.protection_plugins.image \
 from karbor.services.protection.protection_plugins import utils
 from oslo_config import cfg
 from oslo_log import log as logging
+import six
 
 
 image_backup_opts = [
@@ -33,6 +35,23 @@ image_backup_opts = [
                     'the size of image\'s chunk).'),
     cfg.IntOpt('poll_interval', default=10,
                help='Poll interval for image status'),
+    cfg.IntOpt('backup_image_upload_concurrency',
+               default=4,
+               min=1,
+               help='The number of image objects uploaded to the bank '
+                    'concurrently. At most this number plus one objects '
+                    'of backup_image_object_size bytes are held in memory '
+                    'per image backup.'),
+    cfg.BoolOpt('backup_image_deduplication',
+                default=False,
+                help='Store image objects in the content addressed chunk '
+                     'store of the bank, so that objects already backed up '
+                     'by another checkpoint are not uploaded again.'),
+    cfg.IntOpt('restore_image_prefetch_count',
+               default=4,
+               min=1,
+               help='The number of image objects downloaded from the bank '
+                    'ahead of the Glance upload when restoring an image.'),
 ]
 
 LOG = logging.getLogger(__name__)
@@ -49,12 +68,92 @@ def get_image_status(glance_client, image_id):
     return status
 
 
+class ChunkUploadPipeline(object):
+    """Split a stream of data into chunks and upload them concurrently
+
+    A single reader fills a fixed pool of reusable buffers while up to
+    `concurrency` workers call upload_func(chunk_index, data) on the filled
+    buffers, chunk_index starting at 1. The reader blocks when all buffers
+    are in flight, so the memory held by the pipeline is bounded by
+    (concurrency + 1) * chunk_size.
+    """
+    def __init__(self, upload_func, chunk_size, concurrency):
+        super(ChunkUploadPipeline, self).__init__()
+        self._upload_func = upload_func
+        self._chunk_size = chunk_size
+        self._pool = greenpool.GreenPool(concurrency)
+        self._free_buffers = queue.LightQueue()
+        for _i in range(concurrency + 1):
+            self._free_buffers.put(bytearray(chunk_size))
+        self._error = None
+
+    def _upload(self, chunk_index, buf, size):
+        try:
+            if self._error is None:
+                self._upload_func(chunk_index, bytes(buf[:size]))
+        except Exception as err:
+            LOG.error("Upload of image chunk %(index)s failed: "
+                      "%(err)s", {'index': chunk_index, 'err': err})
+            if self._error is None:
+                self._error = err
+        finally:
+            self._free_buffers.put(buf)
+
+    def _submit(self, chunk_index, buf, size):
+        self._pool.spawn_n(self._upload, chunk_index, buf, size)
+
+    def run(self, data_iter):
+        """Upload all data from data_iter
+
+        :return: The number of data_N objects uploaded. Only returns after
+                 every upload has finished.
+        """
+        chunks_num = 0
+        buf = None
+        size = 0
+        try:
+            for data in data_iter:
+                data = memoryview(data)
+                while len(data) > 0:
+                    if self._error is not None:
+                        raise self._error
+                    if buf is None:
+                        buf = self._free_buffers.get()
+                        size = 0
+                    count = min(len(data), self._chunk_size - size)
+                    buf[size:size + count] = data[:count]
+                    size += count
+                    data = data[count:]
+                    if size == self._chunk_size:
+                        chunks_num += 1
+                        self._submit(chunks_num, buf, size)
+                        buf = None
+            if buf is not None and size > 0:
+                chunks_num += 1
+                self._submit(chunks_num, buf, size)
+                buf = None
+        finally:
+            self._pool.waitall()
+
+        if self._error is not None:
+            raise self._error
+        return chunks_num
+
+
+def _get_chunk_ref_id(checkpoint, image_id):
+    return "%s@%s" % (checkpoint.id, image_id)
+
+
 class ProtectOperation(protection_plugin.Operation):
+    concurrency_key = 'glance.download'
+
     def __init__(self, backup_image_object_size,
-                 poll_interval):
+                 poll_interval, upload_concurrency=1, deduplicate=False):
         super(ProtectOperation, self).__init__()
         self._data_block_size_bytes = backup_image_object_size
         self._interval = poll_interval
+        self._upload_concurrency = upload_concurrency
+        self._deduplicate = deduplicate
 
     def on_main(self, checkpoint, resource, context, parameters, **kwargs):
         image_id = resource.id
@@ -99,44 +198,44 @@ class ProtectOperation(protection_plugin.Operation):
                 reason=err,
                 resource_id=image_id,
                 resource_type=constants.IMAGE_RESOURCE_TYPE)
-        self._create_backup(glance_client, bank_section, image_id)
+        self._create_backup(glance_client, checkpoint, bank_section, image_id)
 
-    def _create_backup(self, glance_client, bank_section, image_id):
+    def _create_backup(self, glance_client, checkpoint, bank_section,
+                       image_id):
         try:
             image_response = glance_client.images.data(image_id,
                                                        do_checksum=True)
-            bank_chunk_num = int(self._data_block_size_bytes/65536)
-            LOG.debug("Creating image backup, bank_chunk_num: %s.",
-                      bank_chunk_num)
+            LOG.debug("Creating image backup, upload concurrency: %s.",
+                      self._upload_concurrency)
 
             # backup the data of image
-            image_chunks_num = 0
-            chunks_num = 1
-            image_response_data = BytesIO()
-            for chunk in image_response:
-                image_response_data.write(chunk)
-                image_chunks_num += 1
-                if image_chunks_num == bank_chunk_num:
-                    image_chunks_num = 0
-                    image_response_data.seek(0, os.SEEK_SET)
-                    data = image_response_data.read(
-                        self._data_block_size_bytes)
-                    bank_section.update_object("data_" + str(chunks_num), data)
-                    image_response_data.truncate(0)
-                    image_response_data.seek(0, os.SEEK_SET)
-                    chunks_num += 1
-
-            image_response_data.seek(0, os.SEEK_SET)
-            data = image_response_data.read()
-            if data != '':
-                bank_section.update_object("data_" + str(chunks_num), data)
+            if self._deduplicate:
+                chunk_store = bank_section.get_chunk_store()
+                chunk_ref_id = _get_chunk_ref_id(checkpoint, image_id)
+                manifest = {}
+
+                def upload(chunk_index, data):
+                    manifest[chunk_index] = chunk_store.put_chunk(
+                        chunk_ref_id, data)
             else:
-                chunks_num -= 1
+                def upload(chunk_index, data):
+                    bank_section.update_object("data_" + str(chunk_index),
+                                               data)
+
+            pipeline = ChunkUploadPipeline(upload,
+                                           self._data_block_size_bytes,
+                                           self._upload_concurrency)
+            chunks_num = pipeline.run(image_response)
+            if self._deduplicate:
+                bank_section.update_object(
+                    "manifest",
+                    [manifest[index] for index in range(1, chunks_num + 1)])
 
             # Save the chunks_num to metadata
             resource_definition = bank_section.get_object("metadata")
             if resource_definition is not None:
                 resource_definition["chunks_num"] = chunks_num
+                resource_definition["deduplicated"] = self._deduplicate
             bank_section.update_object("metadata", resource_definition)
 
             # Update resource_definition backup_status
@@ -166,10 +265,13 @@ class DeleteOperation(protection_plugin.Operation):
             bank_section.update_object("status",
                                        constants.RESOURCE_STATUS_DELETING)
             objects = bank_section.list_objects()
-            for obj in objects:
-                if obj == "status":
-                    continue
-                bank_section.delete_object(obj)
+            if "manifest" in objects:
+                chunk_store = bank_section.get_chunk_store()
+                chunk_ref_id = _get_chunk_ref_id(checkpoint, image_id)
+                chunk_store.release_chunks(
+                    chunk_ref_id, set(bank_section.get_object("manifest")))
+            bank_section.delete_objects(
+                [obj for obj in objects if obj != "status"])
             bank_section.update_object("status",
                                        constants.RESOURCE_STATUS_DELETED)
         except Exception as err:
@@ -183,9 +285,12 @@ class DeleteOperation(protection_plugin.Operation):
 
 
 class RestoreOperation(protection_plugin.Operation):
-    def __init__(self, poll_interval):
+    concurrency_key = 'glance.upload'
+
+    def __init__(self, poll_interval, prefetch_count=1):
         super(RestoreOperation, self).__init__()
         self._interval = poll_interval
+        self._prefetch_count = prefetch_count
 
     def on_main(self, checkpoint, resource, context, parameters, **kwargs):
         original_image_id = resource.id
@@ -200,29 +305,38 @@ class RestoreOperation(protection_plugin.Operation):
         try:
             resource_definition = bank_section.get_object('metadata')
             image_metadata = resource_definition['image_metadata']
-            objects = [key.split("/")[-1] for key in
-                       bank_section.list_objects()
-                       if (key.split("/")[-1]).startswith("data_")]
+            if resource_definition.get("deduplicated", False):
+                sorted_objects = bank_section.get_object("manifest")
+                get_object_func = bank_section.get_chunk_store().get_chunk
+            else:
+                objects = [key.split("/")[-1] for key in
+                           bank_section.list_objects()
+                           if (key.split("/")[-1]).startswith("data_")]
+                sorted_objects = sorted(objects, key=lambda s: int(s[5:]))
+                get_object_func = bank_section.get_object
 
             # check the chunks_num
             chunks_num = resource_definition.get("chunks_num", 0)
-            if len(objects) != int(chunks_num):
+            if len(sorted_objects) != int(chunks_num):
                 LOG.debug('object num: {0}, chunk num: {1}'.
-                          format(len(objects), chunks_num))
+                          format(len(sorted_objects), chunks_num))
                 raise exception.RestoreBackupFailed(
                     reason=" The chunks_num of restored image is invalid.",
                     resource_id=original_image_id,
                     resource_type=constants.IMAGE_RESOURCE_TYPE)
 
-            sorted_objects = sorted(objects, key=lambda s: int(s[5:]))
-            image_data = ImageBankIO(bank_section, sorted_objects)
+            image_data = ImageBankIO(bank_section, sorted_objects,
+                                     self._prefetch_count, get_object_func)
             disk_format = image_metadata["disk_format"]
             container_format = image_metadata["container_format"]
             image = glance_client.images.create(
                 disk_format=disk_format,
                 container_format=container_format,
                 name=name)
-            glance_client.images.upload(image.id, image_data)
+            try:
+                glance_client.images.upload(image.id, image_data)
+            finally:
+                image_data.close()
 
             image_info = glance_client.images.get(image.id)
             if image_info.status != "active":
@@ -261,26 +375,87 @@ class RestoreOperation(protection_plugin.Operation):
 
 
 class ImageBankIO(object):
-        def __init__(self, bank_section, sorted_objects):
-            super(ImageBankIO, self).__init__()
-            self.bank_section = bank_section
-            self.sorted_objects = sorted_objects
-            self.obj_size = len(sorted_objects)
-            self.length = 0
-
-        def readable(self):
-            return True
-
-        def __iter__(self):
-            return self
-
-        def read(self, length=None):
-            obj_index = self.length
-            self.length += 1
-            if self.length > self.obj_size:
-                return ''
-            return self.bank_section.get_object(
-                self.sorted_objects[obj_index])
+    """File-like reader over the data objects of an image backup
+
+    Keeps up to `prefetch_count` upcoming objects downloading from the bank
+    in parallel, and releases every object as soon as it has been read.
+    Objects are fetched with get_object_func, bank_section.get_object by
+    default.
+    """
+    def __init__(self, bank_section, sorted_objects, prefetch_count=1,
+                 get_object_func=None):
+        super(ImageBankIO, self).__init__()
+        self.bank_section = bank_section
+        self._get_object = get_object_func or bank_section.get_object
+        self.sorted_objects = sorted_objects
+        self.obj_size = len(sorted_objects)
+        self._prefetch_count = prefetch_count
+        self._pool = greenpool.GreenPool(prefetch_count)
+        self._pending = collections.deque()
+        self._next_index = 0
+        self._current = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.read()
+        if not data:
+            raise StopIteration()
+        return data
+
+    next = __next__
+
+    def _prefetch(self):
+        while (len(self._pending) < self._prefetch_count and
+               self._next_index < self.obj_size):
+            obj = self.sorted_objects[self._next_index]
+            self._next_index += 1
+            self._pending.append(
+                self._pool.spawn(self._get_object, obj))
+
+    def _next_object(self):
+        self._prefetch()
+        if not self._pending:
+            return None
+        data = self._pending.popleft().wait()
+        self._prefetch()
+        if isinstance(data, six.text_type):
+            # Banks reading their objects as text
+            data = data.encode('utf-8')
+        return memoryview(data)
+
+    def read(self, length=None):
+        if length is None or length < 0:
+            if len(self._current) == 0:
+                data = self._next_object()
+                if data is None:
+                    return b''
+                self._current = data
+            result = self._current.tobytes()
+            self._current = memoryview(b'')
+            return result
+
+        result = []
+        while length > 0:
+            if len(self._current) == 0:
+                data = self._next_object()
+                if data is None:
+                    break
+                self._current = data
+            chunk = self._current[:length]
+            self._current = self._current[length:]
+            length -= len(chunk)
+            result.append(chunk.tobytes())
+        return b''.join(result)
+
+    def close(self):
+        while self._pending:
+            self._pending.popleft().kill()
+        self._current = memoryview(b'')
 
 
 class GlanceProtectionPlugin(protection_plugin.ProtectionPlugin):
@@ -294,6 +469,11 @@ class GlanceProtectionPlugin(protection_plugin.ProtectionPlugin):
         self._data_block_size_bytes = (
             self._plugin_config.backup_image_object_size)
         self._poll_interval = self._plugin_config.poll_interval
+        self._upload_concurrency = (
+            self._plugin_config.backup_image_upload_concurrency)
+        self._prefetch_count = (
+            self._plugin_config.restore_image_prefetch_count)
+        self._deduplicate = self._plugin_config.backup_image_deduplication
 
         if self._data_block_size_bytes % 65536 != 0 or (
                 self._data_block_size_bytes <= 0):
@@ -323,10 +503,13 @@ class GlanceProtectionPlugin(protection_plugin.ProtectionPlugin):
 
     def get_protect_operation(self, resource):
         return ProtectOperation(self._data_block_size_bytes,
-                                self._poll_interval)
+                                self._poll_interval,
+                                self._upload_concurrency,
+                                self._deduplicate)
 
     def get_restore_operation(self, resource):
-        return RestoreOperation(self._poll_interval)
+        return RestoreOperation(self._poll_interval,
+                                self._prefetch_count)
 
     def get_delete_operation(self, resource):
         return DeleteOperation()
@@ -644,10 +644,8 @@ class DeleteOperation(protection_plugin.Operation):
             bank_section.update_object("status",
                                        constants.RESOURCE_STATUS_DELETING)
             objects = bank_section.list_objects()
-            for obj in objects:
-                if obj == "status":
-                    continue
-                bank_section.delete_object(obj)
+            bank_section.delete_objects(
+                [obj for obj in objects if obj != "status"])
             bank_section.update_object("status",
                                        constants.RESOURCE_STATUS_DELETED)
         except Exception as err:
@@ -161,10 +161,8 @@ class DeleteOperation(protection_plugin.Operation):
             bank_section.update_object("status",
                                        constants.RESOURCE_STATUS_DELETING)
             objects = bank_section.list_objects()
-            for obj in objects:
-                if obj == "status":
-                    continue
-                bank_section.delete_object(obj)
+            bank_section.delete_objects(
+                [obj for obj in objects if obj != "status"])
             bank_section.update_object("status",
                                        constants.RESOURCE_STATUS_DELETED)
             LOG.info("finish delete server, server_id: %s.", resource_id)
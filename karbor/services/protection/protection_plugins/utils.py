@@ -10,9 +10,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 from oslo_log import log as logging
 from oslo_service import loopingcall
 
+from karbor.services.protection import status_poller
+
 
 LOG = logging.getLogger(__name__)
 
@@ -36,16 +40,72 @@ def update_resource_restore_result(restore_record, resource_type, resource_id,
 def status_poll(get_status_func, interval, success_statuses=set(),
                 failure_statuses=set(), ignore_statuses=set(),
                 ignore_unexpected=False):
+    """Poll a status until it is a success or a failure status
+
+    interval is either the number of seconds between the polls, or a poll
+    schedule such as status_poller.BackoffSchedule.
+    """
+    schedule = status_poller.get_poll_schedule(interval)
+    intervals = schedule.intervals()
+    started_at = time.time()
+
     def _poll():
         status = get_status_func()
         if status in success_statuses:
+            schedule.on_completed(time.time() - started_at)
             raise loopingcall.LoopingCallDone(retvalue=True)
         if status in failure_statuses:
             raise loopingcall.LoopingCallDone(retvalue=False)
         if status in ignore_statuses:
-            return
+            return next(intervals)
         if ignore_unexpected is False:
             raise loopingcall.LoopingCallDone(retvalue=False)
+        return next(intervals)
+
+    loop = loopingcall.DynamicLoopingCall(_poll)
+    return loop.start(initial_delay=next(intervals)).wait()
+
+
+def list_resource_statuses(resource_manager, resource_ids, get_status_func,
+                           resource_type, pending_statuses=()):
+    """List the statuses of resources, for batched_status_poll
+
+    The resources are listed filtered by each of pending_statuses, the
+    statuses they are expected to still be in, so that a single query
+    usually covers all the polled resources. The resources missing from
+    the listing, because they changed status or are gone, are polled one
+    by one with get_status_func, so that they are only reported as not
+    found when they really are.
+    """
+    resource_ids = list(resource_ids)
+    LOG.debug('Listing the status of %(count)d %(resource_type)s',
+              {'count': len(resource_ids), 'resource_type': resource_type})
+    wanted = set(resource_ids)
+    statuses = {}
+    for status in pending_statuses:
+        statuses.update(
+            (resource.id, resource.status)
+            for resource in resource_manager.list(
+                search_opts={'status': status})
+            if resource.id in wanted)
+    for resource_id in resource_ids:
+        if resource_id not in statuses:
+            statuses[resource_id] = get_status_func(resource_id)
+    return statuses
+
+
+def batched_status_poll(context, service, resource_type, resource_id,
+                        get_status_func, list_statuses_func, interval,
+                        success_statuses=set(), failure_statuses=set(),
+                        ignore_statuses=set(), ignore_unexpected=False):
+    """Like status_poll, sharing the polling with other resources
 
-    loop = loopingcall.FixedIntervalLoopingCall(_poll)
-    return loop.start(interval=interval, initial_delay=interval).wait()
+    The resources of the same type and project waited for at the same time
+    are polled together by the status poller of the protection service,
+    using list_statuses_func to list the statuses of many resources at once.
+    """
+    return status_poller.get_status_poller().wait(
+        context, service, resource_type, resource_id, get_status_func,
+        list_statuses_func, interval, success_statuses=success_statuses,
+        failure_statuses=failure_statuses, ignore_statuses=ignore_statuses,
+        ignore_unexpected=ignore_unexpected)
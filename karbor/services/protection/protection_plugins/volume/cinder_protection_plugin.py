@@ -22,6 +22,7 @@ from karbor import exception
 from karbor.services.protection.client_factory import ClientFactory
 from karbor.services.protection import protection_plugin
 from karbor.services.protection.protection_plugins import utils
+from karbor.services.protection import status_poller
 from karbor.services.protection.protection_plugins.volume \
     import volume_plugin_cinder_schemas as cinder_schemas
 
@@ -54,6 +55,25 @@ def get_snapshot_status(cinder_client, snapshot_id):
                                'snapshot')
 
 
+def list_backup_statuses(cinder_client, backup_ids, pending_statuses=()):
+    return utils.list_resource_statuses(
+        cinder_client.backups, backup_ids,
+        partial(get_backup_status, cinder_client), 'backup', pending_statuses)
+
+
+def list_volume_statuses(cinder_client, volume_ids, pending_statuses=()):
+    return utils.list_resource_statuses(
+        cinder_client.volumes, volume_ids,
+        partial(get_volume_status, cinder_client), 'volume', pending_statuses)
+
+
+def list_snapshot_statuses(cinder_client, snapshot_ids, pending_statuses=()):
+    return utils.list_resource_statuses(
+        cinder_client.volume_snapshots, snapshot_ids,
+        partial(get_snapshot_status, cinder_client), 'snapshot',
+        pending_statuses)
+
+
 def get_resource_status(resource_manager, resource_id, resource_type):
     LOG.debug('Polling %(resource_type)s (id: %(resource_id)s)', {
         'resource_type': resource_type,
@@ -76,19 +96,29 @@ def get_resource_status(resource_manager, resource_id, resource_type):
 
 
 class ProtectOperation(protection_plugin.Operation):
+    concurrency_key = 'cinder.backup'
+    persisted_attributes = ('snapshot_id', '_volume_size')
+
     def __init__(self, poll_interval, backup_from_snapshot):
         super(ProtectOperation, self).__init__()
         self._interval = poll_interval
         self._backup_from_snapshot = backup_from_snapshot
         self.snapshot_id = None
+        self._volume_size = None
 
-    def _create_snapshot(self, cinder_client, volume_id):
+    def _create_snapshot(self, context, cinder_client, volume_id):
         snapshot = cinder_client.volume_snapshots.create(volume_id, force=True)
 
         snapshot_id = snapshot.id
-        is_success = utils.status_poll(
+        self._volume_size = getattr(snapshot, 'size', None)
+        is_success = utils.batched_status_poll(
+            context, 'cinder', 'snapshot', snapshot_id,
             partial(get_snapshot_status, cinder_client, snapshot_id),
-            interval=self._interval,
+            partial(list_snapshot_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(
+                self._interval,
+                history_key='cinder_backup_protection_plugin.snapshot',
+                size=self._volume_size),
             success_statuses={'available', },
             failure_statuses={'error', 'error_deleting', 'deleting',
                               'not-found'},
@@ -99,18 +129,20 @@ class ProtectOperation(protection_plugin.Operation):
 
         return snapshot_id
 
-    def _delete_snapshot(self, cinder_client, snapshot_id):
+    def _delete_snapshot(self, context, cinder_client, snapshot_id):
         LOG.info('Cleaning up snapshot (snapshot_id: %s)', snapshot_id)
         cinder_client.volume_snapshots.delete(snapshot_id)
-        return utils.status_poll(
+        return utils.batched_status_poll(
+            context, 'cinder', 'snapshot', snapshot_id,
             partial(get_snapshot_status, cinder_client, snapshot_id),
-            interval=self._interval,
+            partial(list_snapshot_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(self._interval),
             success_statuses={'not-found', },
             failure_statuses={'error', 'error_deleting', 'creating'},
             ignore_statuses={'deleting', },
         )
 
-    def _create_backup(self, cinder_client, volume_id, backup_name,
+    def _create_backup(self, context, cinder_client, volume_id, backup_name,
                        description, snapshot_id=None, incremental=False,
                        container=None, force=False):
         backup = cinder_client.backups.create(
@@ -124,9 +156,15 @@ class ProtectOperation(protection_plugin.Operation):
         )
 
         backup_id = backup.id
-        is_success = utils.status_poll(
+        history_key = 'cinder_backup_protection_plugin.%s_backup' % (
+            'incremental' if incremental else 'full')
+        is_success = utils.batched_status_poll(
+            context, 'cinder', 'backup', backup_id,
             partial(get_backup_status, cinder_client, backup_id),
-            interval=self._interval,
+            partial(list_backup_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(
+                self._interval, history_key=history_key,
+                size=self._volume_size),
             success_statuses={'available'},
             failure_statuses={'error'},
             ignore_statuses={'creating'},
@@ -157,7 +195,8 @@ class ProtectOperation(protection_plugin.Operation):
                                    constants.RESOURCE_STATUS_PROTECTING)
         cinder_client = ClientFactory.create_client('cinder', context)
         try:
-            self.snapshot_id = self._create_snapshot(cinder_client, volume_id)
+            self.snapshot_id = self._create_snapshot(
+                context, cinder_client, volume_id)
         except Exception:
             bank_section.update_object('status',
                                        constants.RESOURCE_STATUS_ERROR)
@@ -177,9 +216,11 @@ class ProtectOperation(protection_plugin.Operation):
         resource_metadata = {
             'volume_id': volume_id,
         }
-        is_success = utils.status_poll(
+        is_success = utils.batched_status_poll(
+            context, 'cinder', 'volume', volume_id,
             partial(get_volume_status, cinder_client, volume_id),
-            interval=self._interval,
+            partial(list_volume_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(self._interval),
             success_statuses={'available', 'in-use', 'error_extending',
                               'error_restoring'},
             failure_statuses={'error', 'error_deleting', 'deleting',
@@ -208,8 +249,9 @@ class ProtectOperation(protection_plugin.Operation):
             incremental = False
 
         try:
-            backup_id = self._create_backup(cinder_client, volume_id,
-                                            backup_name, description,
+            backup_id = self._create_backup(context, cinder_client,
+                                            volume_id, backup_name,
+                                            description,
                                             self.snapshot_id,
                                             incremental, container, force)
         except Exception as e:
@@ -240,7 +282,8 @@ class ProtectOperation(protection_plugin.Operation):
 
         if self.snapshot_id:
             try:
-                self._delete_snapshot(cinder_client, self.snapshot_id)
+                self._delete_snapshot(context, cinder_client,
+                                      self.snapshot_id)
             except Exception as e:
                 LOG.warning('Failed deleting snapshot: %(snapshot_id)s. '
                             'Reason: %(reason)s',
@@ -248,6 +291,8 @@ class ProtectOperation(protection_plugin.Operation):
 
 
 class RestoreOperation(protection_plugin.Operation):
+    concurrency_key = 'cinder.backup_restore'
+
     def __init__(self, poll_interval):
         super(RestoreOperation, self).__init__()
         self._interval = poll_interval
@@ -283,7 +328,8 @@ class RestoreOperation(protection_plugin.Operation):
 
         update_method(constants.RESOURCE_STATUS_RESTORING)
 
-        is_success = self._check_create_complete(cinder_client, volume_id)
+        is_success = self._check_create_complete(context, cinder_client,
+                                                 volume_id)
         if is_success:
             update_method(constants.RESOURCE_STATUS_AVAILABLE)
             kwargs.get("heat_template").put_parameter(resource_id, volume_id)
@@ -297,10 +343,12 @@ class RestoreOperation(protection_plugin.Operation):
                 resource_type=resource.type
             )
 
-    def _check_create_complete(self, cinder_client, volume_id):
-        return utils.status_poll(
+    def _check_create_complete(self, context, cinder_client, volume_id):
+        return utils.batched_status_poll(
+            context, 'cinder', 'volume', volume_id,
             partial(get_volume_status, cinder_client, volume_id),
-            interval=self._interval,
+            partial(list_volume_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(self._interval),
             success_statuses={'available'},
             failure_statuses={'error', 'not-found'},
             ignore_statuses={'creating', 'restoring-backup', 'downloading'},
@@ -308,6 +356,8 @@ class RestoreOperation(protection_plugin.Operation):
 
 
 class DeleteOperation(protection_plugin.Operation):
+    concurrency_key = 'cinder.backup_delete'
+
     def __init__(self, poll_interval):
         super(DeleteOperation, self).__init__()
         self._interval = poll_interval
@@ -328,9 +378,11 @@ class DeleteOperation(protection_plugin.Operation):
             except cinder_exc.NotFound:
                 LOG.info('Backup id: %s not found. Assuming deleted',
                          backup_id)
-            is_success = utils.status_poll(
+            is_success = utils.batched_status_poll(
+                context, 'cinder', 'backup', backup_id,
                 partial(get_backup_status, cinder_client, backup_id),
-                interval=self._interval,
+                partial(list_backup_statuses, cinder_client),
+                interval=status_poller.BackoffSchedule(self._interval),
                 success_statuses={'deleted', 'not-found'},
                 failure_statuses={'error', 'error_deleting'},
                 ignore_statuses={'deleting'},
@@ -22,6 +22,7 @@ from karbor import exception
 from karbor.services.protection.client_factory import ClientFactory
 from karbor.services.protection import protection_plugin
 from karbor.services.protection.protection_plugins import utils
+from karbor.services.protection import status_poller
 from karbor.services.protection.protection_plugins.volume \
     import volume_snapshot_plugin_schemas as volume_schemas
 
@@ -50,6 +51,19 @@ def get_volume_status(cinder_client, volume_id):
     return get_resource_status(cinder_client.volumes, volume_id, 'volume')
 
 
+def list_snapshot_statuses(cinder_client, snapshot_ids, pending_statuses=()):
+    return utils.list_resource_statuses(
+        cinder_client.volume_snapshots, snapshot_ids,
+        partial(get_snapshot_status, cinder_client), 'snapshot',
+        pending_statuses)
+
+
+def list_volume_statuses(cinder_client, volume_ids, pending_statuses=()):
+    return utils.list_resource_statuses(
+        cinder_client.volumes, volume_ids,
+        partial(get_volume_status, cinder_client), 'volume', pending_statuses)
+
+
 def get_resource_status(resource_manager, resource_id, resource_type):
     LOG.debug('Polling %(resource_type)s (id: %(resource_id)s)',
               {'resource_type': resource_type, 'resource_id': resource_id})
@@ -67,12 +81,14 @@ def get_resource_status(resource_manager, resource_id, resource_type):
 
 
 class ProtectOperation(protection_plugin.Operation):
+    concurrency_key = 'cinder.snapshot'
+
     def __init__(self, poll_interval):
         super(ProtectOperation, self).__init__()
         self._interval = poll_interval
 
-    def _create_snapshot(self, cinder_client, volume_id, snapshot_name,
-                         description, force):
+    def _create_snapshot(self, context, cinder_client, volume_id,
+                         snapshot_name, description, force, size=None):
         snapshot = cinder_client.volume_snapshots.create(
             volume_id=volume_id,
             name=snapshot_name,
@@ -81,9 +97,13 @@ class ProtectOperation(protection_plugin.Operation):
         )
 
         snapshot_id = snapshot.id
-        is_success = utils.status_poll(
+        is_success = utils.batched_status_poll(
+            context, 'cinder', 'snapshot', snapshot_id,
             partial(get_snapshot_status, cinder_client, snapshot_id),
-            interval=self._interval,
+            partial(list_snapshot_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(
+                self._interval, history_key='volume_snapshot_plugin.snapshot',
+                size=size),
             success_statuses={'available'},
             failure_statuses={'error', 'error_deleting', 'deleting',
                               'not-found'},
@@ -113,9 +133,11 @@ class ProtectOperation(protection_plugin.Operation):
         bank_section.update_object('status',
                                    constants.RESOURCE_STATUS_PROTECTING)
         volume_info = cinder_client.volumes.get(volume_id)
-        is_success = utils.status_poll(
+        is_success = utils.batched_status_poll(
+            context, 'cinder', 'volume', volume_id,
             partial(get_volume_status, cinder_client, volume_id),
-            interval=self._interval,
+            partial(list_volume_statuses, cinder_client),
+            interval=status_poller.BackoffSchedule(self._interval),
             success_statuses={'available', 'in-use', 'error_extending',
                               'error_restoring'},
             failure_statuses=VOLUME_FAILURE_STATUSES,
@@ -138,9 +160,10 @@ class ProtectOperation(protection_plugin.Operation):
         description = parameters.get('description', None)
         force = parameters.get('force', False)
         try:
-            snapshot_id = self._create_snapshot(cinder_client, volume_id,
-                                                snapshot_name,
-                                                description, force)
+            snapshot_id = self._create_snapshot(context, cinder_client,
+                                                volume_id, snapshot_name,
+                                                description, force,
+                                                size=volume_info.size)
         except Exception as e:
             LOG.error('Error creating snapshot (volume_id: %(volume_id)s '
                       ': %(reason)s', {'volume_id': volume_id, 'reason': e})
@@ -162,6 +185,8 @@ class ProtectOperation(protection_plugin.Operation):
 
 
 class RestoreOperation(protection_plugin.Operation):
+    concurrency_key = 'cinder.snapshot_restore'
+
     def __init__(self, poll_interval):
         super(RestoreOperation, self).__init__()
         self._interval = poll_interval
@@ -185,9 +210,11 @@ class RestoreOperation(protection_plugin.Operation):
                 size, snapshot_id=snapshot_id,
                 name=restore_name,
                 description=restore_description)
-            is_success = utils.status_poll(
+            is_success = utils.batched_status_poll(
+                context, 'cinder', 'volume', volume.id,
                 partial(get_volume_status, cinder_client, volume.id),
-                interval=self._interval,
+                partial(list_volume_statuses, cinder_client),
+                interval=status_poller.BackoffSchedule(self._interval),
                 success_statuses={'available', 'in-use', 'error_extending',
                                   'error_restoring'},
                 failure_statuses=VOLUME_FAILURE_STATUSES,
@@ -220,6 +247,8 @@ class RestoreOperation(protection_plugin.Operation):
 
 
 class DeleteOperation(protection_plugin.Operation):
+    concurrency_key = 'cinder.snapshot_delete'
+
     def __init__(self, poll_interval):
         super(DeleteOperation, self).__init__()
         self._interval = poll_interval
@@ -240,9 +269,11 @@ class DeleteOperation(protection_plugin.Operation):
             except cinder_exc.NotFound:
                 LOG.info('Snapshot id: %s not found. Assuming deleted',
                          snapshot_id)
-            is_success = utils.status_poll(
+            is_success = utils.batched_status_poll(
+                context, 'cinder', 'snapshot', snapshot_id,
                 partial(get_snapshot_status, cinder_client, snapshot_id),
-                interval=self._interval,
+                partial(list_snapshot_statuses, cinder_client),
+                interval=status_poller.BackoffSchedule(self._interval),
                 success_statuses={'deleted', 'not-found'},
                 failure_statuses={'error', 'error_deleting'},
                 ignore_statuses={'deleting'},
@@ -16,6 +16,7 @@ from karbor import exception
 from karbor.i18n import _
 from karbor.services.protection import bank_plugin
 from karbor.services.protection.checkpoint import CheckpointCollection
+from karbor.services.protection import governor
 from karbor import utils
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -39,8 +40,39 @@ provider_opts = [
     cfg.BoolOpt('enabled',
                 default=False,
                 help='enabled or not'),
+    cfg.DictOpt('concurrency_limits',
+                default={},
+                help='Maximum number of concurrent runs of the hooks of an '
+                     'operation, by operation key, such as cinder.backup:8. '
+                     'The key of an operation without a concurrency_key is '
+                     'its resource type and operation type, such as '
+                     'os.nova.server.protect. The bank.put key limits the '
+                     'object writes to the bank of the provider.'),
+    cfg.DictOpt('rate_limits',
+                default={},
+                help='Maximum number of starts per second of the hooks of '
+                     'an operation, by operation key, such as '
+                     'glance.download:0.5. The bank.put key limits the '
+                     'object writes to the bank of the provider.'),
 ]
+
+bank_cache_opts = [
+    cfg.IntOpt('bank_metadata_cache_size',
+               default=1024,
+               min=0,
+               help='The maximum number of metadata objects, like checkpoint '
+                    'indexes, cached per provider bank. 0 disables the '
+                    'cache.'),
+    cfg.IntOpt('bank_metadata_cache_ttl',
+               default=30,
+               min=0,
+               help='The time in seconds metadata objects stay in the bank '
+                    'cache. This bounds how long changes made by other '
+                    'services take to be seen.'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(bank_cache_opts)
 
 LOG = logging.getLogger(__name__)
 
@@ -66,13 +98,18 @@ class PluggableProtectionProvider(object):
         self.checkpoint_collection = None
         self._bank_plugin = None
         self._plugin_map = {}
+        self._plugins = None
 
         if (hasattr(self._config.provider, 'bank') and
                 not self._config.provider.bank):
             raise ImportError(_("Empty bank"))
 
         self._load_bank(self._config.provider.bank)
-        self._bank = bank_plugin.Bank(self._bank_plugin)
+        self._bank = bank_plugin.Bank(
+            self._bank_plugin,
+            cache=bank_plugin.MetadataCache(CONF.bank_metadata_cache_size,
+                                            CONF.bank_metadata_cache_ttl),
+            limits_scope=self._id)
         self.checkpoint_collection = CheckpointCollection(
             self._bank)
 
@@ -82,6 +119,14 @@ class PluggableProtectionProvider(object):
                     raise ImportError(_("Empty protection plugin"))
                 self._register_plugin(plugin_name)
 
+        self._configure_limits()
+
+    def _configure_limits(self):
+        if hasattr(self._config.provider, 'concurrency_limits'):
+            governor.get_governor().configure(
+                self._id, self._config.provider.concurrency_limits,
+                self._config.provider.rate_limits)
+
     @property
     def id(self):
         return self._id
@@ -107,10 +152,32 @@ class PluggableProtectionProvider(object):
         return self._plugin_map
 
     def load_plugins(self):
-        return {
-            plugin_type: plugin_class(self._config)
-            for plugin_type, plugin_class in self.plugins.items()
-        }
+        """Return the protection plugins of the provider by resource type
+
+        Every plugin is instantiated once and shared by all the flows of the
+        provider, see ProtectionPlugin for what this requires of a plugin.
+        """
+        if self._plugins is None:
+            instances = {}
+            for plugin_class in self.plugins.values():
+                if plugin_class not in instances:
+                    instances[plugin_class] = plugin_class(self._config)
+            self._plugins = {
+                plugin_type: instances[plugin_class]
+                for plugin_type, plugin_class in self.plugins.items()
+            }
+        return dict(self._plugins)
+
+    def reload_plugins(self):
+        """Reload the provider configuration and the protection plugins
+
+        The plugins are instantiated again with the new configuration for
+        the next flows, the running flows keep the plugins they started
+        with. The set of plugins of the provider does not change.
+        """
+        self._config.reload_config_files()
+        self._configure_limits()
+        self._plugins = None
 
     def _load_bank(self, bank_name):
         try:
@@ -156,6 +223,15 @@ class PluggableProtectionProvider(object):
             plan_id=plan_id, start_date=start_date, end_date=end_date,
             sort_dir=sort_dir)
 
+    def list_checkpoint_summaries(self, provider_id, limit=None, marker=None,
+                                  plan_id=None, start_date=None,
+                                  end_date=None, sort_dir=None):
+        checkpoint_collection = self.get_checkpoint_collection()
+        return checkpoint_collection.list_summaries(
+            provider_id=provider_id, limit=limit, marker=marker,
+            plan_id=plan_id, start_date=start_date, end_date=end_date,
+            sort_dir=sort_dir)
+
 
 class ProviderRegistry(object):
     def __init__(self):
@@ -195,6 +271,15 @@ class ProviderRegistry(object):
                          provider_config.provider.name)
                 self.providers[provider.id] = provider
 
+    def reload_plugins(self):
+        """Reload the configuration and the plugins of every provider"""
+        for provider in self.providers.values():
+            try:
+                provider.reload_plugins()
+            except Exception:
+                LOG.exception("Failed to reload the plugins of provider %s",
+                              provider.id)
+
     def list_providers(self, marker=None, limit=None, sort_keys=None,
                        sort_dirs=None, filters=None):
         # TODO(wangliuan) How to use the list option
@@ -11,11 +11,20 @@
 #    under the License.
 from collections import namedtuple
 
+import six
+
 from karbor.common import constants
 from karbor import exception
+from karbor.services.protection import governor
 from karbor.services.protection import graph
+from karbor.services.protection import protection_plugin
+from oslo_config import cfg
 from oslo_log import log as logging
 
+CONF = cfg.CONF
+CONF.import_opt('flow_persistence',
+                'karbor.services.protection.flows.workflow')
+
 LOG = logging.getLogger(__name__)
 
 
@@ -43,14 +52,99 @@ OPERATION_EXTRA_ARGS = {
     constants.OPERATION_RESTORE: ['heat_template', 'restore'],
 }
 
+# The operations whose flows can be persisted and resumed
+PERSISTED_OPERATIONS = (constants.OPERATION_PROTECT,
+                        constants.OPERATION_DELETE)
+
 
 def noop_handle(*args, **kwargs):
     pass
 
 
+def _is_hook_implemented(operation_obj, hook_type):
+    base_hook = getattr(protection_plugin.Operation, hook_type)
+    hook = getattr(type(operation_obj), hook_type, None)
+    return hook is not None and six.get_unbound_function(hook) is not \
+        six.get_unbound_function(base_hook)
+
+
+def _govern_hook(method, limiter):
+    @six.wraps(method)
+    def _governed_hook(*args, **kwargs):
+        with limiter:
+            return method(*args, **kwargs)
+    return _governed_hook
+
+
+class _OperationState(object):
+    """The persisted attributes of an operation, see Operation
+
+    They are loaded from the resource bank section before the first hook
+    run by this process, and saved after each hook which changed them.
+    """
+
+    def __init__(self, operation_obj, operation_type):
+        super(_OperationState, self).__init__()
+        self._operation_obj = operation_obj
+        self._key = 'operation_state_%s' % operation_type
+        self._loaded = False
+        self._stored = False
+        self._saved = self._get_state()
+
+    def _get_state(self):
+        return {name: getattr(self._operation_obj, name, None)
+                for name in self._operation_obj.persisted_attributes}
+
+    def load(self, bank_section):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            state = bank_section.get_object(self._key)
+        except exception.BankGetObjectFailed:
+            return
+        for name in self._operation_obj.persisted_attributes:
+            if name in state:
+                setattr(self._operation_obj, name, state[name])
+        self._stored = True
+        self._saved = self._get_state()
+
+    def save(self, bank_section):
+        state = self._get_state()
+        if state != self._saved:
+            bank_section.update_object(self._key, state)
+            self._stored = True
+            self._saved = state
+
+    def delete(self, bank_section):
+        if not self._stored:
+            return
+        try:
+            bank_section.delete_object(self._key)
+        except exception.BankDeleteObjectFailed:
+            LOG.warning("Failed to delete the operation state %s",
+                        self._key, exc_info=True)
+        self._stored = False
+
+
+def _persist_hook(method, operation_state, hook_type):
+    @six.wraps(method)
+    def _persisted_hook(*args, **kwargs):
+        bank_section = kwargs['checkpoint'].get_resource_bank_section(
+            kwargs['resource'].id)
+        operation_state.load(bank_section)
+        result = method(*args, **kwargs)
+        if hook_type == HOOK_COMPLETE:
+            operation_state.delete(bank_section)
+        else:
+            operation_state.save(bank_section)
+        return result
+    return _persisted_hook
+
+
 class ResourceFlowGraphWalkerListener(graph.GraphWalkerListener):
     def __init__(self, resource_flow, operation_type, context, parameters,
-                 plugins, workflow_engine):
+                 plugins, workflow_engine, limits_scope=None):
         super(ResourceFlowGraphWalkerListener, self).__init__()
         self.operation_type = operation_type
         self.context = context
@@ -58,29 +152,55 @@ class ResourceFlowGraphWalkerListener(graph.GraphWalkerListener):
         self.plugins = plugins
         self.workflow_engine = workflow_engine
         self.flow = resource_flow
+        self.limits_scope = limits_scope
 
         self.node_tasks = {}
         self.task_stack = []
         self.current_resource = None
 
     def _create_hook_tasks(self, operation_obj, resource):
+        operation_state = None
+        if (CONF.flow_persistence and
+                self.operation_type in PERSISTED_OPERATIONS and
+                type(operation_obj).persisted_attributes):
+            operation_state = _OperationState(operation_obj,
+                                              self.operation_type)
         pre_begin_task = self._create_hook_task(operation_obj, resource,
-                                                HOOK_PRE_BEGIN)
+                                                HOOK_PRE_BEGIN,
+                                                operation_state)
         pre_finish_task = self._create_hook_task(operation_obj, resource,
-                                                 HOOK_PRE_FINISH)
+                                                 HOOK_PRE_FINISH,
+                                                 operation_state)
         main_task = self._create_hook_task(operation_obj, resource,
-                                           HOOK_MAIN)
+                                           HOOK_MAIN, operation_state)
         post_task = self._create_hook_task(operation_obj, resource,
-                                           HOOK_COMPLETE)
+                                           HOOK_COMPLETE, operation_state)
 
         return ResourceHooks(pre_begin_task, pre_finish_task, main_task,
                              post_task)
 
-    def _create_hook_task(self, operation_obj, resource, hook_type):
+    def _get_limiter(self, operation_obj, resource):
+        if self.limits_scope is None:
+            return None
+        key = getattr(operation_obj, 'concurrency_key', None)
+        if key is None:
+            key = '{type}.{operation_type}'.format(
+                type=resource.type.lower().replace('::', '.'),
+                operation_type=self.operation_type)
+        return governor.get_governor().get_limiter(self.limits_scope, key)
+
+    def _create_hook_task(self, operation_obj, resource, hook_type,
+                          operation_state=None):
         method = getattr(operation_obj, hook_type, noop_handle)
         assert callable(method), (
             'Resource {} method "{}" is not callable'
         ).format(resource.type, hook_type)
+        limiter = self._get_limiter(operation_obj, resource)
+        if limiter is not None and _is_hook_implemented(operation_obj,
+                                                        hook_type):
+            method = _govern_hook(method, limiter)
+        if operation_state is not None:
+            method = _persist_hook(method, operation_state, hook_type)
 
         task_name = "{operation_type}_{hook_type}_{type}_{id}".format(
             type=resource.type,
@@ -160,7 +280,13 @@ class ResourceFlowGraphWalkerListener(graph.GraphWalkerListener):
 
 
 def build_resource_flow(operation_type, context, workflow_engine,
-                        plugins, resource_graph, parameters):
+                        plugins, resource_graph, parameters,
+                        limits_scope=None):
+    """Build the flow of the hook tasks of the resources of a graph
+
+    The hooks implemented by the operations are run under the limiters of
+    the governor configured for limits_scope, usually the provider id.
+    """
     LOG.info("Build resource flow for operation %s", operation_type)
 
     resource_graph_flow = workflow_engine.build_flow(
@@ -172,8 +298,9 @@ def build_resource_flow(operation_type, context, workflow_engine,
                                                       context,
                                                       parameters,
                                                       plugins,
-                                                      workflow_engine)
-    walker = graph.GraphWalker()
+                                                      workflow_engine,
+                                                      limits_scope)
+    walker = graph.GraphWalker(walk_visited_children=False)
     walker.register_listener(resource_walker)
     LOG.debug("Starting resource graph walk (operation %s)", operation_type)
     walker.walk_graph(resource_graph)
@@ -0,0 +1,355 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import itertools
+import numbers
+import random
+import time
+
+import eventlet
+from eventlet import event
+from eventlet import greenpool
+from eventlet import semaphore
+from oslo_config import cfg
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+status_poller_opts = [
+    cfg.IntOpt('status_poll_list_threshold',
+               default=5,
+               min=1,
+               help='Number of resources of the same type and project '
+                    'waited for at once, from which their statuses are '
+                    'polled with a single listing rather than a get per '
+                    'resource.'),
+    cfg.IntOpt('status_poll_concurrency',
+               default=4,
+               min=1,
+               help='Maximum number of concurrent status queries to each '
+                    'service.'),
+    cfg.FloatOpt('status_poll_rate_limit',
+                 default=0,
+                 min=0,
+                 help='Maximum number of status queries per second to each '
+                      'service, 0 for no limit.'),
+    cfg.FloatOpt('status_poll_initial_interval',
+                 default=1,
+                 min=0,
+                 help='Interval before the first poll of a resource status '
+                      'by the plugins which back off, in seconds. The '
+                      'interval then grows up to the poll interval of the '
+                      'plugin.'),
+    cfg.FloatOpt('status_poll_backoff_factor',
+                 default=2,
+                 min=1,
+                 help='Factor by which the interval between the polls of a '
+                      'resource status grows.'),
+    cfg.FloatOpt('status_poll_jitter',
+                 default=0.1,
+                 min=0,
+                 max=1,
+                 help='Maximum random variation of the interval between the '
+                      'polls of a resource status, as a fraction of the '
+                      'interval.'),
+    cfg.FloatOpt('status_poll_max_interval',
+                 default=300,
+                 min=0,
+                 help='Maximum interval between the polls of a resource '
+                      'status which is expected to take long to complete, '
+                      'in seconds.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(status_poller_opts)
+
+
+class CompletionTimes(object):
+    """Moving average of the completion time of operations
+
+    The completion times are recorded per unit of size, so that the
+    completion time of an operation on a resource of another size can be
+    estimated.
+    """
+
+    def __init__(self, weight=0.2):
+        super(CompletionTimes, self).__init__()
+        self._weight = weight
+        self._unit_durations = {}
+
+    @staticmethod
+    def _get_size(size):
+        if isinstance(size, numbers.Number) and size > 0:
+            return size
+        return 1
+
+    def record(self, key, duration, size=None):
+        unit_duration = duration / float(self._get_size(size))
+        previous = self._unit_durations.get(key)
+        if previous is None:
+            self._unit_durations[key] = unit_duration
+        else:
+            self._unit_durations[key] = (
+                previous + self._weight * (unit_duration - previous))
+
+    def expected_duration(self, key, size=None):
+        unit_duration = self._unit_durations.get(key)
+        if unit_duration is None:
+            return None
+        return unit_duration * self._get_size(size)
+
+
+_completion_times = CompletionTimes()
+
+
+def get_completion_times():
+    return _completion_times
+
+
+class FixedIntervalSchedule(object):
+    """Poll a status at a fixed interval"""
+
+    def __init__(self, interval):
+        super(FixedIntervalSchedule, self).__init__()
+        self.interval = interval
+
+    def intervals(self):
+        return itertools.repeat(self.interval)
+
+    def on_completed(self, duration):
+        pass
+
+
+class BackoffSchedule(object):
+    """Poll a status quickly first, then back off exponentially
+
+    Every interval varies randomly by up to status_poll_jitter. When the
+    operation is expected to take long, given as expected_duration or
+    estimated from the completion times recorded under history_key for
+    resources of this size, the polls are spaced further until then.
+    """
+
+    def __init__(self, max_interval, history_key=None, size=None,
+                 expected_duration=None):
+        super(BackoffSchedule, self).__init__()
+        self.max_interval = max_interval
+        self.history_key = history_key
+        self.size = size
+        if expected_duration is None and history_key is not None:
+            expected_duration = _completion_times.expected_duration(
+                history_key, size)
+        self.expected_duration = expected_duration
+
+    def intervals(self):
+        interval = min(CONF.status_poll_initial_interval, self.max_interval)
+        elapsed = 0
+        while True:
+            delay = interval
+            if self.expected_duration is not None:
+                remaining = self.expected_duration - elapsed
+                delay = max(delay, min(remaining / 2.0,
+                                       CONF.status_poll_max_interval))
+            jitter = CONF.status_poll_jitter
+            delay *= random.uniform(1 - jitter, 1 + jitter)
+            elapsed += delay
+            yield delay
+            interval = min(interval * CONF.status_poll_backoff_factor,
+                           self.max_interval)
+
+    def on_completed(self, duration):
+        if self.history_key is not None:
+            _completion_times.record(self.history_key, duration, self.size)
+
+
+def get_poll_schedule(interval):
+    """Return the schedule of an interval or of a schedule"""
+    if isinstance(interval, numbers.Number):
+        return FixedIntervalSchedule(interval)
+    return interval
+
+
+class _ServiceLimiter(object):
+    """Limit the concurrency and the rate of the queries to a service"""
+
+    def __init__(self):
+        super(_ServiceLimiter, self).__init__()
+        self._semaphore = semaphore.Semaphore(CONF.status_poll_concurrency)
+        self._next_query = 0
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        rate_limit = CONF.status_poll_rate_limit
+        if rate_limit > 0:
+            now = time.time()
+            delay = self._next_query - now
+            self._next_query = max(now, self._next_query) + 1.0 / rate_limit
+            if delay > 0:
+                eventlet.sleep(delay)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._semaphore.release()
+
+
+class _Waiter(object):
+    def __init__(self, key, resource_id, get_status_func, list_statuses_func,
+                 interval, success_statuses, failure_statuses,
+                 ignore_statuses, ignore_unexpected):
+        super(_Waiter, self).__init__()
+        self.key = key
+        self.resource_id = resource_id
+        self.get_status_func = get_status_func
+        self.list_statuses_func = list_statuses_func
+        self._schedule = get_poll_schedule(interval)
+        self._intervals = self._schedule.intervals()
+        self._started_at = time.time()
+        self.next_poll = self._started_at + next(self._intervals)
+        self.event = event.Event()
+        self._success_statuses = success_statuses
+        self._failure_statuses = failure_statuses
+        self._ignore_statuses = ignore_statuses
+        self._ignore_unexpected = ignore_unexpected
+
+    @property
+    def pending_statuses(self):
+        return self._ignore_statuses
+
+    def update(self, status):
+        if status in self._success_statuses:
+            self._schedule.on_completed(time.time() - self._started_at)
+            self.event.send(True)
+        elif status in self._failure_statuses:
+            self.event.send(False)
+        elif status in self._ignore_statuses or self._ignore_unexpected:
+            self.next_poll = time.time() + next(self._intervals)
+        else:
+            self.event.send(False)
+
+
+class StatusPoller(object):
+    """Poll the status of many resources with few queries
+
+    The resources which are due for polling are grouped by service, resource
+    type and project. The statuses of a large enough group are listed with a
+    single query, those of a smaller group with a query per resource. The
+    queries to each service are limited in concurrency and rate.
+    """
+
+    def __init__(self):
+        super(StatusPoller, self).__init__()
+        self._waiters = []
+        self._limiters = collections.defaultdict(_ServiceLimiter)
+        self._thread = None
+        self._wakeup = None
+        self._sleep_until = None
+
+    def wait(self, context, service, resource_type, resource_id,
+             get_status_func, list_statuses_func, interval,
+             success_statuses=set(), failure_statuses=set(),
+             ignore_statuses=set(), ignore_unexpected=False):
+        """Wait for a resource to reach a success or failure status
+
+        get_status_func returns the status of the resource, while
+        list_statuses_func takes a list of resource ids and the statuses
+        they are expected to still be in, and returns a dict of their
+        statuses. interval is either a number of seconds or a poll
+        schedule. Returns True if the resource reached a success status, and
+        False otherwise.
+        """
+        waiter = _Waiter((service, resource_type, context.project_id),
+                         resource_id, get_status_func, list_statuses_func,
+                         interval, success_statuses, failure_statuses,
+                         ignore_statuses, ignore_unexpected)
+        self._waiters.append(waiter)
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+        elif (self._sleep_until is not None and
+              waiter.next_poll < self._sleep_until and
+              not self._wakeup.ready()):
+            self._wakeup.send()
+        return waiter.event.wait()
+
+    def _sleep(self, seconds):
+        self._wakeup = event.Event()
+        self._sleep_until = time.time() + seconds
+        with eventlet.Timeout(seconds, False):
+            self._wakeup.wait()
+        self._sleep_until = None
+
+    def _run(self):
+        try:
+            while self._waiters:
+                now = time.time()
+                due_waiters = [waiter for waiter in self._waiters
+                               if waiter.next_poll <= now]
+                if not due_waiters:
+                    self._sleep(min(waiter.next_poll
+                                    for waiter in self._waiters) - now)
+                    continue
+
+                self._poll(due_waiters)
+                self._waiters = [waiter for waiter in self._waiters
+                                 if not waiter.event.ready()]
+                eventlet.sleep(0)
+        finally:
+            self._thread = None
+
+    def _poll(self, waiters):
+        groups = collections.OrderedDict()
+        for waiter in waiters:
+            groups.setdefault(waiter.key, []).append(waiter)
+
+        queries = []
+        for group in groups.values():
+            if len(group) >= CONF.status_poll_list_threshold:
+                queries.append((group, True))
+            else:
+                queries.extend(([waiter], False) for waiter in group)
+
+        pool = greenpool.GreenPool(len(queries))
+        for waiters, listed in queries:
+            pool.spawn_n(self._query, waiters, listed)
+        pool.waitall()
+
+    def _query(self, waiters, listed):
+        service = waiters[0].key[0]
+        try:
+            with self._limiters[service]:
+                if listed:
+                    LOG.debug('Listing the status of %(count)d %(type)s',
+                              {'count': len(waiters),
+                               'type': waiters[0].key[1]})
+                    pending_statuses = set()
+                    for waiter in waiters:
+                        pending_statuses.update(waiter.pending_statuses)
+                    statuses = waiters[0].list_statuses_func(
+                        [waiter.resource_id for waiter in waiters],
+                        sorted(pending_statuses))
+                else:
+                    statuses = {
+                        waiters[0].resource_id: waiters[0].get_status_func()
+                    }
+        except Exception as e:
+            for waiter in waiters:
+                waiter.event.send_exception(e)
+            return
+
+        for waiter in waiters:
+            waiter.update(statuses.get(waiter.resource_id))
+
+
+_status_poller = StatusPoller()
+
+
+def get_status_poller():
+    return _status_poller
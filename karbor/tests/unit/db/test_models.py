@@ -657,3 +657,30 @@ class CheckpointRecordTestCase(ModelBaseTestCase):
         self.assertRaises(exception.CheckpointRecordNotFound,
                           db.checkpoint_record_update,
                           self.ctxt, 42, {})
+
+    def test_checkpoint_record_create_or_update(self):
+        values = dict(self.fake_checkpoint_record)
+        db.checkpoint_record_create_or_update(self.ctxt, values)
+        db.checkpoint_record_create_or_update(
+            self.ctxt, dict(values, checkpoint_status='error'))
+        checkpoint_record = db.checkpoint_record_get(self.ctxt, values['id'])
+        self.assertEqual('error', checkpoint_record['checkpoint_status'])
+
+        db.checkpoint_record_destroy(self.ctxt, values['id'])
+        db.checkpoint_record_create_or_update(self.ctxt, values)
+        checkpoint_record = db.checkpoint_record_get(self.ctxt, values['id'])
+        self.assertEqual('available', checkpoint_record['checkpoint_status'])
+
+    def test_checkpoint_record_get_all_by_date(self):
+        for day in range(1, 4):
+            values = dict(self.fake_checkpoint_record,
+                          id=uuidutils.generate_uuid(),
+                          created_at=datetime(2017, 1, day, 12))
+            db.checkpoint_record_create(self.ctxt, values)
+        checkpoint_records = db.checkpoint_record_get_all_by_filters_sort(
+            self.ctxt, {'start_date': datetime(2017, 1, 2),
+                        'end_date': datetime(2017, 1, 3)},
+            sort_keys=['created_at'], sort_dirs=['asc'])
+        self.assertEqual([datetime(2017, 1, 2, 12), datetime(2017, 1, 3, 12)],
+                         [checkpoint_record['created_at']
+                          for checkpoint_record in checkpoint_records])
@@ -34,7 +34,12 @@ class FakeUserTrustManager(object):
 
 
 class FakeCheckPoint(object):
-    def create(self, provider_id, plan_id):
+    def __init__(self):
+        super(FakeCheckPoint, self).__init__()
+        self.created = []
+
+    def create(self, provider_id, plan_id, checkpoint_extra_info=None):
+        self.created.append((provider_id, plan_id, checkpoint_extra_info))
         return
 
 
@@ -90,6 +95,11 @@ class ProtectOperationTestCase(base.TestCase):
         self.assertIsNotNone(logs)
         log = logs.objects[0]
         self.assertTrue(now, log.triggered_time)
+        self.assertEqual(
+            [('123', '123', {'create_by': 'operation-engine',
+                             'scheduled_operation_id':
+                                 self._operation_db.id})],
+            self._fake_karbor_client.checkpoints.created)
 
     @mock.patch.object(base_operation.Operation, '_create_karbor_client')
     def test_resume(self, client):
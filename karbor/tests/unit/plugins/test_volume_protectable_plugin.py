@@ -109,6 +109,30 @@ class VolumeProtectablePluginTest(base.TestCase):
                              Resource("OS::Nova::Server", 'abcdef', 'name',
                                       {'availability_zone': 'az1'})))
 
+    @mock.patch.object(volumes.VolumeManager, 'list')
+    def test_get_dependent_resources_index(self, mock_volume_list):
+        plugin = VolumeProtectablePlugin(self._context)
+        volumes = [
+            mock.Mock(name='Volume', id='123', availability_zone='az1',
+                      attachments=[{'server_id': 'abcdef'}]),
+            mock.Mock(name='Volume', id='456', availability_zone='az1',
+                      attachments=[]),
+        ]
+        setattr(volumes[0], 'os-vol-tenant-attr:tenant_id', 'abcd')
+        setattr(volumes[1], 'os-vol-tenant-attr:tenant_id', 'abcd')
+        setattr(volumes[0], 'name', 'name123')
+        setattr(volumes[1], 'name', 'name456')
+        mock_volume_list.return_value = volumes
+
+        vol_123 = Resource('OS::Cinder::Volume', '123', 'name123',
+                           {'availability_zone': 'az1'})
+        vol_456 = Resource('OS::Cinder::Volume', '456', 'name456',
+                           {'availability_zone': 'az1'})
+        self.assertEqual(
+            {constants.SERVER_RESOURCE_TYPE: {'abcdef': [vol_123]},
+             constants.PROJECT_RESOURCE_TYPE: {'abcd': [vol_123, vol_456]}},
+            plugin.get_dependent_resources_index(self._context))
+
     @mock.patch.object(volumes.VolumeManager, 'list')
     def test_get_project_dependent_resources(self, mock_volume_list):
         project = project_info('abcd', constants.PROJECT_RESOURCE_TYPE,
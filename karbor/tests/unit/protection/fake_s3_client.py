@@ -27,6 +27,7 @@ class FakeS3Connection(object):
         super(FakeS3Connection, self).__init__()
         self.s3_dir = {}
         self.object_headers = {}
+        self.uploads = {}
 
     def create_bucket(self, Bucket):
         self.s3_dir[Bucket] = {
@@ -54,21 +55,62 @@ class FakeS3Connection(object):
     def put_object(self, Bucket, Key, Body, Metadata=None):
         if Bucket in self.s3_dir.keys():
             self.s3_dir[Bucket]['Keys'][Key] = {
-                'Body': FakeS3Stream(Body),
+                'Body': Body,
                 'Metadata': Metadata if Metadata else {}
             }
         else:
             raise ClientError("error_bucket")
 
-    def get_object(self, Bucket, Key):
+    def get_object(self, Bucket, Key, Range=None):
         if Bucket in self.s3_dir.keys():
             if Key in self.s3_dir[Bucket]['Keys'].keys():
-                return self.s3_dir[Bucket]['Keys'][Key]
+                obj = self.s3_dir[Bucket]['Keys'][Key]
+                if Range is None:
+                    return {
+                        'Body': FakeS3Stream(obj['Body']),
+                        'Metadata': obj['Metadata']
+                    }
+                size = len(obj['Body'])
+                if size == 0:
+                    raise ClientError({'Error': {'Code': 'InvalidRange'}},
+                                      'GetObject')
+                start, end = Range[len('bytes='):].split('-')
+                start, end = int(start), min(int(end), size - 1)
+                return {
+                    'Body': FakeS3Stream(obj['Body'][start:end + 1]),
+                    'Metadata': obj['Metadata'],
+                    'ContentRange': 'bytes %d-%d/%d' % (start, end, size)
+                }
             else:
                 raise ClientError("error_object")
         else:
             raise ClientError("error_bucket")
 
+    def create_multipart_upload(self, Bucket, Key, Metadata=None):
+        if Bucket not in self.s3_dir.keys():
+            raise ClientError("error_bucket")
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {
+            'Key': Key,
+            'Metadata': Metadata if Metadata else {},
+            'Parts': {}
+        }
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        self.uploads[UploadId]['Parts'][PartNumber] = Body
+        return {'ETag': 'etag-%s' % PartNumber}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        body = b''.join(upload['Parts'][part['PartNumber']]
+                        for part in MultipartUpload['Parts'])
+        self.put_object(Bucket, Key, body, upload['Metadata'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
     def delete_object(self, Bucket, Key):
         if Bucket in self.s3_dir.keys():
             if Key in self.s3_dir[Bucket]['Keys'].keys():
@@ -78,10 +120,24 @@ class FakeS3Connection(object):
         else:
             raise ClientError("error_bucket")
 
+    def delete_objects(self, Bucket, Delete):
+        if Bucket not in self.s3_dir.keys():
+            raise ClientError("error_bucket")
+        for obj in Delete['Objects']:
+            self.s3_dir[Bucket]['Keys'].pop(obj['Key'], None)
+        return {}
+
 
 class FakeS3Stream(object):
     def __init__(self, data):
         self.data = data
 
-    def read(self):
-        return self.data
+    def read(self, amt=None):
+        if amt is None:
+            data, self.data = self.data, self.data[len(self.data):]
+        else:
+            data, self.data = self.data[:amt], self.data[amt:]
+        return data
+
+    def close(self):
+        pass
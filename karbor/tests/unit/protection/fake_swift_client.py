@@ -10,9 +10,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import os
+import six
+from six.moves.urllib import parse
 import tempfile
 
+from oslo_serialization import jsonutils
 from swiftclient import ClientException
 
 
@@ -30,6 +34,7 @@ class FakeSwiftConnection(object):
         super(FakeSwiftConnection, self).__init__()
         self.swiftdir = tempfile.mkdtemp()
         self.object_headers = {}
+        self.manifests = {}
 
     def put_container(self, container):
         container_dir = self.swiftdir + "/" + container
@@ -41,55 +46,120 @@ class FakeSwiftConnection(object):
     def get_container(self, container, prefix, limit, marker,
                       end_marker, full_listing):
         container_dir = self.swiftdir + "/" + container
-        body = []
-        if prefix:
-            objects_dir = container_dir + "/" + prefix
-        else:
-            objects_dir = container_dir
-        for f in os.listdir(objects_dir):
-            if os.path.isfile(objects_dir + "/" + f):
-                body.append({"name": f})
+        names = []
+        for root, _dirs, files in os.walk(container_dir):
+            for f in files:
+                names.append(os.path.join(root, f)[len(container_dir) + 1:])
+        body = [{"name": name} for name in sorted(names)
+                if (not prefix or name.startswith(prefix)) and
+                (not marker or name > marker) and
+                (not end_marker or name < end_marker)]
+        return None, body[:limit] if limit is not None else body
+
+    def post_account(self, headers, query_string=None, data=None):
+        if query_string != 'bulk-delete':
+            raise ClientException("error_query_string")
+        result = {'Number Deleted': 0, 'Number Not Found': 0, 'Errors': []}
+        for path in data.split("\n"):
+            _empty, container, obj = parse.unquote(path).split("/", 2)
+            obj_file = self.swiftdir + "/" + container + "/" + obj
+            if os.path.exists(obj_file) is True:
+                os.remove(obj_file)
+                self.object_headers.pop(obj_file, None)
+                self.manifests.pop(obj_file, None)
+                result['Number Deleted'] += 1
             else:
-                body.append({"subdir": f})
-        return None, body
+                result['Number Not Found'] += 1
+        result['Response Status'] = '200 OK'
+        return {}, jsonutils.dumps(result)
 
-    def put_object(self, container, obj, contents, headers=None):
+    def put_object(self, container, obj, contents, headers=None,
+                   query_string=None):
         container_dir = self.swiftdir + "/" + container
         obj_file = container_dir + "/" + obj
         obj_dir = obj_file[0:obj_file.rfind("/")]
         if os.path.exists(container_dir) is True:
             if os.path.exists(obj_dir) is False:
                 os.makedirs(obj_dir)
-            with open(obj_file, "w") as f:
+            if not isinstance(contents, (six.string_types, six.binary_type)):
+                contents = b''.join(contents)
+            segments = None
+            if query_string == 'multipart-manifest=put':
+                # Store the concatenated segments, like swift returns them
+                segments = [self.swiftdir + segment['path']
+                            for segment in jsonutils.loads(contents)]
+                contents = b''
+                for segment_file in segments:
+                    with open(segment_file, "rb") as f:
+                        contents += f.read()
+            mode = "wb" if isinstance(contents, six.binary_type) else "w"
+            with open(obj_file, mode) as f:
                 f.write(contents)
 
             self.object_headers[obj_file] = {}
-            for key, value in headers.items():
+            for key, value in (headers or {}).items():
                 self.object_headers[obj_file][str(key)] = str(value)
-            return
+            if segments is not None:
+                self.manifests[obj_file] = segments
+                self.object_headers[obj_file][
+                    'x-static-large-object'] = 'True'
+            if isinstance(contents, six.text_type):
+                contents = contents.encode('utf-8')
+            return hashlib.md5(contents).hexdigest()
         else:
             raise ClientException("error_container")
 
-    def get_object(self, container, obj):
+    def head_object(self, container, obj):
+        container_dir = self.swiftdir + "/" + container
+        obj_file = container_dir + "/" + obj
+        if os.path.exists(obj_file) is True:
+            return self.object_headers[obj_file]
+        raise ClientException("error_obj")
+
+    def get_object(self, container, obj, resp_chunk_size=None,
+                   query_string=None):
         container_dir = self.swiftdir + "/" + container
         obj_file = container_dir + "/" + obj
         if os.path.exists(container_dir) is True:
             if os.path.exists(obj_file) is True:
+                if (query_string == 'multipart-manifest=get' and
+                        obj_file in self.manifests):
+                    manifest = [{'name': segment_file[len(self.swiftdir):]}
+                                for segment_file in self.manifests[obj_file]]
+                    return (self.object_headers[obj_file],
+                            jsonutils.dumps(manifest))
+                if resp_chunk_size is not None:
+                    with open(obj_file, "rb") as f:
+                        data = f.read()
+                    return self.object_headers[obj_file], iter(
+                        [data[i:i + resp_chunk_size]
+                         for i in range(0, len(data), resp_chunk_size)])
                 with open(obj_file, "r") as f:
                     return self.object_headers[obj_file], f.read()
             else:
-                raise ClientException("error_obj")
+                raise ClientException("error_obj", http_status=404)
         else:
             raise ClientException("error_container")
 
-    def delete_object(self, container, obj):
+    def delete_object(self, container, obj, query_string=None,
+                      response_dict=None):
         container_dir = self.swiftdir + "/" + container
         obj_file = container_dir + "/" + obj
         if os.path.exists(container_dir) is True:
             if os.path.exists(obj_file) is True:
                 os.remove(obj_file)
-                self.object_headers.pop(obj_file)
+                self.object_headers.pop(obj_file, None)
+                segments = self.manifests.pop(obj_file, None)
+                status = 204
+                if (query_string == 'multipart-manifest=delete' and
+                        segments is not None):
+                    for segment_file in segments:
+                        os.remove(segment_file)
+                        self.object_headers.pop(segment_file, None)
+                    status = 200
+                if response_dict is not None:
+                    response_dict['status'] = status
             else:
-                raise ClientException("error_obj")
+                raise ClientException("error_obj", http_status=404)
         else:
             raise ClientException("error_container")
@@ -66,7 +66,8 @@ def fake_protection_plan():
                            {"id": "D", "type": "fake", "name": "fake"}],
                        'protection_provider': None,
                        'parameters': {},
-                       'provider_id': 'fake_id'
+                       'provider_id': 'fake_id',
+                       'project_id': 'fake_project_id'
                        }
     return protection_plan
 
@@ -288,6 +289,7 @@ class FakeProvider(provider.PluggableProtectionProvider):
         self._plugin_map = {
             'fake': FakeProtectionPlugin,
         }
+        self._plugins = None
 
     def get_checkpoint_collection(self):
         return FakeCheckpointCollection()
@@ -359,3 +361,6 @@ class FakeFlowEngine(object):
         if target:
             return flow_engine.storage.fetch(target)
         return flow_engine.storage.fetch_all()
+
+    def add_discard_listener(self, listener):
+        pass
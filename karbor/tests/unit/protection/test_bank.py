@@ -12,13 +12,21 @@
 
 from collections import OrderedDict
 from copy import deepcopy
+import time
+
+import eventlet
+import mock
 from oslo_utils import uuidutils
 
 from karbor import exception
 from karbor.services.protection.bank_plugin import Bank
 from karbor.services.protection.bank_plugin import BankPlugin
 from karbor.services.protection.bank_plugin import BankSection
+from karbor.services.protection.bank_plugin import ChunkStore
+from karbor.services.protection.bank_plugin import IterableReader
 from karbor.services.protection.bank_plugin import LeasePlugin
+from karbor.services.protection.bank_plugin import MetadataCache
+from karbor.services.protection import governor
 from karbor.tests import base
 
 
@@ -38,18 +46,15 @@ class _InMemoryBankPlugin(BankPlugin):
 
     def list_objects(self, prefix=None, limit=None, marker=None,
                      sort_dir=None):
-        marker_found = marker is None
-        for key in self._data.keys():
-            if marker is not True and key != marker:
-                if marker_found:
-                    if prefix is None or key.startswith(prefix):
-                        if limit is not None:
-                            limit -= 1
-                            if limit < 0:
-                                return
-                        yield key
-            else:
-                marker_found = True
+        for key in sorted(self._data.keys()):
+            if marker is not None and key <= marker:
+                continue
+            if prefix is None or key.startswith(prefix):
+                if limit is not None:
+                    limit -= 1
+                    if limit < 0:
+                        return
+                yield key
 
     def delete_object(self, key):
         del self._data[key]
@@ -152,6 +157,16 @@ class BankSectionTest(base.TestCase):
         section.delete_object("/b")
         section.delete_object("//c")
 
+    def test_batch_objects(self):
+        bank = self._create_test_bank()
+        section = BankSection(bank, "/prefix", is_writable=True)
+        section.update_objects({"a": "value-a", "/b": "value-b"})
+        self.assertEqual("value-a", bank.get_object("/prefix/a"))
+        self.assertEqual({"a": "value-a", "/b": "value-b"},
+                         section.get_objects(["a", "/b"]))
+        section.delete_objects(["a", "/b"])
+        self.assertEqual([], list(bank.list_objects("/prefix")))
+
     def test_list_objects(self):
         bank = self._create_test_bank()
         section = BankSection(bank, "/prefix", is_writable=True)
@@ -193,6 +208,11 @@ class BankSectionTest(base.TestCase):
             section.delete_object,
             "object",
         )
+        self.assertRaises(
+            exception.BankReadonlyViolation,
+            section.delete_objects,
+            ["object"],
+        )
 
     def test_double_dot_key(self):
         bank = self._create_test_bank()
@@ -249,3 +269,230 @@ class BankSectionTest(base.TestCase):
             "/mid",
             is_writable=True,
         )
+
+
+class ChunkStoreTest(base.TestCase):
+    def setUp(self):
+        super(ChunkStoreTest, self).setUp()
+        self.plugin = _InMemoryBankPlugin()
+        self.bank = Bank(self.plugin)
+        self.chunk_store = self.bank.get_chunk_store()
+
+    def test_put_same_chunk_once(self):
+        self.plugin.update_object = mock.MagicMock(
+            side_effect=self.plugin.update_object)
+        hash1 = self.chunk_store.put_chunk('ref1', b'data')
+        hash2 = self.chunk_store.put_chunk('ref2', b'data')
+        self.assertEqual(hash1, hash2)
+        self.assertEqual(ChunkStore.hash_chunk(b'data'), hash1)
+        self.assertEqual(b'data', self.chunk_store.get_chunk(hash1))
+        self.assertEqual(2, self.chunk_store.count_references(hash1))
+        data_updates = [call for call in self.plugin.update_object.mock_calls
+                        if call[1][0].endswith('/data')]
+        self.assertEqual(1, len(data_updates))
+
+    def test_release_chunk(self):
+        chunk_hash = self.chunk_store.put_chunk('ref1', b'data')
+        self.chunk_store.put_chunk('ref2', b'data')
+        self.chunk_store.release_chunk('ref1', chunk_hash)
+        self.assertTrue(self.chunk_store.has_chunk(chunk_hash))
+        self.chunk_store.release_chunk('ref2', chunk_hash)
+        self.assertFalse(self.chunk_store.has_chunk(chunk_hash))
+        self.assertRaises(exception.BankGetObjectFailed,
+                          self.chunk_store.get_chunk, chunk_hash)
+
+    def test_release_chunks_recounts_references(self):
+        chunk_hash = self.chunk_store.put_chunk('ref1', b'data')
+        list_chunk = self.chunk_store._list_chunk
+        counts = []
+
+        def _put_during_release(listed_hash):
+            # A put adds its reference between the two counts of the release
+            counts.append(listed_hash)
+            if len(counts) == 2:
+                self.chunk_store._section.update_object(
+                    '%s/refs/ref2' % listed_hash, 'ref2')
+            return list_chunk(listed_hash)
+
+        with mock.patch.object(self.chunk_store, '_list_chunk',
+                               side_effect=_put_during_release):
+            self.chunk_store.release_chunks('ref1', [chunk_hash])
+
+        self.assertEqual(2, len(counts))
+        self.assertTrue(self.chunk_store.has_chunk(chunk_hash))
+        self.assertEqual(
+            [], list(self.plugin.list_objects(
+                prefix='/chunks/%s/releases/' % chunk_hash)))
+
+    def test_release_chunks_lists_in_parallel(self):
+        hashes = [self.chunk_store.put_chunk('ref1', data)
+                  for data in (b'a', b'b', b'c')]
+        self.chunk_store.put_chunk('ref2', b'b')
+        self.chunk_store.release_chunks('ref1', hashes)
+        self.assertEqual([False, True, False],
+                         [self.chunk_store.has_chunk(chunk_hash)
+                          for chunk_hash in hashes])
+
+    def test_put_waits_for_pending_release(self):
+        chunk_hash = ChunkStore.hash_chunk(b'data')
+        release = '%s/releases/ref1' % chunk_hash
+        self.chunk_store._section.update_object(
+            release, {'expires_at': time.time() + 60})
+        self.chunk_store.release_poll_interval = 0.01
+
+        def _finish_release():
+            eventlet.sleep(0.05)
+            self.chunk_store._section.delete_object(release)
+
+        releaser = eventlet.spawn(_finish_release)
+        self.chunk_store.put_chunk('ref2', b'data')
+        releaser.wait()
+
+        self.assertEqual(b'data', self.chunk_store.get_chunk(chunk_hash))
+
+    def test_put_ignores_expired_release(self):
+        chunk_hash = self.chunk_store.put_chunk('ref1', b'data')
+        release = '%s/releases/ref0' % chunk_hash
+        self.chunk_store._section.update_object(
+            release, {'expires_at': time.time() - 1})
+
+        self.chunk_store.put_chunk('ref2', b'data')
+
+        self.assertEqual(2, self.chunk_store.count_references(chunk_hash))
+        self.assertRaises(exception.BankGetObjectFailed,
+                          self.chunk_store._section.get_object, release)
+
+    def test_read_only_section(self):
+        section = BankSection(self.bank, "/prefix", is_writable=False)
+        self.assertRaises(exception.BankReadonlyViolation,
+                          section.get_chunk_store)
+
+
+class BankStreamTest(base.TestCase):
+    def test_default_object_stream(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        section.write_object_stream("key", iter([b"abc", b"def"]))
+        self.assertEqual(b"abcdef", bank.get_object("/prefix/key"))
+        reader = section.open_object_reader("key")
+        self.assertEqual(b"abcdef", reader.read())
+
+    def test_iterable_reader(self):
+        close_func = mock.MagicMock()
+        reader = IterableReader(iter([b"abc", b"de", b"f"]), close_func)
+        self.assertEqual(b"ab", reader.read(2))
+        self.assertEqual(b"c", reader.read(2))
+        self.assertEqual(b"def", reader.read())
+        self.assertEqual(b"", reader.read(1))
+        reader.close()
+        close_func.assert_called_once_with()
+
+    def test_read_only_object_stream(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix", is_writable=False)
+        self.assertRaises(exception.BankReadonlyViolation,
+                          section.write_object_stream,
+                          "key", iter([b"abc"]))
+
+
+class BankPutLimitTest(base.TestCase):
+    def test_put_limited(self):
+        governor.get_governor().configure('provider', {'bank.put': 1})
+        self.addCleanup(governor.get_governor().configure, 'provider')
+        limiter = governor.get_governor().get_limiter('provider', 'bank.put')
+        plugin = _InMemoryBankPlugin()
+        active = []
+
+        def update_object(key, value):
+            active.append(limiter.active)
+        plugin.update_object = update_object
+        bank = Bank(plugin, limits_scope='provider')
+
+        bank.update_object("/a", "a")
+        bank.write_object_stream("/b", iter([b"b"]))
+        bank.update_objects({"/c": "c"})
+        self.assertEqual([1, 1, 1], active)
+        self.assertEqual(0, limiter.active)
+
+
+class BankMetadataCacheTest(base.TestCase):
+    def setUp(self):
+        super(BankMetadataCacheTest, self).setUp()
+        self.plugin = _InMemoryBankPlugin()
+        self.plugin.get_object = mock.MagicMock(
+            side_effect=self.plugin.get_object)
+        self.cache = MetadataCache(max_size=2, ttl=60)
+        self.bank = Bank(self.plugin, cache=self.cache)
+
+    def test_get_object_cached(self):
+        self.bank.update_object("/a", {"status": "available"})
+        self.assertEqual({"status": "available"}, self.bank.get_object("/a"))
+        value = self.bank.get_object("a")
+        self.assertEqual({"status": "available"}, value)
+        self.assertEqual(1, self.plugin.get_object.call_count)
+        # Changing the returned value doesn't change the cached one
+        value["status"] = "deleted"
+        self.assertEqual({"status": "available"}, self.bank.get_object("/a"))
+        self.assertEqual({'hits': 2, 'misses': 1, 'size': 1},
+                         self.bank.get_cache_stats())
+
+    def test_data_objects_not_cached(self):
+        self.bank.update_object("/a", "data")
+        self.bank.get_object("/a")
+        self.bank.get_object("/a")
+        self.assertEqual(2, self.plugin.get_object.call_count)
+
+    def test_invalidate(self):
+        self.bank.update_object("/a", {"status": "protecting"})
+        self.bank.get_object("/a")
+        self.bank.update_object("/a", {"status": "available"})
+        self.assertEqual({"status": "available"}, self.bank.get_object("/a"))
+        self.bank.delete_objects(["/a"])
+        self.assertRaises(exception.BankGetObjectFailed,
+                          self.bank.get_object, "/a")
+
+    def test_get_objects_cached(self):
+        self.bank.update_objects({"/a": {"a": 1}, "/b": {"b": 2}})
+        self.bank.get_object("/a")
+        self.plugin.get_objects = mock.MagicMock(
+            side_effect=self.plugin.get_objects)
+        self.assertEqual({"/a": {"a": 1}, "/b": {"b": 2}},
+                         self.bank.get_objects(["/a", "/b"]))
+        self.plugin.get_objects.assert_called_once_with(["/b"])
+
+    def test_get_object_uncached(self):
+        self.bank.update_object("/a", {"status": "protecting"})
+        self.bank.get_object("/a")
+        # Updated by another service
+        self.plugin.update_object("/a", {"status": "available"})
+        self.assertEqual({"status": "protecting"}, self.bank.get_object("/a"))
+        self.assertEqual({"status": "available"},
+                         self.bank.get_object("/a", cached=False))
+        self.assertEqual({"a": {"status": "available"}},
+                         self.bank.get_objects(["a"], cached=False))
+        # The cache holds the value read
+        self.assertEqual({"status": "available"}, self.bank.get_object("/a"))
+
+    def test_lru_eviction(self):
+        for key in ("/a", "/b", "/c"):
+            self.bank.update_object(key, {"key": key})
+        self.bank.get_object("/a")
+        self.bank.get_object("/b")
+        self.bank.get_object("/a")
+        self.bank.get_object("/c")
+        self.assertEqual(2, self.cache.get_stats()['size'])
+        self.bank.get_object("/a")
+        self.bank.get_object("/b")
+        self.assertEqual(4, self.plugin.get_object.call_count)
+
+    @mock.patch('time.time')
+    def test_ttl_expiry(self, mock_time):
+        mock_time.return_value = 1000
+        self.bank.update_object("/a", {"a": 1})
+        self.bank.get_object("/a")
+        mock_time.return_value = 1059
+        self.bank.get_object("/a")
+        self.assertEqual(1, self.plugin.get_object.call_count)
+        mock_time.return_value = 1061
+        self.bank.get_object("/a")
+        self.assertEqual(2, self.plugin.get_object.call_count)
@@ -10,6 +10,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+from oslo_config import cfg
+
 from karbor.resource import Resource
 from karbor.services.protection import bank_plugin
 from karbor.services.protection import checkpoint
@@ -20,6 +23,8 @@ from karbor.tests.unit.protection.fakes import fake_protection_plan
 from karbor.tests.unit.protection.test_bank import _InMemoryBankPlugin
 from karbor.tests.unit.protection.test_bank import _InMemoryLeasePlugin
 
+CONF = cfg.CONF
+
 A = Resource(id="A", type="fake", name="fake")
 B = Resource(id="B", type="fake", name="fake")
 C = Resource(id="C", type="fake", name="fake")
@@ -59,6 +64,7 @@ class CheckpointTest(base.TestCase):
         )
         self.assertEqual(owner_id, cp.owner_id)
         self.assertEqual("protecting", cp.status)
+        self.assertEqual(CONF.host, cp.host)
 
     def test_resource_graph(self):
         bank = bank_plugin.Bank(_InMemoryBankPlugin())
@@ -89,3 +95,51 @@ class CheckpointTest(base.TestCase):
         self.assertEqual(len(resource_graph), len(cp.resource_graph))
         for start_node in resource_graph:
             self.assertIn(start_node, cp.resource_graph)
+
+    def test_resource_graph_memoized(self):
+        bank = bank_plugin.Bank(_InMemoryBankPlugin())
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        cp.resource_graph = graph.build_graph([A, B, C, D],
+                                              resource_map.__getitem__)
+        cp.commit()
+        cp.reload_meta_data()
+
+        with mock.patch.object(graph, 'deserialize_resource_graph',
+                               wraps=graph.deserialize_resource_graph) as m:
+            resource_graph = cp.resource_graph
+            for i in range(10):
+                self.assertIs(resource_graph, cp.resource_graph)
+            self.assertEqual(1, m.call_count)
+
+            # A reload invalidates the memoized graph
+            cp.reload_meta_data()
+            self.assertEqual(resource_graph, cp.resource_graph)
+            self.assertEqual(2, m.call_count)
+
+    def test_compact_resource_graph(self):
+        self.override_config('compact_resource_graph', True)
+        bank = bank_plugin.Bank(_InMemoryBankPlugin())
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        resource_graph = graph.build_graph([A, B, C, D],
+                                           resource_map.__getitem__)
+        cp.resource_graph = resource_graph
+        cp.commit()
+        cp.reload_meta_data()
+
+        self.assertTrue(cp._md_cache["resource_graph"].startswith(
+            "msgpack:"))
+        self.assertEqual(set(resource_graph), set(cp.resource_graph))
@@ -10,15 +10,28 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import calendar
 from datetime import datetime
 import mock
 
 from oslo_utils import timeutils
 
+from karbor import context
+from karbor import db
+from karbor import exception
+from karbor.resource import Resource
 from karbor.services.protection.bank_plugin import Bank
+from karbor.services.protection.checkpoint import _get_summary_segment_key
+from karbor.services.protection.checkpoint import \
+    _get_summary_segment_prefix
+from karbor.services.protection.checkpoint import Checkpoint
+from karbor.services.protection.checkpoint import \
+    checkpoint_record_to_summary
 from karbor.services.protection.checkpoint import CheckpointCollection
+from karbor.services.protection.graph import build_graph
 from karbor.tests import base
 from karbor.tests.unit.protection.fakes import fake_protection_plan
+from karbor.tests.unit.protection.fakes import resource_graph
 from karbor.tests.unit.protection.test_bank import _InMemoryBankPlugin
 from karbor.tests.unit.protection.test_bank import _InMemoryLeasePlugin
 
@@ -28,6 +41,17 @@ class CheckpointCollectionTest(base.TestCase):
         return CheckpointCollection(Bank(_InMemoryBankPlugin()),
                                     _InMemoryLeasePlugin())
 
+    def _create_checkpoints(self, collection, plan, day, count):
+        """Create count checkpoints, a second apart, on the given day"""
+        date = datetime.strptime(day, "%Y-%m-%d")
+        timestamps = iter(range(calendar.timegm(date.timetuple()),
+                                calendar.timegm(date.timetuple()) + count))
+        with mock.patch.object(timeutils, 'utcnow') as mock_utcnow, \
+                mock.patch.object(timeutils, 'utcnow_ts') as mock_ts:
+            mock_utcnow.return_value = date
+            mock_ts.side_effect = lambda: next(timestamps)
+            return [collection.create(plan).id for i in range(count)]
+
     def test_create_checkpoint(self):
         collection = self._create_test_collection()
         checkpoint = collection.create(fake_protection_plan())
@@ -86,6 +110,81 @@ class CheckpointCollectionTest(base.TestCase):
                                                  end_date=date2)),
                          checkpoints_date_2)
 
+    def test_list_checkpoints_by_date_lists_window_only(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        provider_id = plan['provider_id']
+        checkpoints = {
+            day: self._create_checkpoints(collection, plan, day, 3)
+            for day in ("2016-06-10", "2016-06-12", "2016-06-13")
+        }
+        list_objects = mock.MagicMock(
+            side_effect=collection._indices_section.list_objects)
+        collection._indices_section.list_objects = list_objects
+        ids = collection.list_ids(
+            provider_id=provider_id,
+            start_date=datetime.strptime("2016-06-12", "%Y-%m-%d"),
+            end_date=datetime.strptime("2016-06-13", "%Y-%m-%d"))
+        self.assertEqual(checkpoints["2016-06-12"] + checkpoints["2016-06-13"],
+                         ids)
+        self.assertEqual(["/by-date/2016-06-12/", "/by-date/2016-06-13/"],
+                         [call[1]['prefix']
+                          for call in list_objects.call_args_list])
+
+        # Page through the window with the plan index
+        ids = collection.list_ids(
+            provider_id=provider_id, plan_id=plan['id'], limit=2,
+            marker=checkpoints["2016-06-12"][1],
+            start_date=datetime.strptime("2016-06-10", "%Y-%m-%d"),
+            end_date=datetime.strptime("2016-06-13", "%Y-%m-%d"))
+        self.assertEqual([checkpoints["2016-06-12"][2],
+                          checkpoints["2016-06-13"][0]], ids)
+
+    def test_list_checkpoints_newest_first(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        provider_id = plan['provider_id']
+        checkpoints = (
+            self._create_checkpoints(collection, plan, "2016-06-12", 3) +
+            self._create_checkpoints(collection, plan, "2016-06-13", 3))
+        checkpoints.reverse()
+        # Check the indices of older checkpoints were built, done only once
+        collection._ensure_desc_indices()
+        list_objects = mock.MagicMock(
+            side_effect=collection._indices_section.list_objects)
+        collection._indices_section.list_objects = list_objects
+        self.assertEqual(checkpoints[:2], collection.list_ids(
+            provider_id, limit=2, sort_dir="desc"))
+        list_objects.assert_called_once_with(
+            prefix="/by-provider-desc/%s/" % provider_id, limit=2,
+            marker=None)
+        self.assertEqual(checkpoints[2:4], collection.list_ids(
+            provider_id, limit=2, marker=checkpoints[1], sort_dir="desc"))
+        self.assertEqual(checkpoints[3:5], collection.list_ids(
+            provider_id, plan_id=plan['id'], limit=2, marker=checkpoints[2],
+            sort_dir="desc"))
+        self.assertEqual(checkpoints[3:], collection.list_ids(
+            provider_id, sort_dir="desc",
+            start_date=datetime.strptime("2016-06-12", "%Y-%m-%d"),
+            end_date=datetime.strptime("2016-06-12", "%Y-%m-%d")))
+
+    def test_list_checkpoints_newest_first_builds_indices(self):
+        bank = Bank(_InMemoryBankPlugin())
+        collection = CheckpointCollection(bank, _InMemoryLeasePlugin())
+        plan = fake_protection_plan()
+        provider_id = plan['provider_id']
+        checkpoints = self._create_checkpoints(collection, plan,
+                                               "2016-06-12", 3)
+        checkpoints.reverse()
+        # Remove the newest first indices, like for older checkpoints
+        bank.delete_objects([key for key in bank.list_objects("/indices/")
+                             if "-desc" in key])
+        collection = CheckpointCollection(bank, _InMemoryLeasePlugin())
+        self.assertEqual(checkpoints, collection.list_ids(
+            provider_id, sort_dir="desc"))
+        self.assertEqual(checkpoints, collection.list_ids(
+            provider_id, plan_id=plan['id'], sort_dir="desc"))
+
     def test_delete_checkpoint(self):
         collection = self._create_test_collection()
         plan = fake_protection_plan()
@@ -95,6 +194,181 @@ class CheckpointCollectionTest(base.TestCase):
         checkpoint.purge()
         self.assertEqual(set(collection.list_ids(provider_id)), result)
 
+    def test_list_summaries(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        provider_id = plan['provider_id']
+        checkpoints = [collection.create(plan) for i in range(10)]
+        checkpoints[0].status = "available"
+        checkpoints[0].commit()
+        checkpoints[1].delete()
+        with mock.patch.object(Checkpoint, 'reload_meta_data') as mock_load:
+            summaries = collection.list_summaries(provider_id)
+            # The summaries are read from the segments only
+            self.assertFalse(mock_load.called)
+        self.assertEqual(
+            {checkpoint.id for checkpoint in checkpoints[2:]} |
+            {checkpoints[0].id},
+            {summary['id'] for summary in summaries})
+        statuses = {summary['id']: summary['status']
+                    for summary in summaries}
+        self.assertEqual("available", statuses[checkpoints[0].id])
+        self.assertEqual(plan['id'],
+                         summaries[0]['protection_plan']['id'])
+
+    def test_list_summaries_missing_from_segment(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        provider_id = plan['provider_id']
+        checkpoint = collection.create(plan)
+        segment_key = _get_summary_segment_key(_get_summary_segment_prefix(
+            provider_id, checkpoint.to_summary_dict()['timestamp']))
+        collection._indices_section.delete_object(segment_key)
+        summaries = collection.list_summaries(provider_id)
+        self.assertEqual([checkpoint.to_summary_dict()], summaries)
+        # The missing summary was added back to its segment
+        self.assertIn(checkpoint.id,
+                      collection._indices_section.get_object(segment_key))
+
+    def test_list_summaries_of_several_hosts(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        provider_id = plan['provider_id']
+        self.override_config('host', 'host1')
+        checkpoint = collection.create(plan)
+        other = collection.create(plan)
+        # Another host, with a stale cache of the checkpoint, updates it
+        self.override_config('host', 'host2')
+        checkpoint.status = "available"
+        checkpoint.commit()
+        self.override_config('host', 'host1')
+        other.delete()
+
+        with mock.patch.object(Checkpoint, 'reload_meta_data') as mock_load:
+            summaries = collection.list_summaries(provider_id)
+            self.assertFalse(mock_load.called)
+        self.assertEqual([checkpoint.to_summary_dict()], summaries)
+        segment_prefix = _get_summary_segment_prefix(
+            provider_id, checkpoint.to_summary_dict()['timestamp']).lstrip('/')
+        self.assertEqual(
+            [segment_prefix + 'host1', segment_prefix + 'host2'],
+            sorted(collection._indices_section.list_objects(
+                prefix=segment_prefix)))
+
+    def test_summary_segment_removals_compacted(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        self.override_config('host', 'host1')
+        checkpoint = collection.create(plan)
+        segment_prefix = _get_summary_segment_prefix(
+            plan['provider_id'], checkpoint.to_summary_dict()['timestamp'])
+        host1_key = segment_prefix + 'host1'
+        host2_key = segment_prefix + 'host2'
+        self.override_config('host', 'host2')
+        checkpoint.delete()
+        # The removal overrides the summary of the other host
+        self.assertIsNone(collection._indices_section.get_object(
+            host2_key)[checkpoint.id]['summary'])
+
+        self.override_config('host', 'host1')
+        collection.create(plan)
+        self.assertNotIn(checkpoint.id,
+                         collection._indices_section.get_object(host1_key))
+        self.override_config('host', 'host2')
+        collection.create(plan)
+        self.assertNotIn(checkpoint.id,
+                         collection._indices_section.get_object(host2_key))
+
+    def test_list_summaries_resource_graph(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        checkpoint = collection.create(plan)
+        checkpoint.resource_graph = build_graph(
+            [Resource(type='OS::Nova::Server', id='server', name='server')],
+            lambda resource: [])
+        checkpoint.commit()
+
+        summaries = collection.list_summaries(plan['provider_id'])
+        self.assertEqual(checkpoint.to_dict()['resource_graph'],
+                         summaries[0]['resource_graph'])
+
+    def test_checkpoint_records(self):
+        ctxt = context.get_admin_context()
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        plan['project_id'] = 'fake_project_id'
+        checkpoint = collection.create(plan)
+        record = db.checkpoint_record_get(ctxt, checkpoint.id)
+        self.assertEqual(checkpoint.to_summary_dict(),
+                         checkpoint_record_to_summary(record))
+
+        checkpoint.status = "available"
+        checkpoint.commit()
+        record = db.checkpoint_record_get(ctxt, checkpoint.id)
+        self.assertEqual("available", record['checkpoint_status'])
+
+        checkpoint.delete()
+        self.assertRaises(exception.CheckpointRecordNotFound,
+                          db.checkpoint_record_get, ctxt, checkpoint.id)
+
+    def test_checkpoint_record_create_by(self):
+        ctxt = context.get_admin_context()
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        plan['project_id'] = 'fake_project_id'
+        checkpoint = collection.create(plan, {
+            'extra_info': '{"create_by": "operation-engine"}'})
+        record = db.checkpoint_record_get(ctxt, checkpoint.id)
+        self.assertEqual('operation-engine', record['create_by'])
+
+    def test_checkpoint_record_update_failed(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        plan['project_id'] = 'fake_project_id'
+        checkpoint = collection.create(plan)
+        checkpoint.status = "available"
+        with mock.patch.object(db, 'checkpoint_record_create_or_update',
+                               side_effect=Exception('db error')):
+            self.assertRaises(exception.CheckpointRecordUpdateFailed,
+                              checkpoint.commit)
+
+    def test_list_ids_by_resource(self):
+        collection = self._create_test_collection()
+        plan = fake_protection_plan()
+        checkpoints = [collection.create(plan) for i in range(3)]
+        for checkpoint in checkpoints[:2]:
+            checkpoint.resource_graph = resource_graph
+            checkpoint.commit()
+        self.assertEqual({checkpoint.id for checkpoint in checkpoints[:2]},
+                         set(collection.list_ids_by_resource('fake', 'E')))
+        self.assertEqual([], collection.list_ids_by_resource('fake', 'F'))
+
+        checkpoints[0].delete()
+        self.assertEqual([checkpoints[1].id],
+                         collection.list_ids_by_resource('fake', 'E'))
+
+    def test_list_ids_by_openstack_resource(self):
+        collection = self._create_test_collection()
+        server = Resource(id='server-id', type='OS::Nova::Server',
+                          name='server')
+        volume = Resource(id='volume-id', type='OS::Cinder::Volume',
+                          name='volume')
+        checkpoint = collection.create(fake_protection_plan())
+        checkpoint.resource_graph = build_graph(
+            [server], {server: [volume], volume: []}.__getitem__)
+        checkpoint.commit()
+
+        self.assertEqual([checkpoint.id], collection.list_ids_by_resource(
+            'OS::Nova::Server', 'server-id'))
+        self.assertEqual([checkpoint.id], collection.list_ids_by_resource(
+            'OS::Cinder::Volume', 'volume-id'))
+        self.assertEqual([], collection.list_ids_by_resource(
+            'OS::Cinder::Volume', 'server-id'))
+
+        checkpoint.delete()
+        self.assertEqual([], collection.list_ids_by_resource(
+            'OS::Nova::Server', 'server-id'))
+
     def test_write_checkpoint_with_invalid_lease(self):
         collection = self._create_test_collection()
         checkpoint = collection.create(fake_protection_plan())
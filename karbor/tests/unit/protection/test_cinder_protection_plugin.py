@@ -18,6 +18,8 @@ from karbor import exception
 from karbor.resource import Resource
 from karbor.services.protection import bank_plugin
 from karbor.services.protection import client_factory
+from karbor.services.protection.protection_plugins.volume \
+    import cinder_protection_plugin
 from karbor.services.protection.protection_plugins.volume. \
     cinder_protection_plugin import CinderBackupProtectionPlugin
 from karbor.services.protection.protection_plugins.volume \
@@ -436,3 +438,36 @@ class CinderProtectionPluginTest(base.TestCase):
     def test_get_supported_resources_types(self):
         types = self.plugin.get_supported_resources_types()
         self.assertEqual([constants.VOLUME_RESOURCE_TYPE], types)
+
+    def test_list_backup_statuses(self):
+        cinder_client = mock.MagicMock()
+        cinder_client.backups.list.return_value = [
+            mock.Mock(id='new', status='creating'),
+            mock.Mock(id='other', status='creating')]
+
+        def get_backup(backup_id):
+            if backup_id == 'old':
+                return mock.Mock(id='old', status='available')
+            raise cinder_exc.NotFound(404)
+        cinder_client.backups.get.side_effect = get_backup
+
+        statuses = cinder_protection_plugin.list_backup_statuses(
+            cinder_client, ['new', 'old', 'gone'], ['creating'])
+
+        self.assertEqual({'new': 'creating', 'old': 'available',
+                          'gone': 'not-found'}, statuses)
+        cinder_client.backups.list.assert_called_once_with(
+            search_opts={'status': 'creating'})
+        self.assertEqual(2, cinder_client.backups.get.call_count)
+
+    def test_list_backup_statuses_without_pending_statuses(self):
+        cinder_client = mock.MagicMock()
+        cinder_client.backups.get.return_value = mock.Mock(
+            status='available')
+
+        statuses = cinder_protection_plugin.list_backup_statuses(
+            cinder_client, ['backup1', 'backup2'])
+
+        self.assertEqual({'backup1': 'available', 'backup2': 'available'},
+                         statuses)
+        cinder_client.backups.list.assert_not_called()
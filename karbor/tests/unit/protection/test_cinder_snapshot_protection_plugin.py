@@ -137,7 +137,7 @@ class CinderSnapshotProtectionPluginTest(base.TestCase):
                          volume_snapshot_plugin_schemas.SAVED_INFO_SCHEMA)
 
     @mock.patch('karbor.services.protection.protection_plugins.'
-                'utils.status_poll')
+                'utils.batched_status_poll')
     @mock.patch('karbor.services.protection.clients.cinder.create')
     def test_create_snapshot(self, mock_cinder_create, mock_status_poll):
         resource = Resource(id="123",
@@ -169,7 +169,7 @@ class CinderSnapshotProtectionPluginTest(base.TestCase):
                    {})
 
     @mock.patch('karbor.services.protection.protection_plugins.'
-                'utils.status_poll')
+                'utils.batched_status_poll')
     @mock.patch('karbor.services.protection.clients.cinder.create')
     def test_delete_snapshot(self, mock_cinder_create, mock_status_poll):
         resource = Resource(id="123",
@@ -46,6 +46,12 @@ class FileSystemBankPluginTest(base.TestCase):
             self.fs_bank_plugin.object_container_path + "/key")
         self.assertEqual(False, os.path.isfile(object_file))
 
+    def test_delete_objects(self):
+        self.fs_bank_plugin.update_objects({"/list/key-1": "value-1",
+                                            "/list/key-2": "value-2"})
+        self.fs_bank_plugin.delete_objects(["/list/key-1", "/list/key-2"])
+        self.assertEqual((), self.fs_bank_plugin.list_objects(prefix="/list"))
+
     def test_get_object(self):
         self.fs_bank_plugin.update_object("/key", "value")
         value = self.fs_bank_plugin.get_object("/key")
@@ -80,3 +86,41 @@ class FileSystemBankPluginTest(base.TestCase):
         value = self.fs_bank_plugin.get_object(
             "/index.json")
         self.assertEqual({"key": "value"}, value)
+
+    def test_write_object_stream_and_open_object_reader(self):
+        self.fs_bank_plugin.write_object_stream(
+            "/stream", iter([b"abc", b"\xff\x00"]))
+        with self.fs_bank_plugin.open_object_reader("/stream") as reader:
+            self.assertEqual(b"abc\xff\x00", reader.read())
+
+    def test_get_binary_object(self):
+        self.fs_bank_plugin.write_object_stream(
+            "/binary", iter([b"abc", b"\xff\x00"]))
+        self.assertEqual(b"abc\xff\x00",
+                         self.fs_bank_plugin.get_object("/binary"))
+
+    def test_get_json_text_object(self):
+        self.fs_bank_plugin.update_object("/text", '{"key": "value"}')
+        self.assertEqual('{"key": "value"}',
+                         self.fs_bank_plugin.get_object("/text"))
+
+    def test_get_bytes_object(self):
+        self.fs_bank_plugin.update_object("/bytes", b'[1, 2]')
+        self.assertEqual(b'[1, 2]', self.fs_bank_plugin.get_object("/bytes"))
+
+    def test_update_binary_object_with_dict(self):
+        self.fs_bank_plugin.write_object_stream("/binary", iter([b"abc"]))
+        self.fs_bank_plugin.update_object("/binary", {"key": "value"})
+        self.assertEqual({"key": "value"},
+                         self.fs_bank_plugin.get_object("/binary"))
+
+    def test_delete_binary_object(self):
+        self.fs_bank_plugin.write_object_stream("/dir/binary", iter([b"a"]))
+        self.fs_bank_plugin.delete_object("/dir/binary")
+        self.assertFalse(os.path.exists(
+            self.fs_bank_plugin.object_markers_path + "/dir"))
+
+    def test_open_object_reader_not_found(self):
+        self.assertRaises(exception.BankGetObjectFailed,
+                          self.fs_bank_plugin.open_object_reader,
+                          "/not_found")
@@ -18,6 +18,8 @@ from karbor.services.protection.bank_plugin import Bank
 from karbor.services.protection.bank_plugin import BankPlugin
 from karbor.services.protection.bank_plugin import BankSection
 from karbor.services.protection import client_factory
+from karbor.services.protection.protection_plugins.image \
+    import image_protection_plugin
 from karbor.services.protection.protection_plugins. \
     image.image_protection_plugin import GlanceProtectionPlugin
 from karbor.services.protection.protection_plugins.image \
@@ -157,6 +159,134 @@ class GlanceProtectionPluginTest(base.TestCase):
         call_hooks(protect_operation, self.checkpoint, resource, self.cntxt,
                    {})
 
+    @mock.patch('karbor.services.protection.protection_plugins.image.'
+                'image_protection_plugin.utils.status_poll')
+    @mock.patch('karbor.services.protection.clients.glance.create')
+    def test_create_backup_uploads_all_chunks(self, mock_glance_create,
+                                              mock_status_poll):
+        resource = Resource(id="123",
+                            type=constants.IMAGE_RESOURCE_TYPE,
+                            name='fake')
+        uploaded = {}
+
+        def update_object(key, value):
+            uploaded[key] = value
+
+        bank_section = BankSection(bank=Bank(FakeBankPlugin()),
+                                   section="fake")
+        bank_section.update_object = mock.MagicMock(
+            side_effect=update_object)
+        bank_section.get_object = mock.MagicMock(return_value={})
+        self.checkpoint.bank_section = bank_section
+
+        protect_operation = self.plugin.get_protect_operation(resource)
+        mock_glance_create.return_value = self.glance_client
+        self.glance_client.images.get = mock.MagicMock()
+        self.glance_client.images.data = mock.MagicMock()
+        self.glance_client.images.data.return_value = [
+            b'a' * 65536, b'b' * 65536, b'c' * 100]
+        mock_status_poll.return_value = True
+        call_hooks(protect_operation, self.checkpoint, resource, self.cntxt,
+                   {})
+
+        self.assertEqual(b'a' * 65536, uploaded['data_1'])
+        self.assertEqual(b'b' * 65536, uploaded['data_2'])
+        self.assertEqual(b'c' * 100, uploaded['data_3'])
+        self.assertNotIn('data_4', uploaded)
+        self.assertEqual(3, uploaded['metadata']['chunks_num'])
+        self.assertEqual(constants.RESOURCE_STATUS_AVAILABLE,
+                         uploaded['status'])
+
+    def test_chunk_upload_pipeline_splits_unaligned_data(self):
+        upload_func = mock.MagicMock()
+        pipeline = image_protection_plugin.ChunkUploadPipeline(
+            upload_func, 4, 2)
+        chunks_num = pipeline.run([b'abc', b'defgh', b'ij'])
+        self.assertEqual(3, chunks_num)
+        upload_func.assert_has_calls([
+            mock.call(1, b'abcd'),
+            mock.call(2, b'efgh'),
+            mock.call(3, b'ij'),
+        ], any_order=True)
+
+    def test_chunk_upload_pipeline_upload_failure(self):
+        upload_func = mock.MagicMock(side_effect=Exception('fail'))
+        pipeline = image_protection_plugin.ChunkUploadPipeline(
+            upload_func, 4, 2)
+        self.assertRaises(Exception, pipeline.run, [b'a' * 16])
+
+    @mock.patch('karbor.services.protection.protection_plugins.image.'
+                'image_protection_plugin.utils.status_poll')
+    @mock.patch('karbor.services.protection.clients.glance.create')
+    def test_create_backup_deduplicated(self, mock_glance_create,
+                                        mock_status_poll):
+        resource = Resource(id="123",
+                            type=constants.IMAGE_RESOURCE_TYPE,
+                            name='fake')
+        uploaded = {}
+
+        def update_object(key, value):
+            uploaded[key] = value
+
+        bank_section = BankSection(bank=Bank(FakeBankPlugin()),
+                                   section="fake")
+        bank_section.update_object = mock.MagicMock(
+            side_effect=update_object)
+        bank_section.get_object = mock.MagicMock(return_value={})
+        chunk_store = mock.MagicMock()
+        chunk_store.put_chunk.side_effect = lambda ref_id, data: data.decode()
+        bank_section.get_chunk_store = mock.MagicMock(
+            return_value=chunk_store)
+        self.checkpoint.bank_section = bank_section
+        self.checkpoint.id = 'checkpoint_id'
+
+        protect_operation = image_protection_plugin.ProtectOperation(
+            65536, 0, 2, True)
+        mock_glance_create.return_value = self.glance_client
+        self.glance_client.images.get = mock.MagicMock()
+        self.glance_client.images.data = mock.MagicMock()
+        self.glance_client.images.data.return_value = [
+            b'a' * 65536, b'b' * 65536]
+        mock_status_poll.return_value = True
+        call_hooks(protect_operation, self.checkpoint, resource, self.cntxt,
+                   {})
+
+        self.assertNotIn('data_1', uploaded)
+        self.assertEqual(['a' * 65536, 'b' * 65536], uploaded['manifest'])
+        self.assertTrue(uploaded['metadata']['deduplicated'])
+        chunk_store.put_chunk.assert_any_call('checkpoint_id@123',
+                                              b'a' * 65536)
+
+    def test_image_bank_io_read_whole_objects(self):
+        bank_section = mock.MagicMock()
+        bank_section.get_object.side_effect = lambda key: key.encode()
+        image_data = image_protection_plugin.ImageBankIO(
+            bank_section, ['data_1', 'data_2', 'data_3'], 2)
+        self.assertEqual(b'data_1', image_data.read())
+        self.assertEqual(b'data_2', image_data.read())
+        self.assertEqual(b'data_3', image_data.read())
+        self.assertEqual(b'', image_data.read())
+
+    def test_image_bank_io_read_with_length(self):
+        bank_section = mock.MagicMock()
+        bank_section.get_object.side_effect = lambda key: key.encode()
+        image_data = image_protection_plugin.ImageBankIO(
+            bank_section, ['data_1', 'data_2'], 2)
+        self.assertEqual(b'data', image_data.read(4))
+        self.assertEqual(b'_1da', image_data.read(4))
+        self.assertEqual(b'ta_2', image_data.read(10))
+        self.assertEqual(b'', image_data.read(10))
+        image_data.close()
+
+    def test_image_bank_io_read_text_objects(self):
+        bank_section = mock.MagicMock()
+        bank_section.get_object.side_effect = lambda key: key
+        image_data = image_protection_plugin.ImageBankIO(
+            bank_section, ['data_1', 'data_2'], 2)
+        self.assertEqual(b'data_1da', image_data.read(8))
+        self.assertEqual(b'ta_2', image_data.read())
+        image_data.close()
+
     def test_delete_backup(self):
         resource = Resource(id="123",
                             type=constants.IMAGE_RESOURCE_TYPE,
@@ -164,10 +294,12 @@ class GlanceProtectionPluginTest(base.TestCase):
 
         fake_bank_section.list_objects = mock.MagicMock()
         fake_bank_section.list_objects.return_value = ["data_1", "data_2"]
-        fake_bank_section.delete_object = mock.MagicMock()
+        fake_bank_section.delete_objects = mock.MagicMock()
         delete_operation = self.plugin.get_delete_operation(resource)
         call_hooks(delete_operation, self.checkpoint, resource, self.cntxt,
                    {})
+        fake_bank_section.delete_objects.assert_called_once_with(
+            ["data_1", "data_2"])
 
     def test_get_supported_resources_types(self):
         types = self.plugin.get_supported_resources_types()
@@ -0,0 +1,103 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+
+from karbor import exception
+from karbor.services.protection import governor
+from karbor.tests import base
+
+
+class GovernorTest(base.TestCase):
+    def setUp(self):
+        super(GovernorTest, self).setUp()
+        self.governor = governor.Governor()
+
+    def _run_all(self, limiter, count):
+        state = {'in_flight': 0, 'max_in_flight': 0}
+        starts = []
+
+        def _run():
+            with limiter:
+                starts.append(time.time())
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'],
+                                             state['in_flight'])
+                eventlet.sleep(0.01)
+                state['in_flight'] -= 1
+
+        pool = eventlet.GreenPool()
+        for _ in range(count):
+            pool.spawn_n(_run)
+        pool.waitall()
+        return state['max_in_flight'], starts
+
+    def test_concurrency_limit(self):
+        self.governor.configure('provider', {'cinder.backup': '2'})
+        limiter = self.governor.get_limiter('provider', 'cinder.backup')
+
+        max_in_flight, starts = self._run_all(limiter, 6)
+
+        self.assertEqual(6, len(starts))
+        self.assertEqual(2, max_in_flight)
+        self.assertEqual(0, limiter.active)
+        self.assertEqual(0, limiter.waiting)
+
+    def test_rate_limit(self):
+        self.governor.configure('provider', rate_limits={'glance.upload': 20})
+        limiter = self.governor.get_limiter('provider', 'glance.upload')
+
+        _, starts = self._run_all(limiter, 3)
+
+        self.assertGreaterEqual(starts[-1] - starts[0], 0.09)
+
+    def test_unlimited_operation(self):
+        self.governor.configure('provider', {'cinder.backup': 2})
+        self.assertIsNone(self.governor.get_limiter('provider',
+                                                    'cinder.snapshot'))
+        self.assertIsNone(self.governor.get_limiter('other', 'cinder.backup'))
+
+    def test_configure_replaces_the_scope_limits(self):
+        self.governor.configure('provider', {'cinder.backup': 2})
+        self.governor.configure('other', {'cinder.backup': 1})
+        self.governor.configure('provider', {'cinder.snapshot': 3})
+
+        self.assertIsNone(self.governor.get_limiter('provider',
+                                                    'cinder.backup'))
+        self.assertEqual(3, self.governor.get_limiter(
+            'provider', 'cinder.snapshot').concurrency)
+        self.assertEqual(1, self.governor.get_limiter(
+            'other', 'cinder.backup').concurrency)
+
+    def test_invalid_limits(self):
+        self.assertRaises(exception.InvalidInput, self.governor.configure,
+                          'provider', {'cinder.backup': 'many'})
+        self.assertRaises(exception.InvalidInput, self.governor.configure,
+                          'provider', rate_limits={'cinder.backup': '-1'})
+
+    def test_get_stats(self):
+        self.governor.configure('provider', {'cinder.backup': 2},
+                                {'cinder.backup': 0.5})
+        limiter = self.governor.get_limiter('provider', 'cinder.backup')
+        with limiter:
+            stats = self.governor.get_stats()
+
+        self.assertEqual({
+            'provider/cinder.backup': {
+                'concurrency': 2,
+                'rate': 0.5,
+                'active': 1,
+                'waiting': 0,
+            }
+        }, stats)
@@ -9,7 +9,9 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import base64
 from collections import namedtuple
+import eventlet
 from oslo_serialization import jsonutils
 from oslo_serialization import msgpackutils
 
@@ -108,6 +110,45 @@ class GraphBuilderTest(base.TestCase):
         self.assertEqual(id(test_left_node.child_nodes[0]),
                          id(test_right_node.child_nodes[0]))
 
+    def test_deep_graph(self):
+        depth = 5000
+        result = graph.build_graph(
+            [0], lambda node: [node + 1] if node < depth else [])
+        node = result[0]
+        for i in range(depth):
+            self.assertEqual(i, node.value)
+            node = node.child_nodes[0]
+        self.assertEqual((), node.child_nodes)
+
+    def test_build_graph_fetches_levels_concurrently(self):
+        test_base = {
+            "A": ["B1", "B2", "B3"],
+            "B1": ["C1"],
+            "B2": ["C1", "C2"],
+            "B3": [],
+            "C1": [],
+            "C2": [],
+        }
+        calls = []
+        in_flight = [0, 0]
+
+        def get_child_nodes(node):
+            calls.append(node)
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+            eventlet.sleep(0.01)
+            in_flight[0] -= 1
+            return test_base[node]
+
+        result = graph.build_graph(["A", "B2"], get_child_nodes,
+                                   max_concurrency=3)
+        self.assertEqual(["A"], [node.value for node in result])
+        # Every node is fetched once, and a level at a time
+        self.assertEqual(sorted(test_base), sorted(calls))
+        self.assertEqual({"A", "B2"}, set(calls[:2]))
+        # The second level has 4 nodes, fetched at most 3 at a time
+        self.assertEqual(3, in_flight[1])
+
     def test_graph_pack_unpack(self):
         test_base = {
             "A1": ["B1", "B2"],
@@ -163,6 +204,25 @@ class GraphBuilderTest(base.TestCase):
                 '[["0x1", ["0x0"]]]]'
             ])
 
+    def test_graph_serialize_compact(self):
+        resource_a = resource.Resource('server', 'a', 'a', {'name': 'a'})
+        resource_b = resource.Resource('volume', 'b', 'b', None)
+        resource_c = resource.Resource('volume', 'c', 'c', None)
+        test_base = {
+            resource_a: [resource_b, resource_c],
+            resource_b: [],
+            resource_c: [],
+        }
+        test_graph = graph.build_graph(test_base.keys(), test_base.__getitem__)
+        serialized = graph.serialize_resource_graph(test_graph, compact=True)
+        self.assertLess(len(serialized),
+                        len(graph.serialize_resource_graph(test_graph)))
+        self.assertEqual(test_graph,
+                         graph.deserialize_resource_graph(serialized))
+        self.assertEqual(
+            {resource_a, resource_b, resource_c},
+            set(graph.deserialize_resource_graph_resources(serialized)))
+
     def test_graph_deserialize_unordered_adjacency(self):
         test_base = {
             "A1": ["B1", "B2"],
@@ -214,6 +274,56 @@ class GraphBuilderTest(base.TestCase):
         for start_node in test_graph:
             self.assertIn(start_node, unpacked_graph)
 
+    def test_pack_compact_graph(self):
+        test_base = {
+            "A1": ["B1", "B2"],
+            "B1": ["C1"],
+            "B2": ["C1"],
+            "C1": [],
+        }
+        test_graph = graph.build_graph(sorted(test_base),
+                                       test_base.__getitem__)
+        compact_graph = graph.pack_graph(test_graph, compact=True)
+        self.assertEqual(["C1", "B1", "B2", "A1"], compact_graph.nodes)
+        self.assertEqual([0, 0, 1, 2, 4], list(compact_graph.offsets))
+        self.assertEqual([0, 0, 1, 2], list(compact_graph.children))
+        self.assertEqual(test_graph, graph.unpack_graph(compact_graph))
+        self.assertEqual(
+            graph.pack_graph(test_graph),
+            graph.PackedGraph(
+                {"0x0": "C1", "0x1": "B1", "0x2": "B2", "0x3": "A1"},
+                (("0x1", ("0x0",)), ("0x2", ("0x0",)),
+                 ("0x3", ("0x1", "0x2")))))
+
+    def test_unpack_unordered_compact_graph(self):
+        compact_graph = graph.CompactGraph(["A", "B"], [0, 1, 1], [1])
+        with self.assertRaisesRegex(exception.InvalidInput, "ordered"):
+            graph.unpack_graph(compact_graph)
+
+    def test_pack_unpack_deep_graph(self):
+        depth = 5000
+        test_graph = graph.build_graph(
+            [0], lambda node: [node + 1] if node < depth else [])
+        for compact in (False, True):
+            packed_graph = graph.pack_graph(test_graph, compact=compact)
+            unpacked_graph = graph.unpack_graph(packed_graph)
+            self.assertEqual(1, len(unpacked_graph))
+            node = unpacked_graph[0]
+            for i in range(depth):
+                self.assertEqual(i, node.value)
+                node = node.child_nodes[0]
+            self.assertEqual((), node.child_nodes)
+
+    def test_graph_deserialize_unsupported_compact_version(self):
+        payload = msgpackutils.dumps(
+            (1, ['volume', 'server'],
+             [(0, 'b', 'b', None), (1, 'a', 'a', None)],
+             [(1, [0])]))
+        serialized = graph._COMPACT_GRAPH_PREFIX + base64.b64encode(
+            payload).decode('ascii')
+        self.assertRaises(exception.InvalidInput,
+                          graph.deserialize_resource_graph, serialized)
+
 
 class _TestGraphWalkerListener(graph.GraphWalkerListener):
     def __init__(self, expected_event_stream, test):
@@ -298,3 +408,39 @@ class GraphWalkerTest(base.TestCase):
             keys = list(g.keys())
             keys.sort()
             walker.walk_graph(graph.build_graph(keys, g.__getitem__))
+
+    def test_graph_walker_skip_visited_children(self):
+        g = {
+            'A': ['C'],
+            'B': ['C'],
+            'C': ['D'],
+            'D': [],
+        }
+        expected_calls = (
+            ("on_node_enter", 'A', False),
+            ("on_node_enter", 'C', False),
+            ("on_node_enter", 'D', False),
+            ("on_node_exit", 'D'),
+            ("on_node_exit", 'C'),
+            ("on_node_exit", 'A'),
+            ("on_node_enter", 'B', False),
+            ("on_node_enter", 'C', True),
+            ("on_node_exit", 'C'),
+            ("on_node_exit", 'B'),
+        )
+        listener = _TestGraphWalkerListener(expected_calls, self)
+        walker = graph.GraphWalker(walk_visited_children=False)
+        walker.register_listener(listener)
+        walker.walk_graph(graph.build_graph(sorted(g), g.__getitem__))
+
+    def test_graph_walker_deep_graph(self):
+        depth = 5000
+        expected_calls = [("on_node_enter", i, False)
+                          for i in range(depth + 1)]
+        expected_calls += [("on_node_exit", i)
+                           for i in reversed(range(depth + 1))]
+        listener = _TestGraphWalkerListener(expected_calls, self)
+        walker = graph.GraphWalker()
+        walker.register_listener(listener)
+        walker.walk_graph(graph.build_graph(
+            [0], lambda node: [node + 1] if node < depth else []))
@@ -15,11 +15,16 @@ import mock
 from oslo_config import cfg
 import oslo_messaging
 
+from karbor.common import constants
+from karbor import context
 from karbor import exception
 from karbor.resource import Resource
+from karbor.services.protection.checkpoint import update_checkpoint_record
 from karbor.services.protection.flows import utils
 from karbor.services.protection.flows import worker as flow_manager
+from karbor.services.protection import governor
 from karbor.services.protection import manager
+from karbor.services.protection import operation_queue
 from karbor.services.protection import protectable_registry
 from karbor.services.protection import provider
 
@@ -127,15 +132,195 @@ class ProtectionServiceTest(base.TestCase):
     def test_protect(self, mock_provider, mock_operation_log_create,
                      mock_operation_log_update):
         mock_provider.return_value = fakes.FakeProvider()
-        self.pro_manager.protect(None, fakes.fake_protection_plan())
+        with mock.patch.object(self.pro_manager, '_spawn') as mock_spawn:
+            checkpoint_id = self.pro_manager.protect(
+                None, fakes.fake_protection_plan())
 
+        # The flow is built once the protection starts
+        args = mock_spawn.call_args[0]
+        self.assertEqual(self.pro_manager._protect, args[2])
+        checkpoint = args[6]
+        self.assertEqual(checkpoint.id, checkpoint_id)
+        with mock.patch.object(flow_manager.Worker, 'run_flow') as mock_run:
+            self.pro_manager._protect(*args[3:])
+        mock_run.assert_called_once_with(mock.ANY)
+
+    @mock.patch.object(utils, 'update_operation_log')
+    @mock.patch.object(utils, 'create_operation_log')
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_protect_priority(self, mock_provider, mock_operation_log_create,
+                              mock_operation_log_update):
+        mock_provider.return_value = fakes.FakeProvider()
+        with mock.patch.object(self.pro_manager, '_spawn') as mock_spawn:
+            self.pro_manager.protect(None, fakes.fake_protection_plan())
+            self.pro_manager.protect(None, fakes.fake_protection_plan(), {
+                'extra_info': '{"create_by": "operation-engine"}'})
+
+        self.assertEqual([operation_queue.PRIORITY_PROTECT,
+                          operation_queue.PRIORITY_SCHEDULED_PROTECT],
+                         [call[0][0] for call in mock_spawn.call_args_list])
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_protect_rejected(self, mock_provider):
+        fake_provider = fakes.FakeProvider()
+        fake_provider.get_checkpoint_collection = mock.Mock()
+        mock_provider.return_value = fake_provider
+        with mock.patch.object(
+                self.pro_manager._operation_queue, 'check_admission') as (
+                mock_check):
+            mock_check.side_effect = exception.OperationRejected(
+                operation='protect', wait=100, timeout=10)
+            self.assertRaises(oslo_messaging.ExpectedException,
+                              self.pro_manager.protect,
+                              None,
+                              fakes.fake_protection_plan())
+        # No checkpoint is left behind
+        fake_provider.get_checkpoint_collection.assert_not_called()
+
+    @mock.patch.object(governor, 'get_governor')
+    @mock.patch.object(manager, 'LOG')
+    def test_report_operation_stats(self, mock_log, mock_governor):
+        mock_governor.return_value.get_stats.return_value = {}
+        self.pro_manager._operation_queue = mock.Mock()
+        self.pro_manager._operation_queue.get_stats.return_value = {
+            'running': 0, 'queued': [], 'estimated_waits': {}}
+        self.pro_manager._report_operation_stats(None)
+        mock_log.info.assert_not_called()
+
+        self.pro_manager._operation_queue.get_stats.return_value = {
+            'running': 1,
+            'queued': [{'priority': 'protect', 'project_id': 'project',
+                        'position': 0, 'wait': 5.0}],
+            'estimated_waits': {'protect': 60}}
+        self.pro_manager._report_operation_stats(None)
+        self.assertEqual(2, mock_log.info.call_count)
+
+        # Operations waiting on a provider limit are reported too
+        mock_governor.return_value.get_stats.return_value = {
+            'provider/cinder.backup': {'concurrency': 2, 'rate': None,
+                                       'active': 2, 'waiting': 3}}
+        self.pro_manager._report_operation_stats(None)
+        self.assertEqual(5, mock_log.info.call_count)
+        self.assertEqual('provider/cinder.backup',
+                         mock_log.info.call_args[0][1]['name'])
+
+    @mock.patch.object(flow_manager.Worker, 'get_resumed_flow')
+    @mock.patch.object(flow_manager.Worker, 'get_unfinished_flows')
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_resume_flows(self, mock_provider, mock_unfinished, mock_resumed):
+        fake_provider = mock.Mock()
+        mock_provider.return_value = fake_provider
+        flow_detail = mock.Mock(meta={
+            'operation_type': constants.OPERATION_DELETE,
+            'provider_id': 'fake_id1',
+            'checkpoint_id': 'checkpoint',
+            'context': context.RequestContext(user_id='demo',
+                                              project_id='abcd').to_dict(),
+        })
+        mock_unfinished.return_value = [flow_detail]
+
+        with mock.patch.object(self.pro_manager, '_spawn') as mock_spawn:
+            self.pro_manager.init_host()
+
+        fake_provider.get_checkpoint.assert_called_once_with('checkpoint')
+        args = mock_spawn.call_args[0]
+        self.assertEqual(operation_queue.PRIORITY_DELETE, args[0])
+        self.assertEqual('abcd', args[1].project_id)
+        self.assertEqual(mock_resumed.return_value, args[3])
+
+    @mock.patch.object(flow_manager.Worker, 'discard_flow')
+    @mock.patch.object(flow_manager.Worker, 'get_resumed_flow')
+    @mock.patch.object(flow_manager.Worker, 'get_unfinished_flows')
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_resume_flows_in_error(self, mock_provider, mock_unfinished,
+                                   mock_resumed, mock_discard):
+        checkpoint = mock.Mock(status=constants.CHECKPOINT_STATUS_PROTECTING)
+        mock_provider.return_value.get_checkpoint.return_value = checkpoint
+        flow_detail = mock.Mock(meta={
+            'operation_type': constants.OPERATION_PROTECT,
+            'provider_id': 'fake_id1',
+            'checkpoint_id': 'checkpoint',
+            'context': None,
+        })
+        mock_unfinished.return_value = [flow_detail]
+        mock_resumed.side_effect = Exception()
+
+        with mock.patch.object(self.pro_manager, '_spawn') as mock_spawn:
+            self.pro_manager.init_host()
+
+        mock_spawn.assert_not_called()
+        mock_discard.assert_called_once_with(flow_detail)
+        self.assertEqual(constants.CHECKPOINT_STATUS_ERROR, checkpoint.status)
+
+    @mock.patch.object(flow_manager.Worker, 'get_resumed_flow')
+    @mock.patch.object(flow_manager.Worker, 'get_unfinished_flows')
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_resume_queued_protection(self, mock_provider, mock_unfinished,
+                                      mock_resumed):
+        plan = fakes.fake_protection_plan()
+        flow_detail = mock.Mock(meta={
+            'operation_type': constants.OPERATION_PROTECT,
+            'provider_id': 'fake_id1',
+            'checkpoint_id': 'checkpoint',
+            'plan': plan,
+            'context': context.RequestContext(user_id='demo',
+                                              project_id='abcd').to_dict(),
+        })
+        mock_unfinished.return_value = [flow_detail]
+
+        with mock.patch.object(self.pro_manager, '_spawn') as mock_spawn:
+            self.pro_manager.init_host()
+
+        mock_resumed.assert_not_called()
+        args = mock_spawn.call_args[0]
+        self.assertEqual(operation_queue.PRIORITY_PROTECT, args[0])
+        self.assertEqual(self.pro_manager._protect, args[2])
+        self.assertEqual(plan, args[4])
+        self.assertEqual(flow_detail, args[7])
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_fail_orphaned_checkpoints(self, mock_provider):
+        ctxt = context.get_admin_context()
+        checkpoints = {}
+        for checkpoint_id, status, host in (
+                ('protecting', constants.CHECKPOINT_STATUS_PROTECTING,
+                 CONF.host),
+                ('deleting', constants.CHECKPOINT_STATUS_DELETING, CONF.host),
+                ('resumed', constants.CHECKPOINT_STATUS_PROTECTING,
+                 CONF.host),
+                ('other_host', constants.CHECKPOINT_STATUS_PROTECTING,
+                 'other')):
+            summary = self._fake_summary(checkpoint_id, 'plan', 1)
+            summary['status'] = status
+            update_checkpoint_record(ctxt, summary)
+            checkpoints[checkpoint_id] = mock.Mock(id=checkpoint_id,
+                                                   status=status, host=host)
+        mock_provider.return_value.get_checkpoint.side_effect = (
+            lambda checkpoint_id: checkpoints[checkpoint_id])
+
+        self.pro_manager._fail_orphaned_checkpoints({'resumed'})
+
+        self.assertEqual(constants.CHECKPOINT_STATUS_ERROR,
+                         checkpoints['protecting'].status)
+        self.assertEqual(constants.CHECKPOINT_STATUS_ERROR_DELETING,
+                         checkpoints['deleting'].status)
+        self.assertEqual(constants.CHECKPOINT_STATUS_PROTECTING,
+                         checkpoints['resumed'].status)
+        self.assertEqual(constants.CHECKPOINT_STATUS_PROTECTING,
+                         checkpoints['other_host'].status)
+        checkpoints['resumed'].commit.assert_not_called()
+
+    @mock.patch.object(flow_manager.Worker, 'run_flow')
     @mock.patch.object(flow_manager.Worker, 'get_flow')
-    def test_protect_in_error(self, mock_flow):
+    def test_protect_in_error(self, mock_flow, mock_run):
         mock_flow.side_effect = Exception()
-        self.assertRaises(oslo_messaging.ExpectedException,
-                          self.pro_manager.protect,
-                          None,
-                          fakes.fake_protection_plan())
+        checkpoint = mock.Mock(status=constants.CHECKPOINT_STATUS_PROTECTING)
+        self.pro_manager._protect(None, fakes.fake_protection_plan(),
+                                  fakes.FakeProvider(), checkpoint)
+
+        self.assertEqual(constants.CHECKPOINT_STATUS_ERROR, checkpoint.status)
+        checkpoint.commit.assert_called_once_with()
+        mock_run.assert_not_called()
 
     @mock.patch.object(provider.ProviderRegistry, 'show_provider')
     def test_show_checkpoint(self, mock_provider):
@@ -159,6 +344,132 @@ class ProtectionServiceTest(base.TestCase):
                           'provider1',
                           'non_existent_checkpoint')
 
+    def _fake_summary(self, checkpoint_id, plan_id, day):
+        return {
+            "id": checkpoint_id,
+            "status": "available",
+            "protection_plan": {"id": plan_id, "name": "fake_plan",
+                                "provider_id": "provider1",
+                                "resources": []},
+            "extra_info": None,
+            "project_id": "fake_project_id",
+            "resource_graph": None,
+            "created_at": "2017-01-%02d" % day,
+            "timestamp": 1483228800 + (day - 1) * 86400 + 3600
+        }
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints(self, mock_provider):
+        ctxt = context.get_admin_context()
+        summaries = [
+            self._fake_summary("cp%d" % i, "plan%d" % (i % 2), i + 1)
+            for i in range(4)]
+        for summary in summaries:
+            update_checkpoint_record(ctxt, summary)
+
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", filters={})
+        self.assertEqual(summaries, result)
+
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", limit=1, marker="cp3",
+            sort_keys=["created_at"], sort_dirs=["desc"],
+            filters={"plan_id": "plan0"})
+        self.assertEqual([summaries[2]], result)
+
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1",
+            filters={"start_date": "2017-01-02", "end_date": "2017-01-03"})
+        self.assertEqual(summaries[1:3], result)
+        self.assertFalse(
+            mock_provider.return_value.list_checkpoint_summaries.called)
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints_refresh_records(self, mock_provider):
+        ctxt = context.get_admin_context()
+        summary = self._fake_summary("cp0", "plan0", 1)
+        # A record written before the records held the resource graph
+        old_summary = dict(summary)
+        del old_summary["resource_graph"]
+        update_checkpoint_record(ctxt, old_summary)
+        summary["resource_graph"] = "graph"
+        mock_provider.return_value.get_checkpoint.return_value = mock.Mock(
+            to_summary_dict=mock.Mock(return_value=summary))
+
+        result = self.pro_manager.list_checkpoints(ctxt, "provider1",
+                                                   filters={})
+        self.assertEqual([summary], result)
+        mock_provider.return_value.get_checkpoint.assert_called_once_with(
+            "cp0")
+
+        # The record was refreshed, the checkpoint is not read again
+        result = self.pro_manager.list_checkpoints(ctxt, "provider1",
+                                                   filters={})
+        self.assertEqual([summary], result)
+        self.assertEqual(
+            1, mock_provider.return_value.get_checkpoint.call_count)
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints_by_resource(self, mock_provider):
+        ctxt = context.get_admin_context()
+        for i in range(3):
+            update_checkpoint_record(
+                ctxt, self._fake_summary("cp%d" % i, "plan0", i + 1))
+        collection = mock_provider.return_value.get_checkpoint_collection()
+        collection.list_ids_by_resource.return_value = ["cp0", "cp2"]
+
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", filters={"resource_id": "vol1",
+                                        "resource_type": "OS::Cinder::Volume"})
+        self.assertEqual(["cp0", "cp2"],
+                         [summary["id"] for summary in result])
+        collection.list_ids_by_resource.assert_called_once_with(
+            "OS::Cinder::Volume", "vol1")
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints_by_status(self, mock_provider):
+        ctxt = context.get_admin_context()
+        summaries = [self._fake_summary("cp%d" % i, "plan0", i + 1)
+                     for i in range(3)]
+        summaries[1]["status"] = "protecting"
+        summaries[2]["status"] = "error"
+        for summary in summaries:
+            update_checkpoint_record(ctxt, summary)
+
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", filters={"status": "protecting"})
+        self.assertEqual([summaries[1]], result)
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", filters={"status": ["error", "protecting"]})
+        self.assertEqual(summaries[1:], result)
+
+        list_summaries = mock_provider.return_value.list_checkpoint_summaries
+        list_summaries.return_value = summaries
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", filters={"status": "error", "resync": True})
+        self.assertEqual([summaries[2]], result)
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints_resync(self, mock_provider):
+        ctxt = context.get_admin_context()
+        summary = self._fake_summary("cp0", "plan0", 1)
+        list_summaries = mock_provider.return_value.list_checkpoint_summaries
+        list_summaries.return_value = [summary]
+
+        result = self.pro_manager.list_checkpoints(
+            ctxt, "provider1", filters={"resync": "true"})
+        self.assertEqual([summary], result)
+        self.assertEqual(
+            [summary],
+            self.pro_manager.list_checkpoints(ctxt, "provider1", filters={}))
+
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints_invalid_sort_key(self, mock_provider):
+        self.assertRaises(oslo_messaging.ExpectedException,
+                          self.pro_manager.list_checkpoints,
+                          context.get_admin_context(), "provider1",
+                          sort_keys=["resource_graph"], filters={})
+
     def tearDown(self):
         flow_manager.Worker._load_engine = self.load_engine
         super(ProtectionServiceTest, self).tearDown()
@@ -0,0 +1,145 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from eventlet import event
+import mock
+
+from karbor import exception
+from karbor.services.protection import operation_queue
+from karbor.services.protection import status_poller
+from karbor.tests import base
+
+
+class OperationQueueTest(base.TestCase):
+    def setUp(self):
+        super(OperationQueueTest, self).setUp()
+        self.started = []
+        completion_times = status_poller.get_completion_times()
+        self.addCleanup(completion_times._unit_durations.pop,
+                        operation_queue._DURATION_KEY, None)
+        completion_times._unit_durations.pop(operation_queue._DURATION_KEY,
+                                             None)
+
+    def _run(self, name, blocker=None):
+        self.started.append(name)
+        if blocker is not None:
+            blocker.wait()
+
+    def _block(self, queue, name, project_id='project'):
+        blocker = event.Event()
+        queue.submit(operation_queue.PRIORITY_PROTECT, project_id,
+                     self._run, name, blocker)
+        eventlet.sleep(0)
+        return blocker
+
+    def _wait_idle(self, queue):
+        while queue.get_stats()['running']:
+            eventlet.sleep(0)
+
+    def test_priorities(self):
+        queue = operation_queue.OperationQueue(concurrency=1)
+        blocker = self._block(queue, 'blocker')
+        for priority in reversed(operation_queue.PRIORITIES):
+            queue.submit(priority, 'project', self._run,
+                         operation_queue.PRIORITY_NAMES[priority])
+
+        blocker.send()
+        self._wait_idle(queue)
+
+        self.assertEqual(['blocker', 'restore', 'protect',
+                          'scheduled protect', 'delete'], self.started)
+
+    def test_fair_share_between_projects(self):
+        queue = operation_queue.OperationQueue(concurrency=2)
+        self._block(queue, 'a1', 'a')
+        blocker = self._block(queue, 'x1', 'x')
+        queue.submit(operation_queue.PRIORITY_PROTECT, 'a', self._run, 'a2')
+        queue.submit(operation_queue.PRIORITY_PROTECT, 'b', self._run, 'b1')
+
+        blocker.send()
+        eventlet.sleep(0)
+        eventlet.sleep(0)
+
+        # Project a already runs an operation, b goes first
+        self.assertEqual(['a1', 'x1', 'b1'], self.started[:3])
+
+    def test_unlimited_concurrency(self):
+        queue = operation_queue.OperationQueue()
+        blockers = [self._block(queue, 'op%d' % i) for i in range(3)]
+
+        self.assertEqual(3, queue.get_stats()['running'])
+        for blocker in blockers:
+            blocker.send()
+        self._wait_idle(queue)
+
+    def test_reject_long_wait(self):
+        queue = operation_queue.OperationQueue(concurrency=1, timeout=10)
+        blocker = self._block(queue, 'blocker')
+        # Admitted while there is no duration to estimate the wait from
+        queue.check_admission(operation_queue.PRIORITY_DELETE)
+
+        status_poller.get_completion_times().record(
+            operation_queue._DURATION_KEY, 100)
+        self.assertEqual(100, queue.estimate_wait(
+            operation_queue.PRIORITY_RESTORE))
+        self.assertRaises(exception.OperationRejected, queue.check_admission,
+                          operation_queue.PRIORITY_RESTORE)
+
+        # Admitted operations are queued whatever the estimated wait
+        queue.submit(operation_queue.PRIORITY_RESTORE, 'project',
+                     self._run, 'restore')
+        blocker.send()
+        self._wait_idle(queue)
+        self.assertEqual(['blocker', 'restore'], self.started)
+
+    def test_expire_queued_operation(self):
+        queue = operation_queue.OperationQueue(concurrency=1, timeout=0.01)
+        blocker = self._block(queue, 'blocker')
+        on_expired = mock.Mock()
+        queue.submit(operation_queue.PRIORITY_DELETE, 'project', self._run,
+                     'delete', on_expired=on_expired)
+
+        eventlet.sleep(0.05)
+        blocker.send()
+        self._wait_idle(queue)
+
+        on_expired.assert_called_once_with()
+        self.assertEqual(['blocker'], self.started)
+
+    def test_get_stats(self):
+        queue = operation_queue.OperationQueue(concurrency=1)
+        blocker = self._block(queue, 'blocker')
+        delete = queue.submit(operation_queue.PRIORITY_DELETE, 'a',
+                              self._run, 'delete')
+        restore = queue.submit(operation_queue.PRIORITY_RESTORE, 'b',
+                               self._run, 'restore')
+
+        stats = queue.get_stats()
+        self.assertEqual(1, stats['running'])
+        self.assertEqual(['restore', 'delete'],
+                         [queued['priority'] for queued in stats['queued']])
+        self.assertEqual([0, 1],
+                         [queued['position'] for queued in stats['queued']])
+        self.assertEqual(1, queue.get_position(delete))
+        self.assertEqual(0, queue.get_position(restore))
+        self.assertIsNone(stats['estimated_waits']['restore'])
+
+        status_poller.get_completion_times().record(
+            operation_queue._DURATION_KEY, 10)
+        stats = queue.get_stats()
+        self.assertEqual(20, stats['estimated_waits']['restore'])
+        self.assertEqual(30, stats['estimated_waits']['delete'])
+
+        blocker.send()
+        self._wait_idle(queue)
+        self.assertIsNone(queue.get_position(delete))
@@ -10,6 +10,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
+from karbor.exception import ListProtectableResourceFailed
 from karbor.resource import Resource
 from karbor.services.protection.protectable_plugin import ProtectablePlugin
 from karbor.services.protection.protectable_registry import ProtectableRegistry
@@ -82,6 +85,39 @@ class ProtectableRegistryTest(base.TestCase):
             self.assert_graph(result_graph, g)
             self.protectable_registry._protectable_map = {}
 
+    def test_graph_building_with_index(self):
+        A = Resource(_FAKE_TYPE, "A", 'nameA')
+        B = Resource(_FAKE_TYPE, "B", 'nameB')
+        C = Resource(_FAKE_TYPE, "C", 'nameC')
+        g = {A: [B, C],
+             B: [C],
+             C: []}
+        self._fake_plugin.graph = g
+        index = {_FAKE_TYPE: {A.id: [B, C], B.id: [C]}}
+        with mock.patch.object(_FakeProtectablePlugin,
+                               'get_dependent_resources_index',
+                               return_value=index) as mock_index, \
+                mock.patch.object(_FakeProtectablePlugin,
+                                  'get_dependent_resources') as mock_get:
+            result_graph = self.protectable_registry.build_graph(None, [A])
+        self.assert_graph(result_graph, g)
+        # The dependent resources of all the nodes came from one listing
+        self.assertEqual(1, mock_index.call_count)
+        self.assertFalse(mock_get.called)
+
+    def test_graph_building_with_failed_index(self):
+        A = Resource(_FAKE_TYPE, "A", 'nameA')
+        B = Resource(_FAKE_TYPE, "B", 'nameB')
+        g = {A: [B],
+             B: []}
+        self._fake_plugin.graph = g
+        with mock.patch.object(
+                _FakeProtectablePlugin, 'get_dependent_resources_index',
+                side_effect=ListProtectableResourceFailed(type=_FAKE_TYPE,
+                                                          reason='')):
+            result_graph = self.protectable_registry.build_graph(None, [A])
+        self.assert_graph(result_graph, g)
+
     def assert_graph(self, g, g_dict):
         for item in g:
             expected = set(g_dict[item.value])
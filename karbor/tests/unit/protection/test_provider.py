@@ -10,9 +10,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
+import fixtures
 import mock
 
 from karbor.resource import Resource
+from karbor.services.protection import governor
 from karbor.services.protection import provider
 from karbor.tests import base
 from karbor.tests.unit.protection import fakes
@@ -35,6 +39,17 @@ resource_graph = {
     grandchild: [],
 }
 
+PROVIDER_CONFIG = """[provider]
+name = reload_provider
+id = reload_id
+bank = karbor.tests.unit.fake_bank.FakeBankPlugin
+plugin = karbor.tests.unit.protection.fakes.FakeProtectionPlugin
+enabled = True
+
+[fake_plugin]
+fake_user = %s
+"""
+
 
 class ProviderRegistryTest(base.TestCase):
     def setUp(self):
@@ -63,6 +78,43 @@ class ProviderRegistryTest(base.TestCase):
         plugins = provider1.load_plugins()
         self.assertEqual('user', plugins['Test::ResourceA'].fake_user)
 
+    def test_provider_plugins_shared(self):
+        pr = provider.ProviderRegistry()
+        provider1 = pr.show_provider('fake_id1')
+        plugins = provider1.load_plugins()
+
+        # A plugin is instantiated once for all its resource types and flows
+        self.assertIs(plugins['Test::ResourceA'], plugins['Test::ResourceB'])
+        self.assertIs(plugins['Test::ResourceA'],
+                      provider1.load_plugins()['Test::ResourceA'])
+
+    def test_provider_reload_plugins(self):
+        config_dir = self.useFixture(fixtures.TempDir()).path
+        config_path = os.path.join(config_dir, 'provider.conf')
+        with open(config_path, 'w') as config_file:
+            config_file.write(PROVIDER_CONFIG % 'user')
+        provider_config = cfg.ConfigOpts()
+        provider_config(args=['--config-file=' + config_path])
+        provider_config.register_opts(provider.provider_opts, 'provider')
+        provider1 = provider.PluggableProtectionProvider(provider_config)
+        plugin = provider1.load_plugins()['Test::ResourceA']
+
+        with open(config_path, 'w') as config_file:
+            config_file.write(PROVIDER_CONFIG % 'other_user')
+        provider1.reload_plugins()
+
+        reloaded_plugin = provider1.load_plugins()['Test::ResourceA']
+        self.assertIsNot(plugin, reloaded_plugin)
+        self.assertEqual('user', plugin.fake_user)
+        self.assertEqual('other_user', reloaded_plugin.fake_user)
+
+    def test_provider_limits_config(self):
+        provider.ProviderRegistry()
+        limiter = governor.get_governor().get_limiter('fake_id1',
+                                                      'cinder.backup')
+        self.assertEqual(2, limiter.concurrency)
+        self.assertIsNone(limiter.rate)
+
     def test_list_provider(self):
         pr = provider.ProviderRegistry()
         self.assertEqual(1, len(pr.list_providers()))
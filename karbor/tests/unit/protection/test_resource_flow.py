@@ -11,16 +11,21 @@
 #    under the License.
 
 from functools import partial
+import eventlet
 import mock
 
 from karbor.common import constants
 from karbor.resource import Resource
+from karbor.services.protection import bank_plugin
 from karbor.services.protection.flows.workflow import TaskFlowEngine
+from karbor.services.protection import governor
 from karbor.services.protection import graph
+from karbor.services.protection import protection_plugin
 from karbor.services.protection import resource_flow
 from karbor.services.protection import restore_heat
 from karbor.tests import base
 from karbor.tests.unit.protection import fakes
+from karbor.tests.unit.protection.test_bank import _InMemoryBankPlugin
 from oslo_config import cfg
 
 CONF = cfg.CONF
@@ -53,7 +58,7 @@ class ResourceFlowTest(base.TestCase):
 
     def _walk_operation(self, protection, operation_type,
                         checkpoint='checkpoint', parameters={}, context=None,
-                        **kwargs):
+                        limits_scope=None, **kwargs):
         plugin_map = {
             parent_type: protection,
             child_type: protection,
@@ -64,7 +69,8 @@ class ResourceFlowTest(base.TestCase):
                                                  self.taskflow_engine,
                                                  plugin_map,
                                                  self.test_graph,
-                                                 parameters)
+                                                 parameters,
+                                                 limits_scope)
 
         store = {
             'checkpoint': checkpoint,
@@ -214,3 +220,84 @@ class ResourceFlowTest(base.TestCase):
                             order_list.index(('main', resource_id)))
             self.assertLess(order_list.index(('main', resource_id)),
                             order_list.index(('complete', resource_id)))
+
+    @mock.patch('karbor.tests.unit.protection.fakes.FakeProtectionPlugin')
+    def test_resource_flow_limits(self, mock_protection):
+        state = {'in_flight': 0, 'max_in_flight': 0}
+
+        class LimitedOperation(protection_plugin.Operation):
+            concurrency_key = 'fake.main'
+
+            def on_main(self, checkpoint, resource, context, parameters,
+                        **kwargs):
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'],
+                                             state['in_flight'])
+                eventlet.sleep(0.01)
+                state['in_flight'] -= 1
+
+        self.resource_graph = {parent: [child, grandchild], child: [],
+                               grandchild: []}
+        self.test_graph = graph.build_graph([parent],
+                                            self.resource_graph.__getitem__)
+        mock_protection.get_protect_operation.return_value = (
+            LimitedOperation())
+        self.addCleanup(governor.get_governor().configure, 'limited')
+        governor.get_governor().configure('limited', {'fake.main': 1})
+
+        with mock.patch.object(resource_flow, '_govern_hook',
+                               wraps=resource_flow._govern_hook) as mock_gov:
+            self._walk_operation(mock_protection, constants.OPERATION_PROTECT,
+                                 limits_scope='limited')
+
+        # Only the implemented hook of every resource is governed
+        self.assertEqual(3, mock_gov.call_count)
+        self.assertEqual(1, state['max_in_flight'])
+
+    @mock.patch('karbor.tests.unit.protection.fakes.FakeProtectionPlugin')
+    def test_resource_flow_persisted_attributes(self, mock_protection):
+        self.override_config('flow_persistence', True)
+        bank = bank_plugin.Bank(_InMemoryBankPlugin())
+        checkpoint = mock.Mock()
+        checkpoint.get_resource_bank_section.side_effect = (
+            lambda resource_id: bank_plugin.BankSection(
+                bank, '/resource-data/%s/' % resource_id))
+        key = 'operation_state_%s' % constants.OPERATION_PROTECT
+        seen = {}
+
+        class StatefulOperation(protection_plugin.Operation):
+            persisted_attributes = ('snapshot_id', )
+
+            def __init__(self):
+                super(StatefulOperation, self).__init__()
+                self.snapshot_id = None
+
+            def on_prepare_finish(self, checkpoint, resource, context,
+                                  parameters, **kwargs):
+                if resource.id != parent.id:
+                    self.snapshot_id = 'snapshot_' + resource.id
+
+            def on_main(self, checkpoint, resource, context, parameters,
+                        **kwargs):
+                seen[resource.id] = (
+                    self.snapshot_id,
+                    checkpoint.get_resource_bank_section(
+                        resource.id).get_object(key))
+
+        # The parent operation resumes with the state of a previous run
+        bank_plugin.BankSection(
+            bank, '/resource-data/%s/' % parent.id).update_object(
+                key, {'snapshot_id': 'snapshot_before_restart'})
+        mock_protection.get_protect_operation.side_effect = (
+            lambda resource: StatefulOperation())
+
+        self._walk_operation(mock_protection, constants.OPERATION_PROTECT,
+                             checkpoint=checkpoint)
+
+        self.assertEqual(
+            ('snapshot_before_restart',
+             {'snapshot_id': 'snapshot_before_restart'}), seen[parent.id])
+        self.assertEqual(('snapshot_B1', {'snapshot_id': 'snapshot_B1'}),
+                         seen[child.id])
+        # The state is deleted once the operation completed
+        self.assertEqual([], list(bank.list_objects('/resource-data/')))
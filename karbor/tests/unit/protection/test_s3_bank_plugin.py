@@ -95,3 +95,56 @@ class S3BankPluginTest(base.TestCase):
         self.s3_bank_plugin.update_object("dict_object", {"key": "value"})
         value = self.s3_bank_plugin.get_object("dict_object")
         self.assertEqual(value, {"key": "value"})
+
+    def test_write_object_stream_and_open_object_reader(self):
+        self.s3_bank_plugin.multipart_part_size = 4
+        self.s3_bank_plugin.write_object_stream(
+            "stream", iter([b"abc", b"defghij"]))
+        reader = self.s3_bank_plugin.open_object_reader("stream")
+        self.assertEqual(b"abcdefghij", reader.read())
+        reader.close()
+
+    def test_update_get_large_object(self):
+        self.s3_bank_plugin.multipart_part_size = 4
+        self.s3_bank_plugin.multipart_threshold = 8
+        self.s3_bank_plugin.max_concurrency = 2
+        self.fake_connection.upload_part = mock.MagicMock(
+            side_effect=self.fake_connection.upload_part)
+        value = {"key": "0123456789"}
+        self.s3_bank_plugin.update_object("large", value)
+        parts = [call for call in
+                 self.fake_connection.upload_part.mock_calls
+                 if call[2]['Key'] == 'large']
+        self.assertEqual(6, len(parts))
+        self.assertEqual(value, self.s3_bank_plugin.get_object("large"))
+
+    def test_open_object_reader_ranges(self):
+        self.s3_bank_plugin.multipart_part_size = 4
+        self.s3_bank_plugin.max_concurrency = 2
+        self.s3_bank_plugin.write_object_stream(
+            "stream", iter([b"0123456789"]))
+        self.fake_connection.get_object = mock.MagicMock(
+            side_effect=self.fake_connection.get_object)
+        reader = self.s3_bank_plugin.open_object_reader("stream")
+        self.assertEqual(b"0123456789", reader.read())
+        reader.close()
+        ranges = [call[2]['Range'] for call in
+                  self.fake_connection.get_object.mock_calls]
+        self.assertEqual(['bytes=0-3', 'bytes=4-7', 'bytes=8-9'], ranges)
+
+    def test_open_empty_object_reader(self):
+        self.s3_bank_plugin.write_object_stream("empty", iter([]))
+        reader = self.s3_bank_plugin.open_object_reader("empty")
+        self.assertEqual(b"", reader.read())
+
+    @mock.patch('karbor.services.protection.bank_plugins.s3_bank_plugin.'
+                'S3_DELETE_OBJECTS_MAX_KEYS', 2)
+    def test_delete_objects(self):
+        self.s3_bank_plugin.update_object("key-1", "value-1")
+        self.s3_bank_plugin.update_object("key-2", "value-2")
+        self.s3_bank_plugin.update_object("key-3", "value-3")
+        self.fake_connection.delete_objects = mock.MagicMock(
+            side_effect=self.fake_connection.delete_objects)
+        self.s3_bank_plugin.delete_objects(["key-1", "key-2", "key-3"])
+        self.assertEqual(2, self.fake_connection.delete_objects.call_count)
+        self.assertEqual([], self.s3_bank_plugin.list_objects())
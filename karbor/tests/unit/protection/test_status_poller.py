@@ -0,0 +1,183 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from functools import partial
+import itertools
+
+import eventlet
+
+from karbor import context
+from karbor.services.protection import status_poller
+from karbor.tests import base
+
+
+class FakeStatusService(object):
+    def __init__(self, statuses):
+        super(FakeStatusService, self).__init__()
+        # Every resource goes through its list of statuses, a status per poll
+        self._statuses = statuses
+        self.get_calls = []
+        self.list_calls = []
+        self.pending_statuses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _next_status(self, resource_id):
+        statuses = self._statuses[resource_id]
+        return statuses.pop(0) if len(statuses) > 1 else statuses[0]
+
+    def get_status(self, resource_id):
+        self.get_calls.append(resource_id)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        eventlet.sleep(0)
+        self.in_flight -= 1
+        return self._next_status(resource_id)
+
+    def list_statuses(self, resource_ids, pending_statuses):
+        self.list_calls.append(sorted(resource_ids))
+        self.pending_statuses.append(pending_statuses)
+        return {resource_id: self._next_status(resource_id)
+                for resource_id in resource_ids}
+
+
+class StatusPollerTest(base.TestCase):
+    def setUp(self):
+        super(StatusPollerTest, self).setUp()
+        self.context = context.RequestContext(user_id='demo',
+                                              project_id='abcd')
+        self.poller = status_poller.StatusPoller()
+
+    def _wait_all(self, service, resource_ids, resource_type='volume'):
+        pool = eventlet.GreenPool()
+        results = {}
+
+        def _wait(resource_id):
+            results[resource_id] = self.poller.wait(
+                self.context, 'cinder', resource_type, resource_id,
+                partial(service.get_status, resource_id),
+                service.list_statuses,
+                interval=0,
+                success_statuses={'available'},
+                failure_statuses={'error'},
+                ignore_statuses={'creating'})
+
+        for resource_id in resource_ids:
+            pool.spawn_n(_wait, resource_id)
+        pool.waitall()
+        return results
+
+    def test_poll_many_resources_with_a_listing(self):
+        self.override_config('status_poll_list_threshold', 5)
+        resource_ids = ['volume%d' % i for i in range(10)]
+        statuses = {resource_id: ['creating', 'available']
+                    for resource_id in resource_ids}
+        statuses['volume0'] = ['creating', 'creating', 'error']
+        service = FakeStatusService(statuses)
+
+        results = self._wait_all(service, resource_ids)
+
+        expected_results = {resource_id: True for resource_id in resource_ids}
+        expected_results['volume0'] = False
+        self.assertEqual(expected_results, results)
+        self.assertEqual([resource_ids, resource_ids], service.list_calls)
+        self.assertEqual([['creating'], ['creating']],
+                         service.pending_statuses)
+        # The last resource left is polled on its own
+        self.assertEqual(['volume0'], service.get_calls)
+
+    def test_poll_few_resources_with_gets(self):
+        self.override_config('status_poll_list_threshold', 5)
+        service = FakeStatusService({'volume0': ['creating', 'available'],
+                                     'volume1': ['unexpected']})
+
+        results = self._wait_all(service, ['volume0', 'volume1'])
+
+        self.assertEqual({'volume0': True, 'volume1': False}, results)
+        self.assertEqual([], service.list_calls)
+        self.assertEqual(['volume0', 'volume0', 'volume1'],
+                         sorted(service.get_calls))
+
+    def test_poll_concurrency_limit(self):
+        self.override_config('status_poll_list_threshold', 100)
+        self.override_config('status_poll_concurrency', 2)
+        resource_ids = ['volume%d' % i for i in range(6)]
+        service = FakeStatusService({resource_id: ['available']
+                                     for resource_id in resource_ids})
+
+        results = self._wait_all(service, resource_ids)
+
+        self.assertTrue(all(results.values()))
+        self.assertEqual(2, service.max_in_flight)
+
+    def test_poll_failure_is_raised(self):
+        def _get_status():
+            raise ValueError()
+
+        self.assertRaises(ValueError, self.poller.wait, self.context,
+                          'cinder', 'volume', 'volume0', _get_status, None,
+                          interval=0, success_statuses={'available'})
+
+
+class PollScheduleTest(base.TestCase):
+    def setUp(self):
+        super(PollScheduleTest, self).setUp()
+        self.override_config('status_poll_initial_interval', 1)
+        self.override_config('status_poll_backoff_factor', 2)
+        self.override_config('status_poll_jitter', 0)
+        self.override_config('status_poll_max_interval', 300)
+
+    def _get_intervals(self, schedule, count):
+        return list(itertools.islice(schedule.intervals(), count))
+
+    def test_fixed_interval_schedule(self):
+        schedule = status_poller.get_poll_schedule(15)
+        self.assertEqual([15, 15, 15], self._get_intervals(schedule, 3))
+
+    def test_backoff_schedule(self):
+        schedule = status_poller.BackoffSchedule(15)
+        self.assertEqual([1, 2, 4, 8, 15, 15],
+                         self._get_intervals(schedule, 6))
+
+    def test_backoff_schedule_jitter(self):
+        self.override_config('status_poll_jitter', 0.5)
+        schedule = status_poller.BackoffSchedule(15)
+        for interval, expected in zip(self._get_intervals(schedule, 6),
+                                      [1, 2, 4, 8, 15, 15]):
+            self.assertTrue(expected * 0.5 <= interval <= expected * 1.5)
+
+    def test_backoff_schedule_expected_duration(self):
+        schedule = status_poller.BackoffSchedule(15, expected_duration=64)
+        self.assertEqual([32, 16, 8, 8, 15, 15],
+                         self._get_intervals(schedule, 6))
+
+    def test_backoff_schedule_from_completion_times(self):
+        completion_times = status_poller.get_completion_times()
+        self.addCleanup(completion_times._unit_durations.pop, 'test', None)
+        status_poller.BackoffSchedule(
+            15, history_key='test', size=10).on_completed(100)
+
+        schedule = status_poller.BackoffSchedule(15, history_key='test',
+                                                 size=2)
+        self.assertEqual(20, schedule.expected_duration)
+        self.assertIsNone(status_poller.BackoffSchedule(
+            15, history_key='other').expected_duration)
+
+    def test_completion_times(self):
+        completion_times = status_poller.CompletionTimes(weight=0.5)
+        self.assertIsNone(completion_times.expected_duration('key'))
+        completion_times.record('key', 10, size=1)
+        completion_times.record('key', 60, size=2)
+        self.assertEqual(40, completion_times.expected_duration('key', 2))
+        # Unknown sizes count as a single unit
+        self.assertEqual(
+            20, completion_times.expected_duration('key', object()))
@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
 from karbor.services.protection.clients import swift
 from karbor.tests import base
 from karbor.tests.unit.protection.fake_swift_client import FakeSwiftClient
@@ -102,3 +103,131 @@ class SwiftBankPluginTest(base.TestCase):
         self.swift_bank_plugin.update_object("dict_object", {"key": "value"})
         value = self.swift_bank_plugin.get_object("dict_object")
         self.assertEqual({"key": "value"}, value)
+
+    def test_write_object_stream_and_open_object_reader(self):
+        self.swift_bank_plugin.read_chunk_size = 3
+        self.swift_bank_plugin.write_object_stream(
+            "stream", iter([b"abc", b"defg"]))
+        reader = self.swift_bank_plugin.open_object_reader("stream")
+        self.assertEqual(b"ab", reader.read(2))
+        self.assertEqual(b"cdefg", reader.read())
+        reader.close()
+
+    def test_write_large_object_stream(self):
+        self.swift_bank_plugin.segment_size = 4
+        self.swift_bank_plugin.write_object_stream(
+            "large", iter([b"0123", b"456789"]))
+        segments = self.fake_connection.manifests[os.path.join(
+            self.fake_connection.swiftdir, "karbor", "large")]
+        self.assertEqual(3, len(segments))
+        reader = self.swift_bank_plugin.open_object_reader("large")
+        self.assertEqual(b"0123456789", reader.read())
+        reader.close()
+        self.swift_bank_plugin.delete_object("large")
+        for segment in segments:
+            self.assertFalse(os.path.isfile(segment))
+        self.assertFalse(os.path.isfile(os.path.join(
+            self.fake_connection.swiftdir, "karbor_segments", "manifests",
+            "karbor", "large")))
+
+    def test_overwrite_large_object_deletes_previous_segments(self):
+        self.swift_bank_plugin.segment_size = 4
+        self.swift_bank_plugin.write_object_stream(
+            "large", iter([b"0123456789"]))
+        large_file = os.path.join(self.fake_connection.swiftdir,
+                                  "karbor", "large")
+        previous_segments = self.fake_connection.manifests[large_file]
+        self.swift_bank_plugin.write_object_stream(
+            "large", iter([b"abcdefgh"]))
+
+        for segment in previous_segments:
+            self.assertFalse(os.path.isfile(segment))
+        _resp, segments = self.fake_connection.get_container(
+            "karbor_segments", "karbor/large/", None, None, None, True)
+        self.assertEqual(2, len(segments))
+        reader = self.swift_bank_plugin.open_object_reader("large")
+        self.assertEqual(b"abcdefgh", reader.read())
+        reader.close()
+
+    def test_delete_missing_object(self):
+        self.swift_bank_plugin.delete_object("missing")
+
+    def test_update_get_large_object(self):
+        self.swift_bank_plugin.segment_size = 4
+        self.swift_bank_plugin.update_object("large", {"key": "value"})
+        self.assertEqual({"key": "value"},
+                         self.swift_bank_plugin.get_object("large"))
+
+    def test_delete_objects(self):
+        self.swift_bank_plugin.update_object("key-1", "value-1")
+        self.swift_bank_plugin.update_object("key-2", "value-2")
+        self.swift_bank_plugin.segment_size = 4
+        self.swift_bank_plugin.bulk_delete_size = 2
+        self.swift_bank_plugin.write_object_stream(
+            "large", iter([b"0123456789"]))
+        self.swift_bank_plugin.write_object_stream(
+            "other", iter([b"0123456789"]))
+        with mock.patch.object(
+                self.fake_connection, 'get_container',
+                wraps=self.fake_connection.get_container) as mock_list:
+            self.swift_bank_plugin.delete_objects(
+                ["key-1", "key-2", "large"])
+        # The large objects are found with a single listing
+        self.assertEqual(1, mock_list.call_count)
+        self.assertEqual(["other"], self.swift_bank_plugin.list_objects())
+        _resp, segments = self.fake_connection.get_container(
+            "karbor_segments", "karbor/", None, None, None, True)
+        self.assertEqual(["karbor/other/slo"],
+                         sorted(set(segment["name"].rsplit("/", 2)[0]
+                                    for segment in segments)))
+        _resp, markers = self.fake_connection.get_container(
+            "karbor_segments", "manifests/karbor/", None, None, None, True)
+        self.assertEqual(["manifests/karbor/other"],
+                         [marker["name"] for marker in markers])
+
+    def test_get_update_objects(self):
+        self.swift_bank_plugin.update_objects({"key-1": "value-1",
+                                               "key-2": {"key": "value"}})
+        self.assertEqual({"key-1": "value-1", "key-2": {"key": "value"}},
+                         self.swift_bank_plugin.get_objects(
+                             ["key-1", "key-2"]))
+
+    def test_concurrent_requests_use_distinct_connections(self):
+        # Set up the bank, then drop the connection pooled by the lease
+        self.swift_bank_plugin.connection
+        self.swift_bank_plugin._connection_pool.get_nowait()
+        busy = set()
+        connections = []
+
+        def new_connection():
+            connection = mock.MagicMock()
+
+            def put_object(**kwargs):
+                self.assertNotIn(connection, busy)
+                busy.add(connection)
+                eventlet.sleep(0.01)
+                busy.remove(connection)
+            connection.put_object.side_effect = put_object
+            connections.append(connection)
+            return connection
+
+        with mock.patch.object(self.swift_bank_plugin, '_setup_connection',
+                               side_effect=new_connection):
+            pool = eventlet.GreenPool()
+            updates = [pool.spawn(self.swift_bank_plugin.update_object,
+                                  "key-%d" % i, "value") for i in range(3)]
+            for update in updates:
+                update.wait()
+            # The connections are reused once released
+            self.swift_bank_plugin.update_object("key-3", "value")
+        self.assertEqual(3, len(connections))
+
+    def test_open_object_reader_holds_its_connection(self):
+        self.swift_bank_plugin.update_object("key", "value")
+        connection_pool = self.swift_bank_plugin._connection_pool
+        pooled = connection_pool.qsize()
+        reader = self.swift_bank_plugin.open_object_reader("key")
+        self.assertEqual(pooled - 1, connection_pool.qsize())
+        self.assertEqual(b"value", reader.read())
+        reader.close()
+        self.assertEqual(pooled, connection_pool.qsize())
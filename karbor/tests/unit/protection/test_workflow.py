@@ -10,6 +10,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+from taskflow import states
+
+from karbor import context
+from karbor.services.protection.client_factory import ClientFactory
+from karbor.services.protection.flows import utils
 from karbor.services.protection.flows import workflow
 from karbor.tests import base
 
@@ -40,3 +46,161 @@ class WorkFlowTest(base.TestCase):
         self.workflow_engine.add_tasks(flow, task1, task2)
         result = self.workflow_engine.search_task(flow, 'fake_func2')
         self.assertEqual('fake_func2', getattr(result, 'name'))
+
+    def _build_persisted_flow(self, calls):
+        def _record(name, checkpoint):
+            calls.append(name)
+
+        flow = self.workflow_engine.build_flow('test', 'linear')
+        for name in ('task1', 'task2', 'task3'):
+            self.workflow_engine.add_tasks(
+                flow, self.workflow_engine.create_task(
+                    _record, name=name, inject={'name': name},
+                    requires=['checkpoint']))
+        return flow
+
+    def test_resume_persisted_flow(self):
+        self.override_config('flow_persistence', True)
+        self.override_config('flow_persistence_connection', 'sqlite://')
+        listener = mock.Mock()
+        self.workflow_engine.add_discard_listener(listener)
+        calls = []
+        flow_engine = self.workflow_engine.get_engine(
+            self._build_persisted_flow(calls), engine='serial',
+            store={'checkpoint': object()}, persist_as='protect_test',
+            meta={'checkpoint_id': 'test'})
+
+        # Interrupt the flow once its first task completed
+        run = flow_engine.run_iter()
+        for _ in run:
+            if flow_engine.storage.get_atom_state('task1') == states.SUCCESS:
+                break
+        run.close()
+        self.assertEqual(['task1'], calls)
+
+        flow_details = self.workflow_engine.get_unfinished_flows()
+        self.assertEqual(1, len(flow_details))
+        self.assertEqual({'checkpoint_id': 'test'}, flow_details[0].meta)
+
+        flow_engine = self.workflow_engine.get_engine(
+            self._build_persisted_flow(calls), engine='serial',
+            store={'checkpoint': object()}, flow_detail=flow_details[0])
+        self.workflow_engine.run_engine(flow_engine)
+
+        self.assertEqual(['task1', 'task2', 'task3'], calls)
+        # A finished flow is no longer persisted
+        self.assertEqual([], self.workflow_engine.get_unfinished_flows())
+        listener.assert_called_once_with({'checkpoint_id': 'test'})
+
+    def test_flow_not_persisted(self):
+        calls = []
+        flow_engine = self.workflow_engine.get_engine(
+            self._build_persisted_flow(calls), store={'checkpoint': None},
+            persist_as='protect_test')
+        self.workflow_engine.run_engine(flow_engine)
+
+        self.assertEqual(['task1', 'task2', 'task3'], calls)
+        self.assertEqual([], self.workflow_engine.get_unfinished_flows())
+
+    def test_flow_persisted_before_built(self):
+        self.override_config('flow_persistence', True)
+        self.override_config('flow_persistence_connection', 'sqlite://')
+        flow_detail = self.workflow_engine.persist_flow(
+            'protect_test', {'checkpoint_id': 'test'})
+
+        flow_details = self.workflow_engine.get_unfinished_flows()
+        self.assertEqual([flow_detail.uuid],
+                         [detail.uuid for detail in flow_details])
+
+        self.workflow_engine.update_flow_meta(
+            flow_detail, {'checkpoint_id': 'test', 'built': True})
+        calls = []
+        flow_engine = self.workflow_engine.get_engine(
+            self._build_persisted_flow(calls), engine='serial',
+            store={'checkpoint': object()}, flow_detail=flow_detail)
+        self.assertEqual({'checkpoint_id': 'test', 'built': True},
+                         self.workflow_engine.get_unfinished_flows()[0].meta)
+
+        self.workflow_engine.discard_engine(flow_engine)
+        self.assertEqual([], self.workflow_engine.get_unfinished_flows())
+        self.assertEqual([], calls)
+
+
+class FlowMetaTest(base.TestCase):
+    def setUp(self):
+        super(FlowMetaTest, self).setUp()
+        self.keystone_plugin = mock.Mock()
+        patcher = mock.patch.object(ClientFactory, 'get_keystone_plugin',
+                                    return_value=self.keystone_plugin)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.context = context.RequestContext(
+            user_id='demo', project_id='abcd', roles=['member'],
+            auth_token='token', auth_token_info={'token': {}})
+
+    def test_flow_meta_without_token(self):
+        meta = utils.get_flow_meta(self.context, 'protect',
+                                   mock.Mock(id='provider'),
+                                   mock.Mock(id='checkpoint'),
+                                   trust_id='trust')
+
+        self.assertEqual('trust', meta['trust_id'])
+        self.assertEqual('abcd', meta['context']['project_id'])
+        self.assertEqual(['member'], meta['context']['roles'])
+        self.assertNotIn('auth_token', meta['context'])
+        self.assertNotIn('auth_token_info', meta['context'])
+
+    def test_create_flow_trust(self):
+        self.assertIsNone(utils.create_flow_trust(self.context))
+
+        self.override_config('flow_persistence', True)
+        self.keystone_plugin.create_trust_to_karbor.return_value = 'trust'
+        self.assertEqual('trust', utils.create_flow_trust(self.context))
+
+        self.keystone_plugin.create_trust_to_karbor.side_effect = Exception()
+        self.assertIsNone(utils.create_flow_trust(self.context))
+
+    def test_get_flow_context(self):
+        meta = utils.get_flow_meta(self.context, 'protect',
+                                   mock.Mock(id='provider'),
+                                   mock.Mock(id='checkpoint'),
+                                   trust_id='trust')
+        session = self.keystone_plugin.create_trust_session.return_value
+        auth_ref = session.auth.get_access.return_value
+        auth_ref.auth_token = 'trust_token'
+        auth_ref._data = {'token': {'project': {'id': 'abcd'}}}
+
+        resumed_context = utils.get_flow_context(meta)
+
+        self.keystone_plugin.create_trust_session.assert_called_once_with(
+            'trust')
+        self.assertEqual('demo', resumed_context.user_id)
+        self.assertEqual('abcd', resumed_context.project_id)
+        self.assertEqual('trust_token', resumed_context.auth_token)
+        self.assertEqual(auth_ref._data, resumed_context.auth_token_info)
+
+    def test_delete_flow_trust(self):
+        utils.delete_flow_trust({'trust_id': None})
+        self.keystone_plugin.delete_trust_to_karbor.assert_not_called()
+
+        utils.delete_flow_trust({'trust_id': 'trust'})
+        self.keystone_plugin.delete_trust_to_karbor.assert_called_once_with(
+            'trust')
+
+    @mock.patch('karbor.objects.OperationLog')
+    def test_create_scheduled_operation_log(self, mock_operation_log):
+        checkpoint = mock.Mock()
+        checkpoint.to_dict.return_value = {
+            'id': 'checkpoint',
+            'project_id': 'abcd',
+            'status': 'protecting',
+            'protection_plan': {'id': 'plan', 'provider_id': 'provider'},
+            'extra_info': '{"create_by": "operation-engine", '
+                          '"scheduled_operation_id": "operation"}',
+        }
+
+        utils.create_operation_log(self.context, checkpoint)
+
+        self.assertEqual(
+            'operation',
+            mock_operation_log.call_args[1]['scheduled_operation_id'])
@@ -21,7 +21,15 @@ from oslo_db import exception as db_exc
 
 from karbor.cmd import api as karbor_api
 from karbor.cmd import manage as karbor_manage
+from karbor import context
+from karbor import db
+from karbor.services.protection.bank_plugin import Bank
+from karbor.services.protection.checkpoint import CheckpointCollection
+from karbor.services.protection.checkpoint import update_checkpoint_record
 from karbor.tests import base
+from karbor.tests.unit.protection import fakes
+from karbor.tests.unit.protection.test_bank import _InMemoryBankPlugin
+from karbor.tests.unit.protection.test_bank import _InMemoryLeasePlugin
 from karbor import version
 
 CONF = cfg.CONF
@@ -84,3 +92,41 @@ class TestKarborManageCmd(base.TestCase):
         db_cmds = karbor_manage.DbCommands()
         exit = self.assertRaises(SystemExit, db_cmds.sync, 101)
         self.assertEqual(1, exit.code)
+
+    @mock.patch('karbor.services.protection.provider.ProviderRegistry')
+    def test_checkpoint_commands_reconcile(self, mock_registry):
+        ctxt = context.get_admin_context()
+        collection = CheckpointCollection(Bank(_InMemoryBankPlugin()),
+                                          _InMemoryLeasePlugin())
+        plan = fakes.fake_protection_plan()
+        plan['project_id'] = 'fake_project_id'
+        checkpoints = [collection.create(plan) for i in range(3)]
+        fake_provider = mock.MagicMock(id=plan['provider_id'])
+        fake_provider.get_checkpoint_collection.return_value = collection
+        mock_registry.return_value.providers = {
+            fake_provider.id: fake_provider}
+
+        # A stale record and a checkpoint missing its record
+        stale = dict(checkpoints[0].to_summary_dict(), id='stale')
+        update_checkpoint_record(ctxt, stale)
+        db.checkpoint_record_destroy(ctxt, checkpoints[1].id)
+        # A checkpoint created before the resource index existed
+        checkpoints[2].resource_graph = fakes.resource_graph
+        checkpoints[2].commit()
+        collection._indices_section.delete_objects(
+            collection._indices_section.list_objects(prefix='/by-resource/'))
+
+        checkpoint_cmds = karbor_manage.CheckpointCommands()
+        checkpoint_cmds.reconcile(concurrency=2)
+        records = db.checkpoint_record_get_all_by_filters_sort(
+            ctxt, {'provider_id': plan['provider_id']})
+        self.assertEqual({checkpoint.id for checkpoint in checkpoints},
+                         {record['id'] for record in records})
+        self.assertEqual([checkpoints[2].id],
+                         collection.list_ids_by_resource('fake', 'A'))
+
+    def test_checkpoint_commands_reconcile_invalid_concurrency(self):
+        checkpoint_cmds = karbor_manage.CheckpointCommands()
+        exit = self.assertRaises(SystemExit, checkpoint_cmds.reconcile,
+                                 None, 0)
+        self.assertEqual(1, exit.code)